@@ -1,68 +1,143 @@
-import streamlit as st
-import tempfile
-from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, TextLoader
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA
+import asyncio
+import os
+import threading
 from dotenv import load_dotenv
+from clients import get_embeddings, get_llm
+from answer_cache import get_answer_cache
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", "20"))
+RAG_RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+
+_document_index = None
+_document_index_lock = threading.Lock()
+
+def get_document_index():
+    global _document_index
+    with _document_index_lock:
+        if _document_index is None:
+            # The vector store is only imported once the user opens File Data Analysis
+            from doc_index import DocumentIndex
+
+            _document_index = DocumentIndex(get_embeddings())
+        return _document_index
+
+_reranker = None
+
+def get_reranker():
+    global _reranker
+    if RAG_RERANK_MODEL and _reranker is None:
+        from hybrid_search import CrossEncoderReranker
+
+        _reranker = CrossEncoderReranker(RAG_RERANK_MODEL)
+    return _reranker
+
+def build_qa_chain(index, doc_ids):
+    '''
+    Same prompt and document formatting as RetrievalQA's "stuff" chain, written as a runnable
+    so the answer can be streamed. Takes the question, returns the answer text.
+    '''
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.chains.question_answering.stuff_prompt import CHAT_PROMPT
+    from langchain_core.runnables import RunnablePassthrough
+
+    retriever = index.as_retriever(doc_ids, k=RAG_TOP_K, fetch_k=RAG_FETCH_K, reranker=get_reranker())
+    return (
+        {"context": retriever, "question": RunnablePassthrough()}
+        | create_stuff_documents_chain(get_llm(temperature=0), CHAT_PROMPT)
+    )
+
+async def aanswer_questions(doc_ids, questions, max_concurrency=8):
+    '''Answers several questions against the same documents concurrently, reusing cached answers. Returns answers in order.'''
+    # SQLite lookups, opening the index and building its BM25 index all block, so they run in a thread;
+    # the chain's retriever already runs in the default executor
+    def lookup():
+        index = get_document_index()
+        scope = index.scope(doc_ids)
+        answer_cache = get_answer_cache()
+        return index, scope, [answer_cache.get("rag", scope, question) for question in questions]
+
+    def store(answered):
+        answer_cache = get_answer_cache()
+        for question, response in answered:
+            answer_cache.put("rag", scope, question, response)
+
+    index, scope, answers = await asyncio.to_thread(lookup)
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if missing:
+        qa_chain = await asyncio.to_thread(build_qa_chain, index, doc_ids)
+        responses = await qa_chain.abatch([questions[i] for i in missing], config={"max_concurrency": max_concurrency})
+        for i, response in zip(missing, responses):
+            answers[i] = response
+        await asyncio.to_thread(store, [(questions[i], answers[i]) for i in missing])
+    return answers
+
+# UI + FUNCTIONALITY
+
+import streamlit as st
+from session_resources import current_session_id, get_session_resources
 
 def RAG(col2):
     with col2:
         st.title("File Data Analysis")        
         
-        if 'qa_chain' not in st.session_state:
-            st.session_state.qa_chain = None
+        if 'rag_doc_ids' not in st.session_state:
+            st.session_state.rag_doc_ids = []
+
+        index = get_document_index()
+        # The QA chain is rebuilt if the session's memory was reclaimed. Its BM25 index lives in the
+        # document index's shared cache (RAG_LEXICAL_CACHE_MB), so the chain itself is small
+        resources = get_session_resources()
+        session_id = current_session_id()
 
-        file = st.file_uploader(label="Load A File To Analyze", type=["pdf", "docx", "txt"])
+        files = st.file_uploader(label="Load Files To Analyze", type=["pdf", "docx", "txt"], accept_multiple_files=True)
         execute = st.button("Load")
 
-        if execute and file is not None:
-            mime_type = file.type
+        if execute and files:
             with st.spinner('Processing your request...'):
-                with tempfile.NamedTemporaryFile(delete=False) as temporary_file:
-                    temporary_file.write(file.read())
-                if mime_type == "application/pdf":
-                    pdf_loader = PyPDFLoader(temporary_file.name)
-                    pages = pdf_loader.load()
-                elif mime_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-                    docx_loader = Docx2txtLoader(temporary_file.name)
-                    pages = docx_loader.load()
-                elif mime_type == "text/plain":
-                    txt_loader = TextLoader(temporary_file.name, encoding="utf-8")
-                    pages = txt_loader.load()
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=100
-                )
-                chunks = text_splitter.split_documents(pages)
-
-                embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-
-                vectorstore = Chroma.from_documents(
-                    chunks,
-                    embeddings,
-                    persist_directory="chroma_db"
-                )
-                st.session_state.qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm,
-                    retriever=vectorstore.as_retriever()
-                )
-                st.success("Document Loaded Successfully!")
+                from ingest import ingest_files
+
+                loaded, failed = ingest_files(index, files)
+                for doc_id in loaded.values():
+                    if doc_id not in st.session_state.rag_doc_ids:
+                        st.session_state.rag_doc_ids = st.session_state.rag_doc_ids + [doc_id]
+                resources.discard(session_id, "qa_chain")
+                for name, error in failed.items():
+                    st.error(f"Failed to load {name}: {error}")
+                if loaded:
+                    st.success("Document Loaded Successfully!" if len(loaded) == 1 else f"{len(loaded)} Documents Loaded Successfully!")
+
+        documents = index.documents()
+        selected = st.multiselect(
+            "Documents to search",
+            documents,
+            default=[doc_id for doc_id in st.session_state.rag_doc_ids if doc_id in documents],
+        )
+        if selected != st.session_state.rag_doc_ids:
+            st.session_state.rag_doc_ids = selected
+            resources.discard(session_id, "qa_chain")
+        if selected and not resources.has(session_id, "qa_chain"):
+            resources.put(
+                session_id, "qa_chain", build_qa_chain(index, selected), rebuild=lambda: build_qa_chain(index, selected)
+            )
         
-        if st.session_state.qa_chain is not None:
+        if resources.has(session_id, "qa_chain"):
             query = st.text_area("What do you want to know? ")
             ask = st.button("Submit Question")
             if ask and query:
-                with st.spinner('Getting answer...'):
-                    response = st.session_state.qa_chain.invoke(query)["result"]
+                answer_cache = get_answer_cache()
+                scope = index.scope(st.session_state.rag_doc_ids)
+                response = answer_cache.get("rag", scope, query)
+                if response is None:
+                    response = st.write_stream(resources.get(session_id, "qa_chain").stream(query))
+                    answer_cache.put("rag", scope, query, response)
+                else:
+                    st.caption("Answered from cache")
                     st.write(response)  
 
-                    if st.button("Clear Results"):
-                        st.session_state.qa_chain = None
-                        st.rerun()
\ No newline at end of file
+                if st.button("Clear Results"):
+                    resources.discard(session_id, "qa_chain")
+                    st.session_state.rag_doc_ids = []
+                    st.rerun()
@@ -0,0 +1,119 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", ".cache/answers.sqlite3")
+CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+def normalize_query(query):
+    query = " ".join(query.lower().split())
+    return re.sub(r"[\s?!.]+$", "", query)
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class AnswerCache:
+    '''
+    Persistent answers keyed by namespace ("rag", "research"), scope (e.g. the fingerprints of the
+    documents searched) and the normalized query. Entries expire after a TTL and the least recently
+    used ones are evicted beyond max_entries. When embeddings are given, a miss falls back to the
+    most similar cached query in the same scope if it is above similarity_threshold.
+    '''
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 embeddings=None, similarity_threshold=SIMILARITY_THRESHOLD):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, scope TEXT NOT NULL, query TEXT NOT NULL, "
+            "answer TEXT NOT NULL, embedding BLOB, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers(namespace, scope)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+        self._db.commit()
+
+    def _key(self, namespace, scope, query):
+        return hashlib.sha256(f"{namespace}\0{scope}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, namespace, scope, query, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        key = self._key(namespace, scope, query)
+        with self._lock:
+            row = self._db.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= ttl:
+                self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                return row[0]
+
+        if self.embeddings is None:
+            return None
+
+        vector = self.embeddings.embed_query(normalize_query(query))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, answer, embedding FROM answers "
+                "WHERE namespace = ? AND scope = ? AND created >= ? AND embedding IS NOT NULL",
+                (namespace, scope, now - ttl),
+            ).fetchall()
+            best_key, best_answer, best_score = None, None, self.similarity_threshold
+            for row_key, answer, blob in rows:
+                score = _cosine(vector, array("f", blob))
+                if score >= best_score:
+                    best_key, best_answer, best_score = row_key, answer, score
+            if best_key is not None:
+                self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, best_key))
+                self._db.commit()
+        return best_answer
+
+    def put(self, namespace, scope, query, answer):
+        now = time.time()
+        blob = None
+        if self.embeddings is not None:
+            blob = array("f", self.embeddings.embed_query(normalize_query(query))).tobytes()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, namespace, scope, query, answer, embedding, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(namespace, scope, query), namespace, scope, query, answer, blob, now, now),
+            )
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            overflow = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+            self._db.commit()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            embeddings = None
+            if SEMANTIC:
+                from clients import get_embeddings
+                embeddings = get_embeddings()
+            _default_cache = AnswerCache(embeddings=embeddings)
+        return _default_cache
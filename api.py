@@ -0,0 +1,232 @@
+'''
+HTTP API for the same scraping, document Q&A, research and essay functions the Streamlit pages use.
+Every endpoint takes a batch and runs its items concurrently in this one process.
+
+    python api.py                # or: uvicorn api:app --workers 1
+'''
+
+import asyncio
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+load_dotenv()
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "100"))
+
+app = FastAPI(title="AI Helper API")
+
+# Shared by all requests, so a few large batches cannot start hundreds of scrapes or LLM pipelines at once
+_semaphore = None
+
+def get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    return _semaphore
+
+async def run_limited(fn, *args):
+    async with get_semaphore():
+        return await asyncio.to_thread(fn, *args)
+
+def batch_priority(items):
+    '''Single requests are treated as interactive, larger batches queue behind them for the OpenAI rate limits.'''
+    from scheduler import BULK, INTERACTIVE, priority
+
+    return priority(BULK if len(items) > 1 else INTERACTIVE)
+
+def check_batch(items, name):
+    if not items:
+        raise HTTPException(status_code=422, detail=f"{name} must not be empty")
+    if len(items) > API_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {API_MAX_BATCH} {name} per request")
+
+# SCRAPING
+
+class ScrapeRequest(BaseModel):
+    urls: List[str]
+    parse_description: Optional[str] = None
+    mode: str = Field("auto", pattern="^(auto|http|browser)$")
+
+class ScrapeResult(BaseModel):
+    url: str
+    content: Optional[str] = None
+    parsed: Optional[str] = None
+    error: Optional[str] = None
+
+async def scrape_one(url, parse_description, mode):
+    from web_scraper import aparse_with_ai, clean_html, scrape_website, split_dom_content
+
+    # Parsing and tokenizing a page takes long enough to stall every other request, so it runs in a thread too
+    def fetch_and_clean():
+        return clean_html(scrape_website(url, mode))
+
+    try:
+        content = await run_limited(fetch_and_clean)
+        parsed = None
+        if parse_description:
+            chunks = await asyncio.to_thread(split_dom_content, content)
+            async with get_semaphore():
+                parsed = await aparse_with_ai(chunks, parse_description)
+        return ScrapeResult(url=url, content=content, parsed=parsed)
+    except Exception as e:
+        print(f"Scraping {url} failed: {e}")
+        return ScrapeResult(url=url, error=f"{type(e).__name__}: {e}")
+
+@app.post("/scrape", response_model=List[ScrapeResult])
+async def scrape(request: ScrapeRequest):
+    '''Fetches and cleans every URL; with parse_description, also extracts the described data from each page.'''
+    check_batch(request.urls, "urls")
+    with batch_priority(request.urls):
+        return await asyncio.gather(*(scrape_one(url, request.parse_description, request.mode) for url in request.urls))
+
+# DOCUMENTS
+
+class UploadAdapter:
+    '''Gives a FastAPI upload the name/type/read/seek interface of a Streamlit upload, which is what ingest expects.'''
+
+    def __init__(self, upload):
+        self.name = upload.filename
+        self.type = upload.content_type
+        self._file = upload.file
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset):
+        return self._file.seek(offset)
+
+class IngestResult(BaseModel):
+    loaded: dict
+    failed: dict
+
+class RagQueryRequest(BaseModel):
+    doc_ids: List[str]
+    questions: List[str]
+
+class RagQueryResult(BaseModel):
+    question: str
+    answer: str
+
+@app.get("/documents", response_model=List[str])
+async def documents():
+    from RAG import get_document_index
+
+    # The first call opens the vector store from disk
+    index = await asyncio.to_thread(get_document_index)
+    return index.documents()
+
+@app.post("/documents", response_model=IngestResult)
+async def upload_documents(files: List[UploadFile] = File(...), owner: Optional[str] = Form(None)):
+    '''
+    Indexes the uploaded PDF, DOCX and TXT files; returns {file name: doc_id} and {file name: error}.
+    Uploading a file with the same name (and owner) again replaces the previous version.
+    '''
+    from RAG import get_document_index
+    from ingest import ingest_files
+
+    check_batch(files, "files")
+    index = await asyncio.to_thread(get_document_index)
+    loaded, failed = await asyncio.to_thread(
+        ingest_files, index, [UploadAdapter(upload) for upload in files], owner=owner
+    )
+    return IngestResult(loaded=loaded, failed=failed)
+
+@app.post("/rag/query", response_model=List[RagQueryResult])
+async def rag_query(request: RagQueryRequest):
+    '''Answers every question against the given indexed documents.'''
+    from RAG import aanswer_questions, get_document_index
+
+    check_batch(request.doc_ids, "doc_ids")
+    check_batch(request.questions, "questions")
+    index = await asyncio.to_thread(get_document_index)
+    unknown = set(request.doc_ids) - set(index.documents())
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown documents: {', '.join(sorted(unknown))}")
+
+    with batch_priority(request.questions):
+        answers = await aanswer_questions(request.doc_ids, request.questions, max_concurrency=API_MAX_CONCURRENCY)
+    return [RagQueryResult(question=question, answer=answer) for question, answer in zip(request.questions, answers)]
+
+# RESEARCH
+
+class ResearchRequest(BaseModel):
+    topics: List[str]
+    mode: str = Field("pipeline", pattern="^(pipeline|supervisor)$")
+
+class ResearchResult(BaseModel):
+    topic: str
+    report: Optional[str] = None
+    error: Optional[str] = None
+
+async def research_one(topic, mode):
+    from research import cached_research
+
+    try:
+        return ResearchResult(topic=topic, report=await run_limited(cached_research, topic, mode))
+    except Exception as e:
+        print(f"Research on {topic} failed: {e}")
+        return ResearchResult(topic=topic, error=f"{type(e).__name__}: {e}")
+
+@app.post("/research", response_model=List[ResearchResult])
+async def research(request: ResearchRequest):
+    check_batch(request.topics, "topics")
+    with batch_priority(request.topics):
+        return await asyncio.gather(*(research_one(topic, request.mode) for topic in request.topics))
+
+# ESSAYS
+
+class EssayRequest(BaseModel):
+    topics: List[str]
+
+class EssayResult(BaseModel):
+    topic: str
+    essay: Optional[str] = None
+    error: Optional[str] = None
+
+@app.post("/essays", response_model=List[EssayResult])
+async def essays(request: EssayRequest):
+    from essays import get_essay_pipeline
+
+    check_batch(request.topics, "topics")
+    _, _, essay_pipeline = get_essay_pipeline()
+    with batch_priority(request.topics):
+        results = await essay_pipeline.abatch(
+            [{"topic": topic} for topic in request.topics],
+            config={"max_concurrency": API_MAX_CONCURRENCY},
+            return_exceptions=True
+        )
+    essays = []
+    for topic, result in zip(request.topics, results):
+        if isinstance(result, Exception):
+            print(f"Essay on {topic} failed: {result}")
+            essays.append(EssayResult(topic=topic, error=f"{type(result).__name__}: {result}"))
+        else:
+            essays.append(EssayResult(topic=topic, essay=result))
+    return essays
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    '''
+    Time, token and cost totals of every traced operation in this API process, in the Prometheus text format.
+    The Streamlit app exports its own, with the session memory, on UI_METRICS_PORT (see metrics_server.py).
+    '''
+    from metrics_server import render_metrics
+
+    return render_metrics(sessions=False)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
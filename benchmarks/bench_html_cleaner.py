@@ -0,0 +1,74 @@
+"""
+Compares the single-pass clean_html against extract_body_content + clean_body_content.
+
+    python benchmarks/bench_html_cleaner.py                # synthetic 1 MB / 5 MB pages
+    python benchmarks/bench_html_cleaner.py page1.html ... # your own fixture pages
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web_scraper import clean_body_content, clean_html, extract_body_content
+
+
+def make_fixture_page(size_bytes, seed=0):
+    rng = random.Random(seed)
+    words = ["price", "product", "shipping", "review", "stock", "&amp;", "color", "size", "brand", "offer"]
+    parts = [
+        "<!DOCTYPE html><html><head><title>Fixture</title>",
+        "<style>body { font-family: sans-serif; }</style><script>var tracking = {};</script></head><body>",
+        "<nav><ul><li><a href='/'>Home</a></li><li><a href='/shop'>Shop</a></li></ul></nav>",
+    ]
+    size = sum(map(len, parts))
+    item = 0
+    while size < size_bytes:
+        item += 1
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 30)))
+        block = (
+            f"<div class='card' id='item-{item}'>\n  <h2>Item {item}</h2>\n"
+            f"  <p>{text}</p>\n  <span class='price'>${rng.randint(1, 999)}.99</span>\n"
+            f"  <script>window.dataLayer.push({{id: {item}}});</script>\n"
+            f"  <!-- card {item} -->\n</div>\n"
+        )
+        parts.append(block)
+        size += len(block)
+    parts.append("<footer><p>&copy; Fixture Inc.</p></footer></body></html>")
+    return "".join(parts)
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def two_pass(html):
+    return clean_body_content(extract_body_content(html))
+
+
+def main(paths, repeat=3):
+    if paths:
+        fixtures = [(os.path.basename(p), open(p, encoding="utf-8", errors="replace").read()) for p in paths]
+    else:
+        fixtures = [(f"synthetic-{mb}MB", make_fixture_page(mb * 1024 * 1024, seed=mb)) for mb in (1, 5)]
+
+    print(f"{'page':<20}{'size':>10}{'two-pass (s)':>15}{'single-pass (s)':>17}{'speedup':>10}  same output")
+    for name, html in fixtures:
+        old_time, old_text = best_of(two_pass, html, repeat)
+        new_time, new_text = best_of(clean_html, html, repeat)
+        print(
+            f"{name:<20}{len(html) / 1024 / 1024:>8.1f}MB{old_time:>15.3f}{new_time:>17.3f}"
+            f"{old_time / new_time:>9.1f}x  {old_text == new_text}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+"""
+Measures import time of every app module in a fresh interpreter (cold start, best of N runs).
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["web_scraper", "RAG", "essays", "research"]
+
+SNIPPET = """
+import time, sys
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in ("selenium", "bs4", "chromadb", "langchain_community.vectorstores", "tavily", "langgraph.prebuilt") if name in sys.modules]
+print(f"{{elapsed * 1000:.0f}} {{','.join(heavy) or '-'}}")
+"""
+
+
+def measure(module, runs):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env.setdefault("TAVILY_API_KEY", "tvly-benchmark")
+    best, heavy = float("inf"), ""
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", SNIPPET.format(module=module)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        best = min(best, float(output[0]))
+        heavy = output[1]
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'module':<14}{'import (ms)':>12}  heavy modules loaded")
+    for module in MODULES:
+        best, heavy = measure(module, args.runs)
+        print(f"{module:<14}{best:>12.0f}  {heavy}")
+
+
+if __name__ == "__main__":
+    main()
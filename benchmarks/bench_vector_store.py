@@ -0,0 +1,136 @@
+"""
+Recall and latency of the memory-mapped vector store (float32, int8, with and without IVF) against Chroma,
+on clustered synthetic embeddings with exact nearest neighbours as ground truth.
+
+    python benchmarks/bench_vector_store.py                          # 5000 vectors of 384 dimensions
+    python benchmarks/bench_vector_store.py --vectors 50000 --dim 1536
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mmap_store import MmapVectorStore
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns the precomputed vector for each text ("v12" is vector 12)."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(text[1:])].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text[1:])].tolist()
+
+
+def make_vectors(count, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + rng.normal(scale=0.6, size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=count)] + rng.normal(scale=0.02, size=(count, vectors.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build(backend, options, embeddings, count, directory):
+    texts = [f"v{i}" for i in range(count)]
+    metadatas = [{"i": i} for i in range(count)]
+    if backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+
+        store = Chroma(collection_name="bench", embedding_function=embeddings, persist_directory=directory)
+        # Chroma rejects batches above its max_batch_size (about 5000)
+        for start in range(0, count, 5000):
+            store.add_texts(texts[start:start + 5000], metadatas[start:start + 5000], ids=texts[start:start + 5000])
+        return store
+    store = MmapVectorStore(embeddings, persist_directory=directory, collection_name="bench", **options)
+    store.add_texts(texts, metadatas, ids=texts)
+    return store
+
+
+def reopen(backend, options, embeddings, directory):
+    if backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+
+        return Chroma(collection_name="bench", embedding_function=embeddings, persist_directory=directory)
+    return MmapVectorStore(embeddings, persist_directory=directory, collection_name="bench", **options)
+
+
+def search(store, query, k):
+    return [document.metadata["i"] for document in store.similarity_search_by_vector(query.tolist(), k=k)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ivf-lists", type=int, default=32)
+    parser.add_argument("--ivf-probes", type=int, default=4)
+    parser.add_argument("--skip-chroma", action="store_true")
+    settings = parser.parse_args()
+
+    vectors = make_vectors(settings.vectors, settings.dim, settings.clusters)
+    queries = make_queries(vectors, settings.queries)
+    truth = [set(np.argsort(-(vectors.astype(np.float64) @ query))[:settings.k].tolist()) for query in queries]
+    embeddings = LookupEmbeddings(vectors)
+
+    ivf = {"ivf_lists": settings.ivf_lists, "ivf_probes": settings.ivf_probes}
+    backends = [
+        ("mmap float32", "mmap", {"quantization": "float32", "ivf_lists": 0}),
+        ("mmap int8", "mmap", {"quantization": "int8", "ivf_lists": 0}),
+        ("mmap float32 IVF", "mmap", {"quantization": "float32", **ivf}),
+        ("mmap int8 IVF", "mmap", {"quantization": "int8", **ivf}),
+    ]
+    if not settings.skip_chroma:
+        backends.insert(0, ("chroma", "chroma", {}))
+
+    print(f"{settings.vectors} vectors x {settings.dim} dims, {settings.queries} queries, recall@{settings.k}")
+    print(f"{'backend':<18}{'build (s)':>10}{'open (ms)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}{'recall':>8}{'disk (MB)':>11}")
+    for name, backend, options in backends:
+        with tempfile.TemporaryDirectory(prefix="bench-vectors-") as directory:
+            start = time.perf_counter()
+            build(backend, options, embeddings, settings.vectors, directory)
+            build_seconds = time.perf_counter() - start
+
+            # Opening from disk plus the first query (which trains the IVF lists) is what a new session pays
+            start = time.perf_counter()
+            store = reopen(backend, options, embeddings, directory)
+            search(store, queries[0], settings.k)
+            open_ms = (time.perf_counter() - start) * 1000
+
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = search(store, query, settings.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected.intersection(found)) / settings.k)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(
+                f"{name:<18}{build_seconds:>10.2f}{open_ms:>11.1f}{p50:>10.2f}{p95:>10.2f}"
+                f"{np.mean(recalls):>8.3f}{directory_size(directory) / 1024 / 1024:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Offline end-to-end benchmarks of the four features, using the local stand-ins in fakes.py instead of
+OpenAI, Tavily and real websites. No API keys are needed and nothing leaves the machine.
+
+For each workload it reports wall time, LLM calls, tokens and peak Python memory (tracemalloc), and
+compares them with benchmarks/baseline.json; the exit code is 1 if any metric is past its threshold.
+
+    python benchmarks/bench_workloads.py                      # all workloads, compare with the baseline
+    python benchmarks/bench_workloads.py scraper rag          # some workloads
+    python benchmarks/bench_workloads.py --update-baseline    # store the current numbers as the baseline
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep every on-disk cache of this run out of the real .cache directory (read at import time)
+WORK_DIR = tempfile.mkdtemp(prefix="ai-helper-bench-")
+for variable, name in [
+    ("ANSWER_CACHE_PATH", "answers.sqlite3"),
+    ("EMBEDDING_CACHE_PATH", "embeddings.sqlite3"),
+    ("SEARCH_CACHE_PATH", "search.sqlite3"),
+    ("JOBS_PATH", "jobs.sqlite3"),
+]:
+    os.environ[variable] = os.path.join(WORK_DIR, name)
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "tvly-benchmark")
+os.environ["TRACE_JSONL_PATH"] = ""
+
+import clients
+from bench_html_cleaner import make_fixture_page
+from fakes import FakeChatModel, FakeEmbeddings, FixtureServer, StubTavilyClient
+from tokens import get_encoding
+from tracing import trace
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# A metric regresses when it exceeds baseline * (1 + tolerance) + slack; the slack keeps tiny values from flapping
+DEFAULT_TOLERANCE = {"wall_seconds": 0.3, "peak_mb": 0.3, "llm_calls": 0.0, "tokens": 0.1}
+DEFAULT_SLACK = {"wall_seconds": 0.5, "peak_mb": 2.0, "llm_calls": 0, "tokens": 0}
+
+
+class Measurement:
+    def __init__(self):
+        self.metrics = {}
+
+    @contextmanager
+    def __call__(self):
+        '''Measures the block; workloads enter it after their setup (fixtures, servers) is done.'''
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        with trace("benchmark") as run:
+            yield
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        llm = run.totals().get("llm", {})
+        self.metrics = {
+            "wall_seconds": round(wall, 3),
+            "llm_calls": llm.get("count", 0),
+            "tokens": llm.get("prompt_tokens", 0) + llm.get("completion_tokens", 0),
+            "peak_mb": round(peak / 1024 / 1024, 1),
+        }
+
+# WORKLOADS
+
+def scraper_workload(measure, settings):
+    from web_scraper import clean_html, parse_with_ai, scrape_website, split_dom_content
+
+    pages = {f"/page/{i}.html": make_fixture_page(settings.page_kb * 1024, seed=i) for i in range(settings.pages)}
+    with FixtureServer(pages) as server, measure():
+        for path in pages:
+            html = scrape_website(server.url(path), mode="http")
+            parse_with_ai(split_dom_content(clean_html(html)), "product names and prices")
+
+
+class FixtureUpload(io.BytesIO):
+    '''A file as the Streamlit uploader hands it over.'''
+
+    def __init__(self, name, data, mime_type="text/plain"):
+        super().__init__(data)
+        self.name = name
+        self.type = mime_type
+
+
+def make_document(size_bytes, seed):
+    from fakes import WORDS, _seeded
+
+    rng = _seeded(f"document {seed}")
+    paragraphs = []
+    size = 0
+    while size < size_bytes:
+        paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + f" PN-{rng.randint(1000, 9999)}."
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+
+def rag_workload(measure, settings):
+    from doc_index import DocumentIndex
+    from embedding_cache import CachedEmbeddings, EmbeddingCache
+    from ingest import ingest_files
+    from RAG import build_qa_chain
+
+    embeddings = CachedEmbeddings(
+        FakeEmbeddings(latency=settings.embedding_latency), "fake-embedding",
+        cache=EmbeddingCache(os.path.join(WORK_DIR, "rag-embeddings.sqlite3")),
+    )
+    index = DocumentIndex(embeddings, persist_directory=os.path.join(WORK_DIR, "chroma"))
+    uploads = [FixtureUpload(f"doc{i}.txt", make_document(settings.document_kb * 1024, i)) for i in range(settings.documents)]
+    questions = [f"What is said about {topic}?" for topic in ("storage", "policy", "costs", "PN-4471", "grid operators")]
+    with measure():
+        loaded, failed = ingest_files(index, uploads)
+        if failed:
+            raise RuntimeError(f"Ingestion failed: {failed}")
+        build_qa_chain(index, list(loaded.values())).batch(questions)
+
+
+def research_workload(measure, settings):
+    from research import research
+
+    with measure():
+        for topic in settings.topics[:settings.research_topics]:
+            research(topic, mode="pipeline")
+
+
+def essays_workload(measure, settings):
+    from essays import generate_essays
+
+    with measure():
+        generate_essays(settings.topics)
+
+
+WORKLOADS = {
+    "scraper": scraper_workload,
+    "rag": rag_workload,
+    "research": research_workload,
+    "essays": essays_workload,
+}
+
+# BASELINE
+
+def compare(results, baseline):
+    '''Returns the list of regressions: (workload, metric, value, limit).'''
+    tolerance = {**DEFAULT_TOLERANCE, **baseline.get("tolerance", {})}
+    slack = {**DEFAULT_SLACK, **baseline.get("slack", {})}
+    regressions = []
+    for name, metrics in results.items():
+        expected = baseline.get("workloads", {}).get(name)
+        if expected is None:
+            continue
+        for metric, value in metrics.items():
+            if metric not in expected:
+                continue
+            limit = expected[metric] * (1 + tolerance.get(metric, 0.0)) + slack.get(metric, 0)
+            if value > limit:
+                regressions.append((name, metric, value, limit))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workloads", nargs="*", help=f"any of {', '.join(WORKLOADS)} (default: all)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="seconds per fake embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="seconds per fake Tavily search")
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--page-kb", type=int, default=1024)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--document-kb", type=int, default=256)
+    parser.add_argument("--research-topics", type=int, default=2)
+    settings = parser.parse_args()
+    unknown = set(settings.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+    settings.topics = ["Grid-scale battery storage", "Offshore wind costs", "Heat pump adoption", "Green hydrogen"]
+
+    clients.set_override("llm", FakeChatModel(latency=settings.llm_latency, callbacks=[clients.get_tracing_handler()]))
+    from search_cache import CachedSearchClient
+    clients.set_override("search", CachedSearchClient(StubTavilyClient(latency=settings.search_latency), path=None))
+
+    results = {}
+    for name in settings.workloads or list(WORKLOADS):
+        measure = Measurement()
+        WORKLOADS[name](measure, settings)
+        results[name] = measure.metrics
+
+    print(f"\n{'workload':<10}{'wall (s)':>10}{'LLM calls':>11}{'tokens':>10}{'peak (MB)':>11}")
+    for name, metrics in results.items():
+        print(f"{name:<10}{metrics['wall_seconds']:>10.2f}{metrics['llm_calls']:>11}{metrics['tokens']:>10}{metrics['peak_mb']:>11.1f}")
+
+    run_settings = {
+        key: value for key, value in vars(settings).items()
+        if key not in ("workloads", "baseline", "update_baseline", "topics")
+    }
+    # Token counts (and chunk sizes) depend on whether the real tokenizer could be loaded
+    run_settings["tokenizer"] = get_encoding().name
+    if settings.update_baseline:
+        baseline = {"settings": run_settings, "tolerance": DEFAULT_TOLERANCE, "slack": DEFAULT_SLACK, "workloads": results}
+        if os.path.exists(settings.baseline):
+            with open(settings.baseline, encoding="utf-8") as file:
+                previous = json.load(file)
+            baseline["tolerance"] = previous.get("tolerance", DEFAULT_TOLERANCE)
+            baseline["slack"] = previous.get("slack", DEFAULT_SLACK)
+            baseline["workloads"] = {**previous.get("workloads", {}), **results}
+        with open(settings.baseline, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2)
+            file.write("\n")
+        print(f"\nBaseline written to {settings.baseline}")
+        return 0
+
+    if not os.path.exists(settings.baseline):
+        print("\nNo baseline yet; run with --update-baseline to create one.")
+        return 0
+    with open(settings.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("settings") != run_settings:
+        print("\nWarning: these settings differ from the ones the baseline was recorded with.")
+    regressions = compare(results, baseline)
+    for name, metric, value, limit in regressions:
+        print(f"REGRESSION {name}.{metric}: {value} > {limit:.3f}")
+    if not regressions:
+        print("\nAll workloads within the baseline thresholds.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
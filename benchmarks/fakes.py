@@ -0,0 +1,200 @@
+"""
+Deterministic local stand-ins for the paid services, for offline benchmarks:
+a chat model with configurable latency that calls tools like a real agent would, hash-based
+embeddings, a Tavily client stub and an HTTP server that serves large fixture pages.
+"""
+
+import hashlib
+import http.server
+import json
+import math
+import random
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from tokens import count_tokens
+
+WORDS = (
+    "the market research shows growth in renewable energy adoption across regions while costs fall and "
+    "policy support varies analysts expect storage capacity to double as grid operators invest in flexibility"
+).split()
+
+
+def _seeded(text):
+    return random.Random(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _message_text(message):
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers every prompt with `response_words` words chosen deterministically from the prompt, after
+    sleeping `latency` seconds. When tools are bound and no tool has answered yet, it first calls one
+    (preferring `preferred_tool`), so ReAct agents go through their tool round trip.
+    Reports token usage so tracing can count tokens.
+    """
+
+    latency: float = 0.05
+    response_words: int = 120
+    preferred_tool: str = "search"
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _tool_call(self, messages, tools):
+        if not tools or any(isinstance(message, ToolMessage) for message in messages):
+            return None
+        functions = [tool["function"] for tool in tools]
+        function = next((f for f in functions if f["name"] == self.preferred_tool), functions[-1])
+        question = next((_message_text(m) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        args = {}
+        properties = function.get("parameters", {}).get("properties", {})
+        for name in function.get("parameters", {}).get("required", []):
+            args[name] = 3 if properties.get(name, {}).get("type") == "integer" else question[:200]
+        call_id = hashlib.sha256(f"{function['name']}{question}".encode("utf-8")).hexdigest()[:12]
+        return {"name": function["name"], "args": args, "id": f"call_{call_id}"}
+
+    def _respond(self, messages, tools):
+        prompt = "\n".join(_message_text(message) for message in messages)
+        tool_call = self._tool_call(messages, tools)
+        if tool_call is not None:
+            content, tool_calls = "", [tool_call]
+        else:
+            rng = _seeded(prompt)
+            content, tool_calls = " ".join(rng.choice(WORDS) for _ in range(self.response_words)), []
+        usage = {
+            "input_tokens": count_tokens(prompt),
+            "output_tokens": count_tokens(content) + (10 if tool_calls else 0),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return content, tool_calls, usage
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        time.sleep(self.latency)
+        content, tool_calls, usage = self._respond(messages, tools)
+        message = AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        time.sleep(self.latency)
+        content, tool_calls, usage = self._respond(messages, tools)
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(tool_calls)
+                ],
+            ))
+        else:
+            for i, word in enumerate(content.split(" ")):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_model_name"] = self.model_name
+        return params
+
+
+class FakeEmbeddings(Embeddings):
+    """Unit vectors derived from a hash of the text; `latency` seconds per API call (batch or query)."""
+
+    def __init__(self, size=256, latency=0.01):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+
+    def _vector(self, text):
+        rng = _seeded(text)
+        vector = [rng.gauss(0, 1) for _ in range(self.size)]
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+class StubTavilyClient:
+    """
+    Returns `max_results` made-up but stable results per query after `latency` seconds. Like real
+    snippets, the results overlap: each is a few sentences drawn from a shared pool per query.
+    """
+
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.calls = 0
+
+    def search(self, query, max_results=5, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        rng = _seeded(query)
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(8)]
+        return {"query": query, "results": [
+            {
+                "title": f"Result {i + 1} for {query[:40]}",
+                "url": f"https://example.org/{hashlib.sha256(f'{query}{i}'.encode('utf-8')).hexdigest()[:10]}",
+                "content": " ".join(rng.sample(sentences, 5)),
+                "score": round(1 - i * 0.1, 2),
+            }
+            for i in range(max_results)
+        ]}
+
+
+class FixtureServer:
+    """Serves {path: html} from a background thread on 127.0.0.1; use as a context manager."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        pages_by_path = {path: html.encode("utf-8") for path, html in pages.items()}
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = pages_by_path.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
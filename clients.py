@@ -0,0 +1,118 @@
+'''
+Process-wide registry of API clients. Every client is created on first use and then shared by
+all modules and Streamlit sessions, so the heavy SDK imports and connection setup happen once.
+'''
+
+import threading
+
+DEFAULT_CHAT_MODEL = "gpt-4o-mini"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
+_clients = {}
+_overrides = {}
+_lock = threading.RLock()
+
+def set_override(kind, client):
+    '''
+    Makes get_<kind>() ("llm", "embeddings", "search") return client instead of the real API client,
+    e.g. a local stand-in for benchmarks. Passing None removes the override. Set it before the
+    first use: agents and pipelines keep the client they were built with.
+    '''
+    with _lock:
+        if client is None:
+            _overrides.pop(kind, None)
+        else:
+            _overrides[kind] = client
+
+def _get_or_create(key, factory):
+    with _lock:
+        if key[0] in _overrides:
+            return _overrides[key[0]]
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+HTTP_LIMITS = {"max_connections": 32, "max_keepalive_connections": 16}
+
+def get_http_client():
+    '''
+    One pooled, keep-alive HTTP client for all synchronous OpenAI calls. Its transport queues every
+    request in the shared rate-limit scheduler and retries 429s (see scheduler.py).
+    '''
+    def create():
+        import httpx
+        from scheduler import ScheduledTransport
+
+        return httpx.Client(
+            transport=ScheduledTransport(httpx.HTTPTransport(limits=httpx.Limits(**HTTP_LIMITS))),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+
+    return _get_or_create(("http",), create)
+
+def get_async_http_client():
+    '''
+    The async counterpart of get_http_client(), sharing the same scheduler. It works from any event loop:
+    each loop gets its own connection pool.
+    '''
+    def create():
+        import httpx
+        from scheduler import AsyncScheduledTransport, LoopLocalTransport
+
+        return httpx.AsyncClient(
+            transport=AsyncScheduledTransport(
+                LoopLocalTransport(lambda: httpx.AsyncHTTPTransport(limits=httpx.Limits(**HTTP_LIMITS)))
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+
+    return _get_or_create(("async_http",), create)
+
+def get_tracing_handler():
+    def create():
+        from llm_tracing import TracingCallbackHandler
+
+        return TracingCallbackHandler()
+
+    return _get_or_create(("tracing",), create)
+
+def get_llm(model=DEFAULT_CHAT_MODEL, temperature=None):
+    def create():
+        from langchain_openai import ChatOpenAI
+
+        # stream_usage makes streamed answers report their token counts too. Retries are left to
+        # the scheduler, which knows about every other caller hitting the same limits
+        return ChatOpenAI(
+            model=model, temperature=temperature, max_retries=0,
+            http_client=get_http_client(), http_async_client=get_async_http_client(),
+            stream_usage=True, callbacks=[get_tracing_handler()]
+        )
+
+    return _get_or_create(("llm", model, temperature), create)
+
+def get_embeddings(model=DEFAULT_EMBEDDING_MODEL):
+    '''OpenAI embeddings behind the on-disk embedding cache.'''
+    def create():
+        from langchain_openai import OpenAIEmbeddings
+        from embedding_cache import CachedEmbeddings
+
+        return CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=model, max_retries=0,
+                http_client=get_http_client(), http_async_client=get_async_http_client()
+            ),
+            model_name=model
+        )
+
+    return _get_or_create(("embeddings", model), create)
+
+def get_search_client():
+    '''Tavily search behind the shared search cache.'''
+    def create():
+        from tavily import TavilyClient
+        from search_cache import CachedSearchClient
+
+        return CachedSearchClient(TavilyClient())
+
+    return _get_or_create(("search",), create)
@@ -0,0 +1,173 @@
+'''
+Local compression of search results before they are handed from one research agent to the next.
+
+Overlapping Tavily snippets repeat the same sentences, so the text is split into passages, exact and
+near-duplicate passages are dropped (word shingles + MinHash with LSH banding), each source is trimmed
+to the passages most relevant to the query (BM25), and the rest is cut to a token budget. Every source
+that keeps a passage keeps its title and URL so citations still work; sources left without any are dropped.
+'''
+
+import os
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hybrid_search import TOKEN_PATTERN, BM25Index
+from tokens import count_tokens
+from tracing import span
+
+RESEARCH_CONTEXT_TOKENS = int(os.getenv("RESEARCH_CONTEXT_TOKENS", "1500"))
+MAX_PASSAGES_PER_SOURCE = int(os.getenv("MAX_PASSAGES_PER_SOURCE", "4"))
+# Passages whose estimated Jaccard similarity is at least this are treated as the same passage
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+SHINGLE_SIZE = 4
+MIN_PASSAGE_WORDS = 6
+# 16 bands of 4 rows: pairs above ~0.5 similarity almost always share a band
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# h -> (a * h + b) mod p with p = 2^31 - 1, so every product fits in 64 bits and numpy can do all permutations at once
+_PRIME = (1 << 31) - 1
+_random = np.random.default_rng(0)
+_A = _random.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+_B = _random.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+
+SOURCE_PATTERN = re.compile(r"Title: (.*?)\nURL: (.*?)\nContent: (.*?)(?:\n---|\Z)", re.DOTALL)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+URL_PATTERN = re.compile(r"https?://\S+")
+
+class Source:
+    def __init__(self, title, url, text):
+        self.title = title
+        self.url = url
+        self.passages = split_passages(text)
+
+def split_passages(text):
+    '''Sentences, with fragments shorter than MIN_PASSAGE_WORDS merged into the one before.'''
+    passages = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if passages and len(sentence.split()) < MIN_PASSAGE_WORDS:
+            passages[-1] = f"{passages[-1]} {sentence}"
+        else:
+            passages.append(sentence)
+    return passages
+
+def parse_sources(text):
+    '''The "Title / URL / Content / ---" blocks written by the search tool, or the whole text as one source.'''
+    sources = [Source(title.strip(), url.strip(), content) for title, url, content in SOURCE_PATTERN.findall(text)]
+    return sources or [Source(None, None, text)]
+
+# NEAR-DUPLICATES
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = TOKEN_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash(shingle_set):
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) & _PRIME for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return tuple(((_A * hashes + _B) % _PRIME).min(axis=1).tolist())
+
+class NearDuplicateFilter:
+    '''Remembers the passages seen so far and tells whether a new one (nearly) repeats any of them.'''
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=LSH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self._exact = set()
+        self._buckets = defaultdict(list)
+
+    def seen(self, passage):
+        normalized = " ".join(TOKEN_PATTERN.findall(passage.lower()))
+        if normalized in self._exact:
+            return True
+        signature = minhash(shingles(passage))
+        if signature is None:
+            return False
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+        candidates = {id(other): other for key in keys for other in self._buckets[key]}
+        for other in candidates.values():
+            similarity = sum(x == y for x, y in zip(signature, other)) / MINHASH_PERMUTATIONS
+            if similarity >= self.threshold:
+                return True
+        self._exact.add(normalized)
+        for key in keys:
+            self._buckets[key].append(signature)
+        return False
+
+# COMPRESSION
+
+def source_header(source):
+    return f"Title: {source.title}\nURL: {source.url}\nContent: \n---"
+
+def render(sources, kept):
+    if sources[0].url is None:
+        return " ".join(sources[0].passages[i] for i in sorted(kept[0]))
+    blocks = []
+    for index, source in enumerate(sources):
+        if not kept[index]:
+            continue
+        content = " ".join(source.passages[i] for i in sorted(kept[index]))
+        blocks.append(f"Title: {source.title}\nURL: {source.url}\nContent: {content}\n---")
+    return "\n".join(blocks)
+
+def compress_context(text, query="", budget=RESEARCH_CONTEXT_TOKENS):
+    '''
+    Returns `text` without repeated passages, each source cut to its MAX_PASSAGES_PER_SOURCE passages
+    most relevant to `query` and the whole cut to about `budget` tokens. Sources keep their title and
+    URL, and are left out once none of their passages is left.
+    Free text (no source blocks) is only deduplicated and cut to the budget, passages with a URL first.
+    '''
+    if not text or not text.strip():
+        return text
+    with span("compress_context") as current:
+        sources = parse_sources(text)
+        duplicates = NearDuplicateFilter()
+        # (source index, passage index) in source order; earlier sources are ranked higher by the search
+        candidates = [
+            (s, p) for s, source in enumerate(sources) for p, passage in enumerate(source.passages)
+            if not duplicates.seen(passage)
+        ]
+
+        scores = {}
+        if query and candidates:
+            documents = [Document(page_content=sources[s].passages[p], metadata={"key": (s, p)}) for s, p in candidates]
+            for document, score in BM25Index(documents).search(query, k=len(documents)):
+                scores[document.metadata["key"]] = score
+        for s, p in candidates:
+            if sources[s].url is None and URL_PATTERN.search(sources[s].passages[p]):
+                scores[(s, p)] = float("inf")
+
+        # Best passages first; ties keep the search engine's order
+        structured = sources[0].url is not None
+        ranked = sorted(candidates, key=lambda key: (-scores.get(key, 0.0), key))
+        if structured and any(score > 0 for score in scores.values()):
+            ranked = [key for key in ranked if scores.get(key, 0.0) > 0]
+
+        kept = {s: [] for s in range(len(sources))}
+        used = 0
+        for s, p in ranked:
+            if structured and len(kept[s]) >= MAX_PASSAGES_PER_SOURCE:
+                continue
+            cost = count_tokens(sources[s].passages[p]) + 1
+            # A source's title and URL are paid for with its first passage
+            if structured and not kept[s]:
+                cost += count_tokens(source_header(sources[s]))
+            if used + cost > budget:
+                continue
+            kept[s].append(p)
+            used += cost
+
+        compressed = render(sources, kept)
+        current.set(tokens_before=count_tokens(text), tokens_after=count_tokens(compressed), passages=len(candidates))
+    return compressed
@@ -0,0 +1,324 @@
+'''
+Batch and crawl mode for the web scraper: applies one parse description to many pages.
+
+Pages come from a list of URLs, a sitemap, or a seed URL crawled within its own host up to a
+given depth. Pages are fetched concurrently with a per-host concurrency limit and delay (and
+robots.txt is respected), duplicate pages are dropped by content hash, and every page goes
+through clean -> chunk -> parse. One JSON line per page is appended to the output file as soon
+as it finishes, and running again with the same output file skips pages that are already done.
+
+    python crawler.py --seed https://example.com --depth 2 --parse "product names and prices" --out products.jsonl
+'''
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+from scheduler import BULK, priority
+from web_scraper import HTTP_TIMEOUT, clean_html, get_http_session, parse_with_ai, scrape_website, split_dom_content
+
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "2"))
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "0.5"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+CRAWL_OUTPUT_DIR = os.getenv("CRAWL_OUTPUT_DIR", ".cache/crawls")
+USER_AGENT = "AIHelperBot"
+
+# Records with these statuses are final; pages that failed are tried again when a crawl is resumed
+DONE_STATUSES = {"ok", "duplicate", "disallowed"}
+
+def normalize_url(url):
+    url, _ = urldefrag(url.strip())
+    return url
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+def content_hash(text):
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+# URL SOURCES
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+def extract_links(html, base_url, same_host=True):
+    '''Absolute http(s) links of a page without fragments, in page order and without repeats.'''
+    parser = _LinkParser()
+    parser.feed(html)
+    parser.close()
+    base_host = host_of(base_url)
+    links = []
+    seen = set()
+    for href in parser.links:
+        url = normalize_url(urljoin(base_url, href))
+        if urlsplit(url).scheme not in ("http", "https") or url in seen:
+            continue
+        if same_host and host_of(url) != base_host:
+            continue
+        seen.add(url)
+        links.append(url)
+    return links
+
+def read_sitemap(url, max_depth=3):
+    '''Page URLs listed in a sitemap; sitemap indexes are followed up to max_depth levels.'''
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    root = ElementTree.fromstring(response.content)
+    locations = [element.text.strip() for element in root.iter() if element.tag.endswith("loc") and element.text]
+    if not root.tag.endswith("sitemapindex"):
+        return locations
+    if max_depth <= 0:
+        return []
+    urls = []
+    for location in locations:
+        urls.extend(read_sitemap(location, max_depth - 1))
+    return urls
+
+# POLITENESS
+
+class HostLimiter:
+    '''
+    Per-host politeness: at most per_host requests to a host at a time, requests to a host
+    started at least delay seconds apart (or the robots.txt Crawl-delay, if larger), and
+    robots.txt rules for USER_AGENT.
+    '''
+
+    def __init__(self, per_host=CRAWL_PER_HOST, delay=CRAWL_DELAY, respect_robots=True):
+        self.per_host = per_host
+        self.delay = delay
+        self.respect_robots = respect_robots
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+        self._robots = {}
+
+    def robots(self, url):
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        with self._lock:
+            if host in self._robots:
+                return self._robots[host]
+        robots = RobotFileParser()
+        try:
+            response = get_http_session().get(f"{parts.scheme}://{parts.netloc}/robots.txt", timeout=HTTP_TIMEOUT)
+            if response.status_code in (401, 403):
+                robots.disallow_all = True
+            elif response.status_code == 200:
+                robots.parse(response.text.splitlines())
+            else:
+                robots.allow_all = True
+        except Exception as e:
+            print(f"Could not read robots.txt for {host}: {e}")
+            robots.allow_all = True
+        with self._lock:
+            return self._robots.setdefault(host, robots)
+
+    def allowed(self, url):
+        return not self.respect_robots or self.robots(url).can_fetch(USER_AGENT, url)
+
+    def _host_delay(self, url):
+        crawl_delay = self.robots(url).crawl_delay(USER_AGENT) if self.respect_robots else None
+        return max(self.delay, float(crawl_delay or 0))
+
+    def fetch(self, url, fetch):
+        host = host_of(url)
+        delay = self._host_delay(url)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.Semaphore(self.per_host))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = slot + delay
+            if slot > now:
+                time.sleep(slot - now)
+            return fetch(url)
+
+# CRAWLING
+
+def load_results(output_path):
+    '''Reads the records of an earlier (possibly interrupted) run; a truncated last line is ignored.'''
+    records = []
+    if not os.path.exists(output_path):
+        return records
+    with open(output_path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable line in {output_path}")
+    return records
+
+def _process_page(url, depth, parse_description, mode, limiter, seen_hashes, hashes_lock, follow_links):
+    record = {"url": url, "depth": depth}
+    if not limiter.allowed(url):
+        record["status"] = "disallowed"
+        return record
+    try:
+        html = limiter.fetch(url, lambda page_url: scrape_website(page_url, mode=mode))
+        if follow_links:
+            record["links"] = extract_links(html, url)
+        content = clean_html(html)
+        record["content_hash"] = page_hash = content_hash(content)
+        with hashes_lock:
+            duplicate = page_hash in seen_hashes
+            seen_hashes.add(page_hash)
+        if duplicate:
+            record["status"] = "duplicate"
+            return record
+        try:
+            if parse_description:
+                record["parsed"] = parse_with_ai(split_dom_content(content), parse_description)
+            else:
+                record["content"] = content
+        except Exception:
+            # Let another copy of the page (or a resumed run) try again
+            with hashes_lock:
+                seen_hashes.discard(page_hash)
+            raise
+        record["status"] = "ok"
+    except Exception as e:
+        print(f"Failed to process {url}: {e}")
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+def crawl(output_path, urls=(), sitemap=None, seed=None, depth=0, parse_description=None, mode="auto",
+          max_pages=CRAWL_MAX_PAGES, max_workers=CRAWL_WORKERS, limiter=None, on_record=None):
+    '''
+    Processes the pages and appends one record per page to output_path; yields each record as it is written.
+    Records look like {"url", "depth", "status": ok|duplicate|disallowed|error, "parsed" or "content",
+    "content_hash", "links" (seed crawls), "error"}. If output_path already holds records, finished
+    pages are skipped and a seed crawl continues from the links they found.
+    '''
+    limiter = limiter or HostLimiter()
+    follow_links = seed is not None
+
+    start = [(normalize_url(url), 0) for url in urls]
+    if sitemap:
+        start += [(normalize_url(url), 0) for url in read_sitemap(sitemap)]
+    if seed:
+        start.append((normalize_url(seed), 0))
+
+    done = set()
+    seen_hashes = set()
+    hashes_lock = threading.Lock()
+    resumed_links = []
+    for record in load_results(output_path):
+        if record.get("status") in DONE_STATUSES:
+            done.add(record["url"])
+            if record["status"] == "ok" and record.get("content_hash"):
+                seen_hashes.add(record["content_hash"])
+            if follow_links and record.get("depth", 0) < depth:
+                resumed_links += [(link, record["depth"] + 1) for link in record.get("links", [])]
+    if done:
+        print(f"Resuming: {len(done)} pages already done")
+
+    queued = set(done)
+    frontier = deque()
+    for url, page_depth in start + resumed_links:
+        if url not in queued:
+            queued.add(url)
+            frontier.append((url, page_depth))
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # An interrupted run may have left half a line behind
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb+") as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                file.write(b"\n")
+
+    processed = len(done)
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = set()
+        while frontier or running:
+            while frontier and len(running) < max_workers * 2 and processed + len(running) < max_pages:
+                url, page_depth = frontier.popleft()
+                # Each page runs in a copy of this context so its spans join the caller's trace
+                running.add(executor.submit(
+                    contextvars.copy_context().run, _process_page, url, page_depth, parse_description, mode, limiter,
+                    seen_hashes, hashes_lock, follow_links and page_depth < depth,
+                ))
+            if not running:
+                break
+
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                processed += 1
+                for link in record.get("links", []):
+                    if link not in queued:
+                        queued.add(link)
+                        frontier.append((link, record["depth"] + 1))
+                if on_record is not None:
+                    on_record(record, processed, processed + len(running) + len(frontier))
+                yield record
+
+def crawl_job(ctx, output_path, **options):
+    '''Background job version of crawl(); the result is a short summary.'''
+    counts = {}
+
+    def report(record, processed, known):
+        ctx.progress(processed / max(known, 1), f"{processed} pages done, {known - processed} left")
+
+    for record in crawl(output_path, on_record=report, **options):
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    return ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "No pages"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape and parse many pages into a JSONL file.")
+    parser.add_argument("urls", nargs="*", help="pages to process")
+    parser.add_argument("--urls-file", help="file with one URL per line")
+    parser.add_argument("--sitemap", help="sitemap.xml URL")
+    parser.add_argument("--seed", help="start page of a same-host crawl")
+    parser.add_argument("--depth", type=int, default=1, help="link depth of the crawl from --seed")
+    parser.add_argument("--parse", dest="parse_description", help="what to extract from every page")
+    parser.add_argument("--out", default="crawl.jsonl", help="output file; rerun with the same file to resume")
+    parser.add_argument("--mode", default="auto", choices=["auto", "http", "browser"])
+    parser.add_argument("--max-pages", type=int, default=CRAWL_MAX_PAGES)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--per-host", type=int, default=CRAWL_PER_HOST)
+    parser.add_argument("--delay", type=float, default=CRAWL_DELAY)
+    parser.add_argument("--ignore-robots", action="store_true")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, encoding="utf-8") as file:
+            urls += [line.strip() for line in file if line.strip()]
+    if not (urls or args.sitemap or args.seed):
+        parser.error("give URLs, --urls-file, --sitemap or --seed")
+
+    # A crawl is bulk work: interactive questions get the OpenAI rate limit first
+    with priority(BULK):
+        for record in crawl(
+            args.out, urls=urls, sitemap=args.sitemap, seed=args.seed, depth=args.depth,
+            parse_description=args.parse_description, mode=args.mode, max_pages=args.max_pages, max_workers=args.workers,
+            limiter=HostLimiter(args.per_host, args.delay, respect_robots=not args.ignore_robots),
+        ):
+            print(f"{record['status']:>10}  {record['url']}")
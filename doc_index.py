@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from hybrid_search import BM25Index, HybridRetriever
+from tracing import span
+
+# "chroma" or "mmap" (mmap_store.MmapVectorStore: a memory-mapped matrix, lighter for a few thousand chunks)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")
+PERSIST_DIRECTORIES = {"chroma": "chroma_db", "mmap": "vector_db"}
+COLLECTION_NAME = "documents"
+# BM25 indexes of recent document selections, shared by every session and API request
+LEXICAL_CACHE_MB = float(os.getenv("RAG_LEXICAL_CACHE_MB", "256"))
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()
+
+def document_id(name, owner=None):
+    '''
+    Documents are keyed by name, so uploading an edited file again replaces its previous version. Pass
+    an owner to keep two users' report.pdf apart.
+    '''
+    return f"{owner}/{name}" if owner else name
+
+def chunk_id(doc_id, text):
+    return hashlib.sha256(f"{doc_id}\0{text}".encode("utf-8")).hexdigest()
+
+class DocumentIndex:
+    '''
+    Vector store collection (Chroma or the memory-mapped store) plus a manifest of the documents in it.
+    Every document is tracked by id (see document_id) with its content fingerprint as the version, and
+    every chunk gets an id derived from its text, so re-indexing a document only touches chunks that changed.
+    '''
+
+    def __init__(self, embeddings, persist_directory=None, collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND,
+                 lexical_cache_mb=LEXICAL_CACHE_MB):
+        if backend not in PERSIST_DIRECTORIES:
+            raise ValueError(f"Unknown vector backend {backend!r}, expected one of {', '.join(PERSIST_DIRECTORIES)}")
+        # Each backend keeps its own directory, so its manifest always describes its own contents
+        persist_directory = persist_directory or PERSIST_DIRECTORIES[backend]
+        if backend == "mmap":
+            from mmap_store import MmapVectorStore
+
+            self.vectorstore = MmapVectorStore(embeddings, persist_directory=persist_directory, collection_name=collection_name)
+        else:
+            from langchain_community.vectorstores import Chroma
+
+            self.vectorstore = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                persist_directory=persist_directory,
+            )
+        self.manifest_path = os.path.join(persist_directory, f"{collection_name}_manifest.json")
+        self._lock = threading.RLock()
+        self._lexical_chunks = {}
+        self._lexical_indexes = OrderedDict()
+        self.lexical_cache_limit = int(lexical_cache_mb * 1024 * 1024)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _save_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def documents(self):
+        with self._lock:
+            return sorted(self.manifest)
+
+    def scope(self, doc_ids):
+        '''Identifies the exact content of a set of documents, e.g. to key cached answers.'''
+        with self._lock:
+            fingerprints = sorted(self.manifest[doc_id]["fingerprint"] for doc_id in doc_ids if doc_id in self.manifest)
+        return hashlib.sha256("\n".join(fingerprints).encode("utf-8")).hexdigest()
+
+    def version(self, doc_id):
+        '''Fingerprint of the indexed content of doc_id, or None if it is not indexed.'''
+        with self._lock:
+            return self.manifest.get(doc_id, {}).get("fingerprint")
+
+    def writer(self, doc_id):
+        '''Starts an incremental (re)index of doc_id; chunks can be added in batches as they are parsed.'''
+        with self._lock:
+            old_ids = set(self.manifest.get(doc_id, {}).get("chunk_ids", []))
+        return DocumentWriter(self, doc_id, old_ids)
+
+    def upsert(self, doc_id, doc_fingerprint, chunks):
+        '''Adds the chunks that are new for doc_id and deletes the ones that disappeared. Returns (added, removed).'''
+        writer = self.writer(doc_id)
+        writer.add(chunks)
+        return writer.commit(doc_fingerprint)
+
+    def remove(self, doc_id):
+        with self._lock:
+            entry = self.manifest.pop(doc_id, None)
+            if entry is None:
+                return
+            if entry["chunk_ids"]:
+                self.vectorstore.delete(ids=entry["chunk_ids"])
+            self._save_manifest()
+
+    def _where(self, doc_ids):
+        doc_ids = list(doc_ids)
+        if len(doc_ids) == 1:
+            return {"doc_id": doc_ids[0]}
+        return {"doc_id": {"$in": doc_ids}}
+
+    def vector_retriever(self, doc_ids, k=4):
+        '''Retriever that only searches the chunks of the given documents.'''
+        return self.vectorstore.as_retriever(search_kwargs={"k": k, "filter": self._where(doc_ids)})
+
+    def _load_lexical_chunks(self, doc_id):
+        with self._lock:
+            entry = self.manifest.get(doc_id)
+            if entry is None:
+                return []
+            cached = self._lexical_chunks.get(doc_id)
+            if cached is not None and cached[0] == entry["fingerprint"]:
+                return cached[1]
+            # By id rather than by doc_id, so chunks of a version still being written are left out
+            stored = self.vectorstore.get(ids=entry["chunk_ids"], include=["documents", "metadatas"])
+            chunks = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(stored["documents"], stored["metadatas"])
+            ]
+            self._lexical_chunks[doc_id] = (entry["fingerprint"], chunks)
+            return chunks
+
+    def lexical_index(self, doc_ids):
+        '''
+        BM25 index over the chunks of the given documents, memoized per document version. The least
+        recently used indexes are dropped once all of them together take more than lexical_cache_limit.
+        '''
+        with self._lock:
+            key = tuple(sorted((doc_id, self.manifest.get(doc_id, {}).get("fingerprint")) for doc_id in doc_ids))
+            entry = self._lexical_indexes.get(key)
+            if entry is not None:
+                self._lexical_indexes.move_to_end(key)
+                return entry[0]
+            bm25 = BM25Index(chunk for doc_id in sorted(doc_ids) for chunk in self._load_lexical_chunks(doc_id))
+            self._lexical_indexes[key] = (bm25, bm25.approximate_size())
+            self._evict_lexical_indexes()
+            return bm25
+
+    def _evict_lexical_indexes(self):
+        total = sum(size for _, size in self._lexical_indexes.values())
+        evicted = False
+        while total > self.lexical_cache_limit and len(self._lexical_indexes) > 1:
+            _, (_, size) = self._lexical_indexes.popitem(last=False)
+            total -= size
+            evicted = True
+        if evicted:
+            # Chunk texts are only kept for documents that a cached index still covers
+            in_use = {doc_id for key in self._lexical_indexes for doc_id, _ in key}
+            for doc_id in list(self._lexical_chunks):
+                if doc_id not in in_use:
+                    del self._lexical_chunks[doc_id]
+
+    def as_retriever(self, doc_ids, k=4, fetch_k=20, reranker=None, mode="hybrid"):
+        '''
+        Hybrid BM25 + vector retriever scoped to the given documents. It looks its BM25 index up in the
+        shared cache on every query instead of holding it, so keeping a retriever costs almost no memory.
+        '''
+        return HybridRetriever(
+            vector_retriever=self.vector_retriever(doc_ids, k=fetch_k),
+            lexical_index=LexicalIndexRef(self, doc_ids),
+            k=k,
+            fetch_k=fetch_k,
+            reranker=reranker,
+            mode=mode,
+        )
+
+class LexicalIndexRef:
+    def __init__(self, index, doc_ids):
+        self.index = index
+        self.doc_ids = list(doc_ids)
+
+    def search(self, query, k=20):
+        return self.index.lexical_index(self.doc_ids).search(query, k)
+
+class DocumentWriter:
+    def __init__(self, index, doc_id, old_ids):
+        self.index = index
+        self.doc_id = doc_id
+        self.old_ids = old_ids
+        self.chunk_ids = {}
+        self.added_ids = []
+        self._lock = threading.Lock()
+
+    def add(self, chunks):
+        new_chunks = {}
+        with self._lock:
+            for chunk in chunks:
+                cid = chunk_id(self.doc_id, chunk.page_content)
+                if cid in self.chunk_ids:
+                    continue
+                self.chunk_ids[cid] = None
+                if cid not in self.old_ids:
+                    chunk.metadata["doc_id"] = self.doc_id
+                    new_chunks[cid] = chunk
+        if new_chunks:
+            with span("vector_write", doc_id=self.doc_id, chunks=len(new_chunks)):
+                self.index.vectorstore.add_documents(list(new_chunks.values()), ids=list(new_chunks))
+            with self._lock:
+                self.added_ids.extend(new_chunks)
+        return len(new_chunks)
+
+    def commit(self, doc_fingerprint):
+        index = self.index
+        with index._lock:
+            stale_ids = list(self.old_ids - self.chunk_ids.keys())
+            if stale_ids:
+                index.vectorstore.delete(ids=stale_ids)
+            index.manifest[self.doc_id] = {"fingerprint": doc_fingerprint, "chunk_ids": list(self.chunk_ids)}
+            index._save_manifest()
+            # Build the BM25 postings now so the first question does not pay for it
+            index._load_lexical_chunks(self.doc_id)
+
+        added = len(self.added_ids)
+        print(f"Indexed {self.doc_id}: {added} chunks added, {len(stale_ids)} removed, {len(self.chunk_ids) - added} reused")
+        return added, len(stale_ids)
+
+    def abort(self):
+        '''Drops the chunks this writer added, leaving the previously indexed version untouched.'''
+        if self.added_ids:
+            self.index.vectorstore.delete(ids=self.added_ids)
+            self.added_ids = []
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from tokens import count_tokens, count_tokens_batch
+from tracing import span
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    '''
+    On-disk store of float32 vectors keyed by cache_key(model, text).
+    Once the stored vectors exceed max_bytes the least recently used ones are evicted.
+    '''
+
+    def __init__(self, path=CACHE_PATH, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._db.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items]
+        with self._lock:
+            for key, blob, used in rows:
+                previous = self._db.execute("SELECT nbytes FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), used),
+                )
+                self.total_bytes += len(blob) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Drop down to 90% of the cap so we do not evict on every insert
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, nbytes in self._db.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used"):
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= nbytes
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+class CachedEmbeddings(Embeddings):
+    '''Wraps an Embeddings model so that only texts missing from the cache reach the embedding API.'''
+
+    def __init__(self, embeddings, model_name, cache=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            texts_to_embed = list(missing.values())
+            with span("embedding", model=self.model_name, texts=len(texts_to_embed),
+                      prompt_tokens=sum(count_tokens_batch(texts_to_embed))):
+                vectors = self.embeddings.embed_documents(texts_to_embed)
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+
+        print(f"Embeddings: {len(texts) - len(missing)} cached, {len(missing)} computed")
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        key = cache_key(self.model_name, text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        with span("embedding", model=self.model_name, texts=1, prompt_tokens=count_tokens(text)):
+            vector = self.embeddings.embed_query(text)
+        self.cache.put_many([(key, vector)])
+        return vector
@@ -1,102 +1,105 @@
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
+from functools import lru_cache
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from dotenv import load_dotenv
+from clients import get_llm
+from outbox import get_outbox
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-
 # TOOLS
 
-import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from langchain.prompts import ChatPromptTemplate
-from langchain.tools import tool
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini")
-
-@tool
-def generate(topic: str) -> str:
-    '''Generates text for project based on users input.'''
-    messages = [
-        ("system", "You are a student that writes an essay."),
-        ("human", "Write an essay on the topic {topic}. The range is 200 - 220 words.")
-    ]
-    template = ChatPromptTemplate.from_messages(messages)
-    prompt = template.invoke({"topic": topic})
-    response = llm.invoke(prompt)
-    return response.content
-
-@tool
-def review(text: str) -> str:
-    '''Writes the review of the text and tells what to improve.'''
-    messages = [
-        ("system", "You are a teacher that reviews an essay."),
-        ("human", "Write an review to the following essay: {text}")
-    ]
-    template = ChatPromptTemplate.from_messages(messages)
-    prompt = template.invoke({"text": text})
-    response = llm.invoke(prompt)
-    return response.content
-
-@tool
-def improve_text(text:str, text_review:str) -> str:
-    '''Edits the text of the project based on the review fo the text.'''
-    messages = [
-        ("system", "You are a student that writes an essay."),
-        ("human", "Rewrite following essay: {text} Write it based on following review: {review}")
-    ]
-    template = ChatPromptTemplate.from_messages(messages)
-    prompt = template.invoke({"text": text, "review": text_review})
-    response = llm.invoke(prompt)
-    return response
-
-@tool
-def get_keywords(text:str) -> str:
-    '''Creates keywords or phrases for powerpoint presentation based on text.'''
-    messages = [
-        ("system", "You are a student that makes a powerpoint presentation."),
-        ("human", "Write keywords or phrases for powerpoint presentation to the following essay: {text}")
-    ]
-    template = ChatPromptTemplate.from_messages(messages)
-    prompt = template.invoke({"text": text})
-    response = llm.invoke(prompt)
-    return response
-
-@tool
-def combine_text(text:str, keywords:str):
-    '''Combines text of the projext and keywords.'''
-    combined_text = text + "\n\n" + keywords
-    return combined_text
-
-def send_by_email(receiver_email:str, text:str):
-    sender_email = os.getenv("SENDER_EMAIL")
-    app_password = os.getenv("GOOGLE_APP_PASSWORD")
+generate_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a student that writes an essay."),
+    ("human", "Write an essay on the topic {topic}. The range is 200 - 220 words.")
+])
 
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = receiver_email
-    message["Subject"] = "Essay"
+review_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a teacher that reviews an essay."),
+    ("human", "Write an review to the following essay: {essay}")
+])
 
-    body = text
-    message.attach(MIMEText(body, "plain"))
+improve_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a student that writes an essay."),
+    ("human", "Rewrite following essay: {essay} Write it based on following review: {review}")
+])
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(sender_email, app_password)
-        server.sendmail(sender_email, receiver_email, message.as_string())
+keywords_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a student that makes a powerpoint presentation."),
+    ("human", "Write keywords or phrases for powerpoint presentation to the following essay: {essay}")
+])
 
-    print("Email sent!")
+def combine_text(text, keywords):
+    '''Combines text of the projext and keywords.'''
+    return text + "\n\n" + keywords
+
+def build_essay_pipeline(llm):
+    '''
+    generate -> review -> improve -> keywords -> combine, in the order the essay workflow always used.
+    Returns (draft_pipeline, keywords_chain, essay_pipeline); the first two are the streaming path's halves.
+    '''
+    to_text = StrOutputParser()
+    draft_pipeline = (
+        RunnablePassthrough.assign(essay=generate_prompt | llm | to_text)
+        | RunnablePassthrough.assign(review=review_prompt | llm | to_text)
+        | RunnablePassthrough.assign(essay=improve_prompt | llm | to_text)
+    )
+    keywords_chain = keywords_prompt | llm | to_text
+    essay_pipeline = (
+        draft_pipeline
+        | RunnablePassthrough.assign(keywords=keywords_chain)
+        | RunnableLambda(lambda state: combine_text(state["essay"], state["keywords"]))
+    )
+    return draft_pipeline, keywords_chain, essay_pipeline
+
+@lru_cache(maxsize=None)
+def get_essay_pipeline():
+    '''Built on first use and shared by every session.'''
+    return build_essay_pipeline(get_llm())
+
+def generate_essay(topic):
+    _, _, essay_pipeline = get_essay_pipeline()
+    return essay_pipeline.invoke({"topic": topic})
+
+def stream_essay(topic):
+    '''Yields the improved essay as soon as it is ready, then the keyword tokens; joined it equals generate_essay(topic).'''
+    draft_pipeline, keywords_chain, _ = get_essay_pipeline()
+    state = draft_pipeline.invoke({"topic": topic})
+    yield combine_text(state["essay"], "")
+    yield from keywords_chain.stream(state)
+
+def generate_essays(topics, max_concurrency=4):
+    '''Writes one essay per topic, running up to max_concurrency pipelines at once.'''
+    _, _, essay_pipeline = get_essay_pipeline()
+    return essay_pipeline.batch(
+        [{"topic": topic} for topic in topics],
+        config={"max_concurrency": max_concurrency}
+    )
+
+def essay_job(ctx, topics, max_concurrency=4):
+    '''Background job version of the Generate button; progress advances as each essay finishes.'''
+    _, _, essay_pipeline = get_essay_pipeline()
+    essays = [None] * len(topics)
+    ctx.progress(0, f"Writing {len(topics)} essay(s)")
+    for done, (i, essay) in enumerate(essay_pipeline.batch_as_completed(
+        [{"topic": topic} for topic in topics],
+        config={"max_concurrency": max_concurrency}
+    ), start=1):
+        essays[i] = essay
+        ctx.progress(done / len(topics), f"Finished {done} of {len(topics)}")
+    if len(topics) == 1:
+        return essays[0]
+    return "\n\n".join(f"## {topic}\n\n{essay}" for topic, essay in zip(topics, essays))
 
+def send_by_email(receiver_email:str, text:str):
+    '''Queues the essay in the outbox and returns the message ID; delivery happens in the background.'''
+    return get_outbox().send(receiver_email, "Essay", text)
 
-tools = [generate, review, improve_text, get_keywords, combine_text]
 
 import streamlit as st
+from jobs import JobLimitReached, current_user, get_job_manager, jobs_panel
+from outbox_ui import email_status
 
 def write_essay(col2):
     with col2:
@@ -108,28 +111,47 @@ def write_essay(col2):
         if 'essay_topic' not in st.session_state:
             st.session_state.essay_topic = ""
 
-        topic = st.text_input("The topic for the essay")
+        batch = st.checkbox("Generate a set of essays (one topic per line)")
+        if batch:
+            topics = [line.strip() for line in st.text_area("The topics for the essays").splitlines() if line.strip()]
+        else:
+            topic = st.text_input("The topic for the essay")
+            topics = [topic] if topic else []
+        background = st.checkbox("Run in background", help="Keep working while the essays are written; results appear below when done.")
         generate = st.button("Generate")
 
-        agent = create_react_agent(llm, tools)
-
         # Generation logic
-        if topic and generate:
-            with st.spinner("Generating essay..."):
+        if topics and generate and background:
+            try:
+                get_job_manager().submit(current_user(), "essay", essay_job, label=", ".join(topics), topics=topics)
+                st.toast("Essay queued" if len(topics) == 1 else "Essays queued")
+            except JobLimitReached as e:
+                st.error(str(e))
+        elif topics and generate:
+            with st.spinner("Generating essay..." if len(topics) == 1 else f"Generating {len(topics)} essays..."):
                 try:
-                    result = agent.invoke({"messages": [
-                        ("system", "You are a helpful assistant that helps users with their essays."
-                        " You have to generate, review, and improve essays, create keywords for presentations, and combine text in following order."),
-                        ("human", topic)
-                    ]})
-
-                    st.session_state.essay_result = result["messages"][-1].content
-                    st.session_state.essay_topic = topic
-                    st.success("Essay generated successfully!")
+                    if len(topics) == 1:
+                        output = st.empty()
+                        with output.container():
+                            st.session_state.essay_result = st.write_stream(stream_essay(topics[0]))
+                        output.empty()
+                    else:
+                        essays = generate_essays(topics)
+                        st.session_state.essay_result = "\n\n".join(
+                            f"## {topic}\n\n{essay}" for topic, essay in zip(topics, essays)
+                        )
+                    st.session_state.essay_topic = ", ".join(topics)
+                    st.success("Essay generated successfully!" if len(topics) == 1 else "Essays generated successfully!")
 
                 except Exception as e:
                     st.error(f"Essay generation failed: {str(e)}")
 
+        def open_job(job):
+            st.session_state.essay_result = job["result"]
+            st.session_state.essay_topic = job["label"]
+
+        jobs_panel("essay", open_job)
+
         # Display results (MOVED OUTSIDE the generation block)
         if st.session_state.essay_result is not None:
             st.subheader(f"Essay Results for: {st.session_state.essay_topic}")
@@ -141,11 +163,9 @@ def write_essay(col2):
                 email = st.text_input("Enter Your Email", key="email_input")
                 send = st.button("Send", key="send_button")
                 if send and email:
-                    try:
-                        send_by_email(email, st.session_state.essay_result)
-                        st.success("Email sent successfully!")
-                    except Exception as e:
-                        st.error(f"Failed to send email: {str(e)}")
+                    st.session_state.essay_email_id = send_by_email(email, st.session_state.essay_result)
+                if st.session_state.get("essay_email_id"):
+                    email_status(st.session_state.essay_email_id)
 
             # Clear functionality
             if st.button("Clear Results", key="clear_results_button"):
@@ -0,0 +1,136 @@
+import math
+import re
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Callable, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from tracing import span
+
+# Keeps identifiers such as "PN-4471A", "7.3.1" or "ISO/IEC" together as one token
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+def is_lexical_query(query):
+    '''Short queries that are quoted or look like identifiers (part numbers, clause ids) are answered by BM25 alone.'''
+    stripped = query.strip()
+    if len(stripped) > 2 and stripped[0] == stripped[-1] and stripped[0] in "\"'":
+        return True
+    words = TOKEN_PATTERN.findall(stripped.lower())
+    return 0 < len(words) <= 3 and any(re.search(r"\d", word) for word in words)
+
+def document_key(document):
+    return (document.metadata.get("doc_id"), document.page_content)
+
+class BM25Index:
+    '''In-memory inverted index with Okapi BM25 scoring.'''
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for i, document in enumerate(self.documents):
+            counts = Counter(tokenize(document.page_content))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        n = len(self.documents)
+        self.avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.documents)
+
+    def approximate_size(self):
+        '''Rough memory footprint in bytes: the chunk texts plus about 64 bytes per posting.'''
+        texts = sum(sys.getsizeof(document.page_content) for document in self.documents)
+        return texts + 64 * sum(len(postings) for postings in self.postings.values())
+
+    def search(self, query, k=20):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[i] / (self.avg_length or 1)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[i], score) for i, score in best]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    '''Merges several ranked lists of documents; each document scores sum(1 / (k + rank)).'''
+    scores = defaultdict(float)
+    by_key = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document_key(document)
+            scores[key] += 1 / (k + rank)
+            by_key.setdefault(key, document)
+    return [by_key[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+class CrossEncoderReranker:
+    '''Local re-ranking with a sentence-transformers cross-encoder (optional dependency).'''
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("Re-ranking needs the sentence-transformers package: pip install sentence-transformers") from e
+        self.model = CrossEncoder(model_name)
+
+    def __call__(self, query, documents):
+        if not documents:
+            return documents
+        scores = self.model.predict([(query, document.page_content) for document in documents])
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)
+        return [document for document, _ in ranked]
+
+class HybridRetriever(BaseRetriever):
+    '''
+    Fuses dense (vector) and BM25 results with reciprocal rank fusion, optionally re-ranks them,
+    and answers identifier-like queries from BM25 alone so they never need a query embedding.
+    '''
+
+    vector_retriever: BaseRetriever
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    reranker: Optional[Callable[[str, List[Document]], List[Document]]] = None
+    mode: str = "hybrid"
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with span("bm25_search", k=self.fetch_k):
+            lexical = [document for document, _ in self.lexical_index.search(query, self.fetch_k)]
+
+        if self.mode == "lexical" or (self.mode == "hybrid" and lexical and is_lexical_query(query)):
+            candidates = lexical
+        else:
+            with span("vector_search", k=self.fetch_k):
+                dense = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            if self.mode == "vector":
+                candidates = dense
+            else:
+                candidates = reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)
+
+        if self.reranker is not None:
+            with span("rerank", candidates=len(candidates[:self.fetch_k])):
+                candidates = self.reranker(query, candidates[:self.fetch_k])
+        return candidates[:self.k]
@@ -0,0 +1,155 @@
+import contextvars
+import hashlib
+import multiprocessing
+import os
+import queue
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, TextLoader
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from doc_index import document_id
+
+BATCH_SIZE = 64
+EMBEDDING_WORKERS = 2
+# Parsed batches waiting for an embedder; parsers block once the queue is full, so a large file
+# is never held in memory as a whole while embedding falls behind
+QUEUE_BATCHES = 8
+MAX_PENDING_EMBEDS = 2 * EMBEDDING_WORKERS
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+SUFFIXES = {
+    "application/pdf": ".pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+    "text/plain": ".txt",
+}
+
+def spool_upload(file):
+    '''Copies an upload to a temporary file in fixed-size pieces, hashing it on the way. Returns (path, fingerprint).'''
+    digest = hashlib.sha256()
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=SUFFIXES.get(file.type, "")) as temporary_file:
+        while True:
+            data = file.read(SPOOL_CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            temporary_file.write(data)
+    return temporary_file.name, digest.hexdigest()
+
+def lazy_pages(path, mime_type):
+    if mime_type == "application/pdf":
+        return PyPDFLoader(path).lazy_load()
+    elif mime_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
+        return Docx2txtLoader(path).lazy_load()
+    elif mime_type == "text/plain":
+        return TextLoader(path, encoding="utf-8").lazy_load()
+    raise ValueError(f"Unsupported file type: {mime_type}")
+
+def _parse_worker(path, mime_type, doc_id, source_name, batch_size, out_queue):
+    # Runs in a worker process: parse page by page and ship chunks back in batches
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100
+    )
+    batch = []
+    try:
+        for page in lazy_pages(path, mime_type):
+            page.metadata["source"] = source_name
+            for chunk in text_splitter.split_documents([page]):
+                batch.append((chunk.page_content, chunk.metadata))
+                if len(batch) >= batch_size:
+                    out_queue.put(("chunks", doc_id, batch))
+                    batch = []
+        if batch:
+            out_queue.put(("chunks", doc_id, batch))
+        out_queue.put(("done", doc_id, None))
+    except Exception as e:
+        out_queue.put(("error", doc_id, f"{type(e).__name__}: {e}"))
+
+def ingest_files(index, uploads, batch_size=BATCH_SIZE, max_workers=None, owner=None):
+    '''
+    Indexes several uploaded files at once. Files are parsed lazily in parallel worker processes,
+    and chunk batches are embedded and written to the index while later pages are still being parsed.
+    Files already indexed with the same content are reused as-is, and an edited file only re-embeds
+    the chunks that changed. Returns ({name: doc_id}, {name: error}).
+    '''
+    loaded = {}
+    failed = {}
+    pending = {}
+    try:
+        for file in uploads:
+            path, doc_fingerprint = spool_upload(file)
+            doc_id = document_id(file.name, owner)
+            if index.version(doc_id) == doc_fingerprint:
+                print(f"{doc_id} is already indexed")
+                loaded[file.name] = doc_id
+                os.unlink(path)
+            elif doc_id in pending:
+                os.unlink(path)
+            else:
+                pending[doc_id] = (path, file.type, doc_fingerprint, file.name)
+
+        if pending:
+            _ingest_spooled(index, pending, batch_size, max_workers, loaded, failed)
+    finally:
+        for path, _, _, _ in pending.values():
+            if os.path.exists(path):
+                os.unlink(path)
+
+    return loaded, failed
+
+def _ingest_spooled(index, pending, batch_size, max_workers, loaded, failed):
+    writers = {doc_id: index.writer(doc_id) for doc_id in pending}
+    embedding_futures = {doc_id: [] for doc_id in pending}
+    in_flight = set()
+    remaining = set(pending)
+    max_workers = max_workers or min(len(pending), os.cpu_count() or 1)
+
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=max_workers) as parsers, \
+            ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS) as embedders:
+        out_queue = manager.Queue(maxsize=QUEUE_BATCHES)
+        parse_futures = [
+            parsers.submit(_parse_worker, path, mime_type, doc_id, name, batch_size, out_queue)
+            for doc_id, (path, mime_type, _, name) in pending.items()
+        ]
+
+        while remaining:
+            try:
+                kind, doc_id, payload = out_queue.get(timeout=0.5)
+            except queue.Empty:
+                if all(future.done() for future in parse_futures) and out_queue.empty():
+                    # A worker died without reporting back
+                    error = next(
+                        (str(future.exception()) for future in parse_futures if future.exception() is not None),
+                        "Parser exited unexpectedly",
+                    )
+                    for doc_id in remaining:
+                        wait(embedding_futures[doc_id])
+                        failed[pending[doc_id][3]] = error
+                        writers[doc_id].abort()
+                    break
+                continue
+
+            if kind == "chunks":
+                if len(in_flight) >= MAX_PENDING_EMBEDS:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                chunks = [Document(page_content=text, metadata=metadata) for text, metadata in payload]
+                # Copy the context so the embedding spans land in the caller's trace
+                future = embedders.submit(contextvars.copy_context().run, writers[doc_id].add, chunks)
+                embedding_futures[doc_id].append(future)
+                in_flight.add(future)
+                continue
+
+            remaining.discard(doc_id)
+            wait(embedding_futures[doc_id])
+            errors = [future.exception() for future in embedding_futures[doc_id] if future.exception() is not None]
+            if kind == "error" or errors:
+                failed[pending[doc_id][3]] = payload if kind == "error" else str(errors[0])
+                writers[doc_id].abort()
+            else:
+                writers[doc_id].commit(pending[doc_id][2])
+                loaded[pending[doc_id][3]] = doc_id
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import BULK, priority
+from tracing import trace
+
+JOBS_PATH = os.getenv("JOBS_PATH", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "3"))
+
+ACTIVE_STATES = ("queued", "running")
+
+class JobCancelled(Exception):
+    pass
+
+class JobLimitReached(Exception):
+    pass
+
+class JobContext:
+    '''Handed to a running job so it can report progress and notice when it has been cancelled.'''
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+
+    @property
+    def cancelled(self):
+        return self.manager._is_cancel_requested(self.job_id)
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, fraction=None, message=None):
+        '''Stores the progress (0..1) and/or a status message, and raises JobCancelled if the job was cancelled.'''
+        self.manager._update(self.job_id, progress=fraction, message=message)
+        self.check()
+
+class JobManager:
+    '''
+    Runs long jobs (research, essays) on a worker pool outside the Streamlit script thread.
+    Every job gets an ID; its state, progress and result are stored in SQLite so they survive
+    reruns and page reloads and can be fetched later. Cancellation is cooperative: a queued
+    job never starts, a running one stops at its next ctx.progress()/ctx.check() call.
+    Each user may have at most max_per_user queued or running jobs.
+    '''
+
+    def __init__(self, path=JOBS_PATH, max_workers=JOB_WORKERS, max_per_user=JOB_MAX_PER_USER):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_per_user = max_per_user
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._futures = {}
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, user TEXT NOT NULL, kind TEXT NOT NULL, label TEXT NOT NULL, "
+            "params TEXT NOT NULL, state TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT, "
+            "result TEXT, error TEXT, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs(user, created)")
+        # Jobs that were queued or running when the process stopped cannot be resumed
+        self._db.execute(
+            "UPDATE jobs SET state = 'failed', error = 'Interrupted by a server restart', finished = ? "
+            "WHERE state IN ('queued', 'running')",
+            (time.time(),),
+        )
+        self._db.commit()
+
+    def submit(self, user, kind, fn, label="", **params):
+        '''Queues fn(ctx, **params) and returns the job ID. Raises JobLimitReached when the user's queue is full.'''
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            active = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user = ? AND state IN (?, ?)", (user, *ACTIVE_STATES)
+            ).fetchone()[0]
+            if active >= self.max_per_user:
+                raise JobLimitReached(f"You already have {active} jobs running or queued (limit {self.max_per_user}).")
+            self._db.execute(
+                "INSERT INTO jobs (id, user, kind, label, params, state, created) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, user, kind, label, json.dumps(params), time.time()),
+            )
+            self._db.commit()
+            self._futures[job_id] = self._executor.submit(self._run, job_id, kind, fn, params)
+        return job_id
+
+    def _run(self, job_id, kind, fn, params):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET state = 'running', started = ? WHERE id = ?", (time.time(), job_id))
+            self._db.commit()
+        print(f"Job {job_id} started")
+        try:
+            JobContext(self, job_id).check()
+            # Background work waits behind interactive requests for the shared OpenAI rate limits
+            with trace(f"{kind} job {job_id}"), priority(BULK):
+                result = fn(JobContext(self, job_id), **params)
+        except JobCancelled:
+            self._finish(job_id, "cancelled")
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._finish(job_id, "failed", error=str(e))
+        else:
+            self._finish(job_id, "done", result=result)
+
+    def _finish(self, job_id, state, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, finished = ?, "
+                "progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END WHERE id = ?",
+                (state, result, error, time.time(), state, job_id),
+            )
+            self._db.commit()
+            self._futures.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+        print(f"Job {job_id} {state}")
+
+    def _update(self, job_id, progress=None, message=None):
+        with self._lock:
+            if progress is not None:
+                self._db.execute("UPDATE jobs SET progress = ? WHERE id = ?", (min(max(progress, 0.0), 1.0), job_id))
+            if message is not None:
+                self._db.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+            self._db.commit()
+
+    def _is_cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancel_requested
+
+    def cancel(self, job_id):
+        '''Returns False if the job has already finished.'''
+        with self._lock:
+            row = self._db.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["state"] not in ACTIVE_STATES:
+                return False
+            future = self._futures.get(job_id)
+            if row["state"] == "queued" and (future is None or future.cancel()):
+                self._futures.pop(job_id, None)
+                self._db.execute(
+                    "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ?", (time.time(), job_id)
+                )
+                self._db.commit()
+                return True
+            self._cancel_requested.add(job_id)
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["cancelling"] = self._is_cancel_requested(job_id)
+        return job
+
+    def list(self, user, kind=None, limit=20):
+        query = "SELECT id FROM jobs WHERE user = ?" + (" AND kind = ?" if kind else "") + " ORDER BY created DESC LIMIT ?"
+        args = (user, kind, limit) if kind else (user, limit)
+        with self._lock:
+            job_ids = [row["id"] for row in self._db.execute(query, args).fetchall()]
+        return [self.get(job_id) for job_id in job_ids]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ? AND state NOT IN (?, ?)", (job_id, *ACTIVE_STATES))
+            self._db.commit()
+
+    def wait(self, job_id, timeout=None):
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.exception(timeout=timeout)
+        return self.get(job_id)
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+def get_job_manager():
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = JobManager()
+        return _default_manager
+
+# UI
+
+import streamlit as st
+
+STATE_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌", "cancelled": "⛔"}
+
+def current_user():
+    '''Identifies the browser session; kept in the URL so jobs can be found again after a reload.'''
+    user = st.query_params.get("user")
+    if not user:
+        user = uuid.uuid4().hex
+        st.query_params["user"] = user
+    return user
+
+@st.fragment(run_every=2)
+def jobs_panel(kind, on_open):
+    '''
+    Lists the user's background jobs of one kind and refreshes itself every two seconds.
+    on_open(job) is called when a finished job's result is opened.
+    '''
+    manager = get_job_manager()
+    jobs = manager.list(current_user(), kind)
+    if not jobs:
+        return
+
+    st.subheader("Background jobs")
+    for job in jobs:
+        with st.container(border=True):
+            st.write(f"{STATE_ICONS.get(job['state'], '')} **{job['label']}** — {job['state']}")
+            if job["state"] in ACTIVE_STATES:
+                text = "Cancelling..." if job["cancelling"] else job["message"]
+                st.progress(job["progress"], text=text)
+                if not job["cancelling"] and st.button("Cancel", key=f"cancel_{job['id']}"):
+                    manager.cancel(job["id"])
+                    st.rerun(scope="fragment")
+            else:
+                if job["state"] == "failed":
+                    st.caption(job["error"])
+                open_col, remove_col = st.columns(2)
+                if job["state"] == "done" and open_col.button("Open result", key=f"open_{job['id']}"):
+                    on_open(job)
+                    st.rerun()
+                if remove_col.button("Remove", key=f"remove_{job['id']}"):
+                    manager.delete(job["id"])
+                    st.rerun(scope="fragment")
@@ -0,0 +1,48 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import start_span
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    '''Records an "llm" span with token usage and cost for every chat model call it is attached to.'''
+
+    def __init__(self):
+        self._spans = {}
+
+    def _start(self, run_id, serialized, metadata):
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or ((serialized or {}).get("kwargs") or {}).get("model_name")
+        attributes = {"model": model}
+        # Inside LangGraph the namespace says which node (search, synthesize, ...) made the call
+        namespace = metadata.get("langgraph_checkpoint_ns")
+        if namespace:
+            attributes["node"] = namespace.split(":")[0]
+        self._spans[run_id] = start_span("llm", **attributes)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        span.finish()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.finish(error=error)
@@ -1,10 +1,16 @@
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from metrics_server import start_metrics_server
+from outbox import get_outbox
+from session_resources import current_session_id, get_session_resources, memory_panel
+from tracing import trace, trace_panel
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# Spans recorded by this process never reach the API's /metrics, so it serves its own
+start_metrics_server()
+# Starts the email sender, so mail queued before a restart goes out without waiting for a new message
+get_outbox()
 
 st.title("AI Helper")
 
@@ -16,18 +22,29 @@ with col1:
         ["Web Dom Scraper", "File Data Analysis", "Web research", "Essay Writing"]
     )
 
-if option == "Web Dom Scraper":
-    from web_scraper import scraper
-    scraper(col2)
-    
-elif option == "File Data Analysis":
-    from RAG import RAG
-    RAG(col2)
-
-elif option == "Web research":
-    from research import run
-    run(col2)
-
-elif option == "Essay Writing":
-    from essays import write_essay
-    write_essay(col2)
\ No newline at end of file
+with trace(option) as run_trace:
+    if option == "Web Dom Scraper":
+        from web_scraper import scraper
+        scraper(col2)
+        
+    elif option == "File Data Analysis":
+        from RAG import RAG
+        RAG(col2)
+
+    elif option == "Web research":
+        from research import run
+        run(col2)
+
+    elif option == "Essay Writing":
+        from essays import write_essay
+        write_essay(col2)
+
+# Reruns that did no traced work keep showing the previous run
+if run_trace.spans:
+    st.session_state.last_trace = run_trace
+if "last_trace" in st.session_state:
+    trace_panel(st.session_state.last_trace)
+
+# Every rerun counts as activity; it is also when idle sessions' resources get evicted
+get_session_resources().touch(current_session_id())
+memory_panel()
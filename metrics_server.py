@@ -0,0 +1,62 @@
+'''
+Prometheus metrics of the process this runs in: span totals (tracing.py), the OpenAI scheduler queue,
+resident memory and, in the Streamlit app, session memory. The API serves them at GET /metrics. The
+Streamlit app records its own spans and holds the session resources, so it starts a small exporter of
+its own on UI_METRICS_PORT.
+'''
+
+import http.server
+import os
+import threading
+
+UI_METRICS_PORT = int(os.getenv("UI_METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+def render_metrics(sessions=True):
+    '''sessions=False leaves out the session memory, which only the Streamlit process has.'''
+    from scheduler import get_scheduler
+    from session_resources import get_session_resources, render_process_prometheus
+    from tracing import render_prometheus
+
+    text = render_prometheus() + get_scheduler().render_prometheus() + render_process_prometheus()
+    if sessions:
+        text += get_session_resources().render_prometheus()
+    return text
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=UI_METRICS_PORT, host=METRICS_HOST):
+    '''
+    Serves /metrics from a daemon thread, once per process (Streamlit reruns call this every time).
+    Port 0 turns it off. Returns the server, or None if it is off or the port is taken.
+    '''
+    global _server, _server_started
+    with _server_lock:
+        if _server_started or not port:
+            return _server
+        _server_started = True
+        try:
+            _server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics exporter not started on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
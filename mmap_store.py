@@ -0,0 +1,461 @@
+'''
+Compact vector store for small and medium corpora: the embeddings live in one contiguous memory-mapped
+matrix (float32, or int8 with a per-row scale), ids/texts/metadata in a JSON sidecar plus an append-only
+change log that is folded into the sidecar once it is as long as the sidecar, and search is a NumPy
+matrix-vector product with a partial sort. Above a few thousand vectors an optional IVF index
+(k-means lists, only the nearest `ivf_probes` lists are scanned) keeps queries sub-linear.
+
+It implements the parts of the Chroma API that DocumentIndex uses (add_documents, delete, get with
+`where` filters, as_retriever with a `filter`), so RAG_VECTOR_BACKEND=mmap switches to it.
+'''
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "float32")
+# 0 disables IVF; otherwise the number of k-means lists, used once there are IVF_TRAINING_FACTOR vectors per list
+IVF_LISTS = int(os.getenv("RAG_IVF_LISTS", "0"))
+IVF_PROBES = int(os.getenv("RAG_IVF_PROBES", "8"))
+IVF_TRAINING_FACTOR = 40
+IVF_TRAINING_ITERATIONS = 10
+INITIAL_CAPACITY = 1024
+# Rows scored per matrix product; small blocks keep int8 rows converted to float32 in the CPU cache
+BLOCK_ROWS = 4096
+# The change log is compacted into the sidecar once it has this many records and as many as the sidecar
+# has rows, so each write appends only its own rows and the full rewrites stay linear in the store's size
+COMPACT_MIN_RECORDS = 1024
+
+DTYPES = {"float32": np.float32, "int8": np.int8}
+
+def _compare(op, value, operand):
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    if op == "$lte":
+        return value <= operand
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+def matches(metadata, where):
+    '''Chroma-style metadata filter: {"key": value}, {"key": {"$in": [...]}}, "$and" / "$or" lists.'''
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(_compare(op, metadata.get(key), operand) for op, operand in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+class MmapVectorStore(VectorStore):
+    def __init__(self, embedding_function, persist_directory=None, collection_name="documents",
+                 quantization=VECTOR_QUANTIZATION, ivf_lists=IVF_LISTS, ivf_probes=IVF_PROBES):
+        if persist_directory is None:
+            persist_directory = tempfile.mkdtemp(prefix="mmap-store-")
+        self._embedding = embedding_function
+        self.directory = os.path.join(persist_directory, collection_name)
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._scales = None
+        self._capacity = 0
+        self._filter_cache = {}
+        self._centroids = None
+        self._assignments = None
+        self._trained_count = 0
+        self._generation = 0
+        self._log_records = 0
+
+        sidecar_path = os.path.join(self.directory, "index.json")
+        if os.path.exists(sidecar_path):
+            with open(sidecar_path, encoding="utf-8") as f:
+                sidecar = json.load(f)
+            self.quantization = sidecar["quantization"]
+            self.dim = sidecar["dim"]
+            self.ids = sidecar["ids"]
+            self.documents = sidecar["documents"]
+            self.metadatas = sidecar["metadatas"]
+            self._generation = sidecar.get("generation", 0)
+            self._positions = {id_: row for row, id_ in enumerate(self.ids)}
+            self._replay()
+            if self.dim is not None:
+                self._open(os.path.getsize(self._path("vectors")) // (self.dim * self._itemsize()))
+        else:
+            if quantization not in DTYPES:
+                raise ValueError(f"Unknown quantization {quantization!r}, expected one of {', '.join(DTYPES)}")
+            self.quantization = quantization
+            self.dim = None
+            self.ids, self.documents, self.metadatas = [], [], []
+            self._positions = {}
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self.ids)
+
+    # STORAGE
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _itemsize(self):
+        return np.dtype(DTYPES[self.quantization]).itemsize
+
+    def _open(self, capacity):
+        self._capacity = capacity
+        self._vectors = np.memmap(self._path("vectors"), dtype=DTYPES[self.quantization], mode="r+", shape=(capacity, self.dim))
+        if self.quantization == "int8":
+            self._scales = np.memmap(self._path("scales"), dtype=np.float32, mode="r+", shape=(capacity,))
+
+    def _ensure_capacity(self, rows):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, INITIAL_CAPACITY, self._capacity * 2)
+        os.makedirs(self.directory, exist_ok=True)
+        files = [(self._path("vectors"), self.dim * self._itemsize())]
+        if self.quantization == "int8":
+            files.append((self._path("scales"), 4))
+        if self._vectors is not None:
+            self._flush()
+        self._vectors = self._scales = None
+        for path, row_bytes in files:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self._open(capacity)
+
+    def _flush(self):
+        self._vectors.flush()
+        if self._scales is not None:
+            self._scales.flush()
+
+    def _log_path(self):
+        return os.path.join(self.directory, f"changes-{self._generation}.jsonl")
+
+    def _replay(self):
+        '''Applies the change log written since the sidecar was last compacted.'''
+        if not os.path.exists(self._log_path()):
+            return
+        complete = True
+        with open(self._log_path(), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A write cut short by a crash; compacting drops it before anything is appended after it
+                    complete = False
+                    break
+                if "delete" in record:
+                    self._remove_row(record["delete"])
+                else:
+                    self._set_row(record["id"], record["text"], record["metadata"])
+                self._log_records += 1
+        if not complete:
+            self._compact()
+
+    def _append_log(self, records):
+        '''Vectors are flushed before their records are appended, so rows the log does not know yet are just ignored after a crash.'''
+        if self._vectors is not None:
+            self._flush()
+        with open(self._log_path(), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+        self._log_records += len(records)
+        if self._log_records >= max(COMPACT_MIN_RECORDS, len(self.ids) // 2):
+            self._compact()
+
+    def _compact(self):
+        '''Writes the whole sidecar as a new generation, then drops the change logs it replaces.'''
+        if self._vectors is not None:
+            self._flush()
+        os.makedirs(self.directory, exist_ok=True)
+        sidecar_path = os.path.join(self.directory, "index.json")
+        with open(sidecar_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "quantization": self.quantization, "dim": self.dim, "generation": self._generation + 1,
+                "ids": self.ids, "documents": self.documents, "metadatas": self.metadatas,
+            }, f)
+        os.replace(sidecar_path + ".tmp", sidecar_path)
+        self._generation += 1
+        self._log_records = 0
+        for path in glob.glob(os.path.join(self.directory, "changes-*.jsonl")):
+            if path != self._log_path():
+                os.remove(path)
+
+    def close(self):
+        '''Folds the change log into the sidecar, so the next open does not replay it.'''
+        with self._lock:
+            if self._log_records:
+                self._compact()
+
+    def _write_rows(self, rows, vectors):
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._vectors[rows] = vectors
+        if self._centroids is not None:
+            self._assignments[rows] = self._assign(vectors)
+
+    def _read_rows(self, rows):
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    # WRITES
+
+    def _set_row(self, id_, text, metadata):
+        '''Returns the row of id_, appended at the end if it is new.'''
+        row = self._positions.get(id_)
+        if row is None:
+            row = len(self.ids)
+            self._positions[id_] = row
+            self.ids.append(id_)
+            self.documents.append(text)
+            self.metadatas.append(dict(metadata or {}))
+        else:
+            self.documents[row] = text
+            self.metadatas[row] = dict(metadata or {})
+        return row
+
+    def _remove_row(self, id_):
+        '''Moves the last row into the slot of id_. Returns (freed row, moved row), or None for an unknown id.'''
+        row = self._positions.pop(id_, None)
+        if row is None:
+            return None
+        last = len(self.ids) - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.documents[row] = self.documents[last]
+            self.metadatas[row] = self.metadatas[last]
+            self._positions[self.ids[row]] = row
+        self.ids.pop()
+        self.documents.pop()
+        self.metadatas.pop()
+        return row, last
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(self._embedding.embed_documents(texts), texts, metadatas, ids=ids)
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None):
+        '''Adds precomputed embeddings; an existing id is overwritten in place.'''
+        vectors = _normalize(vectors)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        with self._lock:
+            new_store = self.dim is None
+            if new_store:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's {self.dim}")
+            rows = [self._set_row(id_, text, metadata) for id_, text, metadata in zip(ids, texts, metadatas)]
+            self._ensure_capacity(len(self.ids))
+            if self._assignments is not None and len(self._assignments) < self._capacity:
+                self._assignments = np.resize(self._assignments, self._capacity)
+            self._write_rows(np.array(rows), vectors)
+            self._filter_cache.clear()
+            if new_store:
+                # The sidecar records the dimension, so the first write creates it
+                self._compact()
+            else:
+                self._append_log([
+                    {"id": id_, "text": self.documents[row], "metadata": self.metadatas[row]}
+                    for id_, row in zip(ids, rows)
+                ])
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        '''Removes rows by moving the last row into each freed slot, so the matrix stays contiguous.'''
+        with self._lock:
+            removed = []
+            for id_ in ids or []:
+                moved = self._remove_row(id_)
+                if moved is None:
+                    continue
+                row, last = moved
+                if row != last:
+                    self._vectors[row] = self._vectors[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    if self._assignments is not None:
+                        self._assignments[row] = self._assignments[last]
+                removed.append(id_)
+            if removed:
+                self._filter_cache.clear()
+                self._append_log([{"delete": id_} for id_ in removed])
+        return True
+
+    # READS
+
+    def _filter_rows(self, where):
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        rows = self._filter_cache.get(key)
+        if rows is None:
+            rows = np.array([row for row, metadata in enumerate(self.metadatas) if matches(metadata, where)], dtype=np.int64)
+            self._filter_cache[key] = rows
+        return rows
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas"), **kwargs):
+        '''Same shape as Chroma's get: {"ids": [...], "documents": [...], "metadatas": [...]}.'''
+        with self._lock:
+            rows = self._filter_rows(where)
+            rows = list(range(len(self.ids))) if rows is None else rows.tolist()
+            if ids is not None:
+                wanted = {self._positions[id_] for id_ in ids if id_ in self._positions}
+                rows = [row for row in rows if row in wanted]
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {"ids": [self.ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self.documents[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[row] for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = self._read_rows(np.array(rows, dtype=np.int64)) if rows else []
+            return result
+
+    # IVF
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _train_ivf(self, count):
+        '''Spherical k-means on a sample of the stored vectors, then every row is assigned to its nearest list.'''
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, size=min(count, self.ivf_lists * 256), replace=False))
+        sample = _normalize(self._read_rows(sample_rows))
+        centroids = sample[rng.choice(len(sample), size=self.ivf_lists, replace=False)]
+        for _ in range(IVF_TRAINING_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(self.ivf_lists):
+                members = sample[labels == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        self._centroids = centroids
+        self._assignments = np.zeros(self._capacity, dtype=np.int32)
+        for start in range(0, count, BLOCK_ROWS):
+            rows = np.arange(start, min(count, start + BLOCK_ROWS))
+            self._assignments[rows] = self._assign(self._read_rows(rows))
+        self._trained_count = count
+
+    def _ivf_rows(self, query, count):
+        '''Rows in the lists nearest to the query, or None when IVF is off or the store is too small for it.'''
+        if not self.ivf_lists or count < self.ivf_lists * IVF_TRAINING_FACTOR:
+            return None
+        # Lists are trained on first use and retrained once the store has doubled
+        if self._centroids is None or count > 2 * self._trained_count:
+            self._train_ivf(count)
+        probes = np.argsort(-(self._centroids @ query))[:self.ivf_probes]
+        return np.nonzero(np.isin(self._assignments[:count], probes))[0]
+
+    # SEARCH
+
+    def _scores(self, query, rows, count):
+        if rows is None:
+            blocks = [np.arange(start, min(count, start + BLOCK_ROWS)) for start in range(0, count, BLOCK_ROWS)]
+        else:
+            blocks = [rows[start:start + BLOCK_ROWS] for start in range(0, len(rows), BLOCK_ROWS)]
+        scores = []
+        for block in blocks:
+            if rows is None:
+                matrix = self._vectors[block[0]:block[-1] + 1]
+            else:
+                matrix = self._vectors[block]
+            block_scores = np.asarray(matrix, dtype=np.float32) @ query
+            if self._scales is not None:
+                block_scores *= self._scales[block]
+            scores.append(block_scores)
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+    def search_vectors(self, embedding, k=4, filter=None):
+        '''[(row, cosine similarity)] of the k nearest stored vectors that match the filter.'''
+        query = _normalize(embedding)
+        with self._lock:
+            count = len(self.ids)
+            if count == 0 or self.dim is None:
+                return []
+            rows = self._filter_rows(filter)
+            if rows is not None and len(rows) == 0:
+                return []
+            probed = self._ivf_rows(query, count)
+            if probed is not None:
+                candidates = probed if rows is None else np.intersect1d(rows, probed, assume_unique=True)
+                # Too few neighbours in the probed lists (e.g. a narrow filter): scan everything that matches
+                if len(candidates) >= k:
+                    rows = candidates
+            scores = self._scores(query, rows, count)
+            best = _top_k(scores, k)
+            positions = best if rows is None else rows[best]
+            return list(zip(positions.tolist(), scores[best].tolist()))
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        with self._lock:
+            return [
+                (Document(id=self.ids[row], page_content=self.documents[row], metadata=dict(self.metadatas[row])), 1.0 - score)
+                for row, score in self.search_vectors(embedding, k, filter)
+            ]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        '''Documents with their cosine distance (lower is closer, like Chroma).'''
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
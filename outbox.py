@@ -0,0 +1,249 @@
+'''
+Email outbox. send() stores the message and returns at once; one background sender keeps an
+authenticated SMTP connection open, sends whatever is queued in batches over it, and retries
+transient failures (dropped connections, 4xx replies) with exponential backoff. Message state
+(queued, sent, failed) is kept in SQLite so the UI can poll it.
+'''
+
+import os
+import random
+import smtplib
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", ".cache/outbox.sqlite3")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+# "ssl" (implicit TLS, Gmail's port 465), "starttls" (port 587) or "plain" (local test servers)
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "ssl")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# An idle connection is closed after this long; Gmail drops idle sessions after a few minutes anyway
+OUTBOX_IDLE_TIMEOUT = float(os.getenv("OUTBOX_IDLE_TIMEOUT", "60"))
+RETRY_BASE = 2.0
+RETRY_CAP = 300.0
+# After an unexpected error the sender waits this long before it looks at the queue again
+ERROR_PAUSE = 5.0
+
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, socket.timeout, socket.gaierror, ConnectionError)
+
+def is_transient(error):
+    '''4xx replies and network errors are worth retrying; 5xx replies and rejected credentials are not.'''
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException) and not isinstance(error, smtplib.SMTPServerDisconnected):
+        # SMTPException is an OSError, but e.g. a server without STARTTLS gives the same answer every time
+        return False
+    return isinstance(error, TRANSIENT_ERRORS)
+
+class Outbox:
+    def __init__(self, path=OUTBOX_PATH, host=SMTP_HOST, port=SMTP_PORT, security=SMTP_SECURITY,
+                 username=None, password=None, sender=None,
+                 batch_size=OUTBOX_BATCH_SIZE, max_attempts=OUTBOX_MAX_ATTEMPTS, idle_timeout=OUTBOX_IDLE_TIMEOUT):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.host = host
+        self.port = port
+        self.security = security
+        self.sender = sender or os.getenv("SENDER_EMAIL")
+        self.username = username if username is not None else os.getenv("SMTP_USERNAME", self.sender)
+        self.password = password if password is not None else os.getenv("SMTP_PASSWORD", os.getenv("GOOGLE_APP_PASSWORD"))
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.idle_timeout = idle_timeout
+        self._connection = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id TEXT PRIMARY KEY, recipient TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, "
+            "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "next_attempt REAL NOT NULL, created REAL NOT NULL, sent REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_due ON messages(state, next_attempt)")
+        self._db.commit()
+        # Messages queued before a restart are picked up again
+        self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+        self._thread.start()
+
+    def send(self, recipient, subject, body):
+        '''Queues the message and returns its ID without touching the network.'''
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO messages (id, recipient, subject, body, state, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (message_id, recipient, subject, body, now, now),
+            )
+            self._db.commit()
+        self._wake.set()
+        return message_id
+
+    def status(self, message_id):
+        '''{"state": queued | sent | failed, "attempts", "error", ...} or None for an unknown ID.'''
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, recipient, subject, state, attempts, error, created, sent FROM messages WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def wait(self, message_id, timeout=None):
+        '''Blocks until the message is sent or has failed for good; returns its status.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(message_id)
+            if status is None or status["state"] != "queued":
+                return status
+            if deadline is not None and time.monotonic() >= deadline:
+                return status
+            time.sleep(0.1)
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._disconnect()
+
+    # SENDER
+
+    def _connect(self):
+        if self.security == "ssl":
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            if self.security == "starttls":
+                connection.starttls()
+        if self.password:
+            connection.login(self.username, self.password)
+        print(f"Outbox connected to {self.host}:{self.port}")
+        return connection
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _get_connection(self):
+        '''The open connection if the server still answers, else a new one.'''
+        # Counts as use even if the message is then refused, so the idle timer does not drop the session
+        self._last_used = time.monotonic()
+        if self._connection is not None:
+            try:
+                if self._connection.noop()[0] == 250:
+                    return self._connection
+            except Exception:
+                pass
+            self._connection = None
+        self._connection = self._connect()
+        return self._connection
+
+    def _due(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM messages WHERE state = 'queued' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), self.batch_size),
+            ).fetchall()
+
+    def _next_due_in(self):
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_attempt) FROM messages WHERE state = 'queued'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _mark(self, message_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE messages SET {assignments} WHERE id = ?", (*fields.values(), message_id))
+            self._db.commit()
+
+    def _build(self, row):
+        message = MIMEMultipart()
+        message["From"] = self.sender
+        message["To"] = row["recipient"]
+        message["Subject"] = row["subject"]
+        message.attach(MIMEText(row["body"], "plain"))
+        return message.as_string()
+
+    def _failed(self, row, error):
+        attempts = row["attempts"] + 1
+        if is_transient(error) and attempts < self.max_attempts:
+            delay = min(RETRY_CAP, RETRY_BASE * 2 ** (attempts - 1))
+            delay += random.uniform(0, delay * 0.25)
+            print(f"Email {row['id']} failed ({error}), retrying in {delay:.0f}s")
+            self._mark(row["id"], attempts=attempts, error=str(error), next_attempt=time.time() + delay)
+        else:
+            print(f"Email {row['id']} failed: {error}")
+            self._mark(row["id"], state="failed", attempts=attempts, error=str(error))
+
+    def _send_batch(self, rows):
+        for row in rows:
+            try:
+                connection = self._get_connection()
+                connection.sendmail(self.sender, [row["recipient"]], self._build(row))
+            except Exception as e:
+                # A rejected message leaves the session usable (smtplib resets it); anything else gets a fresh connection
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    self._disconnect()
+                self._failed(row, e)
+                continue
+            self._last_used = time.monotonic()
+            self._mark(row["id"], state="sent", attempts=row["attempts"] + 1, error=None, sent=time.time())
+            print(f"Email {row['id']} sent to {row['recipient']}")
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                timeout = self._step()
+            except Exception as e:
+                # The thread must outlive e.g. a locked database, or nothing would be sent until a restart
+                print(f"Outbox sender error: {type(e).__name__}: {e}")
+                self._disconnect()
+                timeout = ERROR_PAUSE
+            if timeout == 0:
+                continue
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _step(self):
+        '''Sends one batch of due messages; returns how long to sleep (None: until woken, 0: not at all).'''
+        rows = self._due()
+        if rows:
+            self._send_batch(rows)
+            return 0
+        if self._connection is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+            self._disconnect()
+        timeout = self._next_due_in()
+        if self._connection is not None:
+            idle_left = max(0.0, self.idle_timeout - (time.monotonic() - self._last_used))
+            timeout = idle_left if timeout is None else min(timeout, idle_left)
+        return timeout
+
+_default_outbox = None
+_default_outbox_lock = threading.Lock()
+
+def get_outbox():
+    global _default_outbox
+    with _default_outbox_lock:
+        if _default_outbox is None:
+            _default_outbox = Outbox()
+        return _default_outbox
@@ -0,0 +1,23 @@
+'''
+Streamlit view of the email outbox, kept apart from outbox.py so the API and workers can queue mail
+without importing Streamlit.
+'''
+
+import streamlit as st
+
+from outbox import get_outbox
+
+@st.fragment(run_every=2)
+def email_status(message_id):
+    '''Delivery status of a queued email, refreshed every two seconds.'''
+    status = get_outbox().status(message_id)
+    if status is None:
+        return
+    if status["state"] == "sent":
+        st.success("Email sent successfully!")
+    elif status["state"] == "failed":
+        st.error(f"Failed to send email: {status['error']}")
+    elif status["attempts"]:
+        st.warning(f"Email not sent yet, retrying ({status['error']})")
+    else:
+        st.info("Sending email...")
@@ -1,23 +1,26 @@
-from tavily import TavilyClient
 from dotenv import load_dotenv
-from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
+from typing_extensions import TypedDict
 from datetime import datetime
-from langchain.tools import tool
+from functools import lru_cache
+from langchain_core.tools import tool
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import asyncio
+from answer_cache import get_answer_cache
+from clients import get_llm, get_search_client
+from compression import compress_context
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o-mini")
-
-client = TavilyClient()
+RESEARCH_CACHE_TTL = float(os.getenv("RESEARCH_CACHE_TTL", str(24 * 3600)))
 
 # AGENTS & TOOLS
 
+def react_agent(tools):
+    # langgraph.prebuilt is slow to import, so agents are only built on first use
+    from langgraph.prebuilt import create_react_agent
+
+    return create_react_agent(model=get_llm(), tools=tools)
+
 # SEARCH
 
 @tool
@@ -30,36 +33,44 @@ def date():
 def search(query: str, max_results: int) -> str:
     '''Searches the web for results. Requires query and number of maximum results that should be set by relevance'''
     try:
-        results = client.search(query=query,max_results=max_results)
+        results = get_search_client().search(query=query,max_results=max_results)
         
         formatted_results = []
         for r in results["results"]:
             formatted_results.append(f"Title: {r['title']}\nURL: {r['url']}\nContent: {r.get('content', r.get('snippet', ''))}\n---")
         
-        return "\n".join(formatted_results)
+        return compress_context("\n".join(formatted_results), query)
     except Exception as e:
         return f"Web search failed: {str(e)}. Please try a different query."
     
-search_agent = create_react_agent(
-    model=llm,
-    tools=[date, search],
-)
+@lru_cache(maxsize=None)
+def get_search_agent():
+    return react_agent([date, search])
 
-@tool
-def search_agent_chain(query: str) -> str:
-    """Uses the Search Agent to gather information"""
-    response = search_agent.invoke({"messages": [
+def run_search_agent(query):
+    response = get_search_agent().invoke({"messages": [
         ("system", "You are a search agent. Your task is to gather information from the web."),
         ("human", query)
         ]})
     return response["messages"][-1].content
 
+@tool
+def search_agent_chain(query: str) -> str:
+    """Uses the Search Agent to gather information"""
+    return run_search_agent(query)
+
 # SYNTHESIZER
     
-synthesizer_agent = create_react_agent(
-    model=llm,
-    tools=[]
-)
+@lru_cache(maxsize=None)
+def get_synthesizer_agent():
+    return react_agent([])
+
+def run_synthesizer_agent(search_results, user_query):
+    response = get_synthesizer_agent().invoke({"messages": [
+        ("system", "You are a synthesizer agent. Your task is to create a coherent narrative from the search results."),
+        ("human", f"Search Results: {compress_context(search_results, user_query)}\nUser Query: {user_query}")
+    ]})
+    return response["messages"][-1].content
 
 @tool
 def synthesizer_agent_chain(search_results: str, user_query: str) -> str:
@@ -70,18 +81,20 @@ def synthesizer_agent_chain(search_results: str, user_query: str) -> str:
     Create coherent narrative addressing the user's query
     Organize information logically with clear structure
     '''
-    response = synthesizer_agent.invoke({"messages": [
-        ("system", "You are a synthesizer agent. Your task is to create a coherent narrative from the search results."),
-        ("human", f"Search Results: {search_results}\nUser Query: {user_query}")
-    ]})
-    return response["messages"][-1].content
+    return run_synthesizer_agent(search_results, user_query)
 
 # CITATIONS
 
-citation_agent = create_react_agent(
-    model=llm,
-    tools=[search]
-)
+@lru_cache(maxsize=None)
+def get_citation_agent():
+    return react_agent([search])
+
+def run_citation_agent(sources, style="APA"):
+    response = get_citation_agent().invoke({"messages": [
+        ("system", "You are a citation assistant. Your task is to format sources into proper citations."),
+        ("human", f"Sources: {compress_context(sources)}\nStyle: {style}")
+    ]})
+    return response["messages"][-1].content
 
 @tool
 def citation_agent_chain(sources: str, style: str = "APA") -> str:
@@ -98,18 +111,20 @@ def citation_agent_chain(sources: str, style: str = "APA") -> str:
     Assess domain authority/credibility
     Check publication dates
     '''
-    response = citation_agent.invoke({"messages": [
-        ("system", "You are a citation assistant. Your task is to format sources into proper citations."),
-        ("human", f"Sources: {sources}\nStyle: {style}")
-    ]})
-    return response["messages"][-1].content
+    return run_citation_agent(sources, style)
 
 # FACTS CHECK
 
-fact_checker_agent = create_react_agent(
-    model=llm,
-    tools=[search]
-)
+@lru_cache(maxsize=None)
+def get_fact_checker_agent():
+    return react_agent([search])
+
+def run_fact_checker_agent(claims, sources):
+    response = get_fact_checker_agent().invoke({"messages": [
+        ("system", "You are a fact-checking assistant. Your task is to verify claims against credible sources."),
+        ("human", f"Claims: {claims}\nSources: {compress_context(sources, claims)}")
+    ]})
+    return response["messages"][-1].content
 
 @tool
 def fact_checker_agent_chain(claims: str, sources: str) -> str:
@@ -120,18 +135,20 @@ def fact_checker_agent_chain(claims: str, sources: str) -> str:
     Search for additional sources to verify each claim
     Return confidence scores and conflicting information
     '''
-    response = fact_checker_agent.invoke({"messages": [
-        ("system", "You are a fact-checking assistant. Your task is to verify claims against credible sources."),
-        ("human", f"Claims: {claims}\nSources: {sources}")
-    ]})
-    return response["messages"][-1].content
+    return run_fact_checker_agent(claims, sources)
 
 # BIAS
 
-bias_detection_agent = create_react_agent(
-    model=llm,
-    tools=[search]
-)
+@lru_cache(maxsize=None)
+def get_bias_detection_agent():
+    return react_agent([search])
+
+def run_bias_detection_agent(content):
+    response = get_bias_detection_agent().invoke({"messages": [
+        ("system", "You are a bias detection assistant. Your task is to analyze content for potential bias indicators."),
+        ("human", f"Content: {content}")
+    ]})
+    return response["messages"][-1].content
 
 @tool
 def bias_detection_agent_chain(content: str) -> str:
@@ -142,41 +159,193 @@ def bias_detection_agent_chain(content: str) -> str:
     Identify missing counterarguments
     Flag potential conflicts of interest in sources
     '''
-    response = bias_detection_agent.invoke({"messages": [
-        ("system", "You are a bias detection assistant. Your task is to analyze content for potential bias indicators."),
-        ("human", f"Content: {content}")
-    ]})
-    return response["messages"][-1].content
+    return run_bias_detection_agent(content)
 
 # SUPERVISOR
 
-supervisor_agent = create_react_agent(
-    model=llm,
-    tools=[search_agent_chain, synthesizer_agent_chain, citation_agent_chain, fact_checker_agent_chain, bias_detection_agent_chain]
-)
+@lru_cache(maxsize=None)
+def get_supervisor_agent():
+    return react_agent([search_agent_chain, synthesizer_agent_chain, citation_agent_chain, fact_checker_agent_chain, bias_detection_agent_chain])
 
-# UI + Functionality
+# PIPELINE
 
-import streamlit as st
+class ResearchState(TypedDict, total=False):
+    topic: str
+    search_results: str
+    synthesis: str
+    citations: str
+    fact_check: str
+    bias: str
+    report: str
 
-def send_by_email(text:str, email:str):
-    sender_email = "aih235795@gmail.com"
-    receiver_email = os.getenv("SENDER_EMAIL")
-    app_password = os.getenv("GOOGLE_APP_PASSWORD")
+def search_step(state):
+    return {"search_results": run_search_agent(state["topic"])}
+
+def synthesize_step(state):
+    return {"synthesis": run_synthesizer_agent(state["search_results"], state["topic"])}
+
+def citations_step(state):
+    return {"citations": run_citation_agent(state["search_results"])}
+
+def fact_check_step(state):
+    return {"fact_check": run_fact_checker_agent(state["synthesis"], state["search_results"])}
 
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = receiver_email
-    message["Subject"] = "Research"
+def bias_step(state):
+    return {"bias": run_bias_detection_agent(state["synthesis"])}
 
-    body = text
-    message.attach(MIMEText(body, "plain"))
+def merge_step(state):
+    report = (
+        f"{state['synthesis']}\n\n"
+        f"## Sources\n\n{state['citations']}\n\n"
+        f"## Fact Check\n\n{state['fact_check']}\n\n"
+        f"## Bias Analysis\n\n{state['bias']}"
+    )
+    return {"report": report}
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(sender_email, app_password)
-        server.sendmail(sender_email, receiver_email, message.as_string())
+@lru_cache(maxsize=None)
+def get_research_graph():
+    '''
+    search -> synthesize -> (citation_agent | fact_checker_agent | bias_detection_agent) -> merge
+    The three analysis steps only need the search results and the synthesis, so they run concurrently.
+    '''
+    from langgraph.graph import StateGraph, START, END
+
+    graph = StateGraph(ResearchState)
+    graph.add_node("search", search_step)
+    graph.add_node("synthesize", synthesize_step)
+    graph.add_node("citation_agent", citations_step)
+    graph.add_node("fact_checker_agent", fact_check_step)
+    graph.add_node("bias_detection_agent", bias_step)
+    graph.add_node("merge", merge_step)
+
+    graph.add_edge(START, "search")
+    graph.add_edge("search", "synthesize")
+    analysis_steps = ["citation_agent", "fact_checker_agent", "bias_detection_agent"]
+    for step in analysis_steps:
+        graph.add_edge("synthesize", step)
+    graph.add_edge(analysis_steps, "merge")
+    graph.add_edge("merge", END)
+    return graph.compile()
+
+# RESEARCH
+
+RESEARCH_MODES = {"pipeline": "Pipeline", "supervisor": "Supervisor agent"}
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "pipeline")
+
+SUPERVISOR_PROMPT = (
+    "You are a world-class web research assistant. Your task is to perform thorough, unbiased, and up-to-date research on any topic provided by the user."
+    "Your workflow consists of **five steps**, and you must execute each one **in order**, using the corresponding tool:"
+
+    "1) **Search**: Use `search_tool` to find relevant and credible sources. Return only factual search results."
+    "2) **Synthesize**: Use `synthesizer_tool` to generate a clear, structured, and comprehensive summary of the search results."
+    "3) **Citations**: Use `citation_tool` to format and validate references for the summarized content."
+    "4) **Fact-Check**: Use `fact_checker_tool` to verify key claims and indicate confidence levels."
+    "5) **Bias Analysis**: Use `bias_analyzer_tool` to highlight potential bias or conflicting information."
+
+    "**Rules:**"
+    "- Do **not skip any step**."
+    "- Use the tool explicitly assigned for each step; do not invent steps or tools."
+    "- Cite all sources and indicate confidence levels."
+    "- Clearly state limitations if information is unavailable or uncertain."
+    "- Use concise, professional language and organize output for easy understanding."
+
+    "When a step is completed, return only the information required for the next tool or the final output. Do not generate unrelated content."
+)
 
-    # st.write("Email sent!")  # Removed to avoid duplicate feedback
+STAGE_LABELS = {
+    "search": "Searching the web",
+    "synthesize": "Synthesizing the results",
+    "citation_agent": "Formatting citations",
+    "fact_checker_agent": "Fact-checking claims",
+    "bias_detection_agent": "Analyzing bias",
+    "merge": "Assembling the report",
+}
+
+def stream_research(topic, mode=RESEARCH_MODE):
+    '''
+    Runs the same workflow as research() and yields progress events:
+    ("stage", name) when a step finishes, ("token", text) for the synthesis as it is written
+    (pipeline mode), and finally ("result", report).
+    '''
+    if mode == "pipeline":
+        report = None
+        for stream_mode, payload in get_research_graph().stream({"topic": topic}, stream_mode=["updates", "messages"]):
+            if stream_mode == "messages":
+                message, metadata = payload
+                # Tokens come from the agent nested inside the node; its namespace starts with the node name
+                if metadata.get("langgraph_checkpoint_ns", "").split(":")[0] == "synthesize" and message.content:
+                    yield "token", message.content
+                continue
+            for node, update in payload.items():
+                yield "stage", node
+                if node == "merge":
+                    report = update["report"]
+        yield "result", report
+        return
+
+    result = None
+    for update in get_supervisor_agent().stream({"messages": [
+        ("system", SUPERVISOR_PROMPT),
+        ("human", topic)
+    ]}, stream_mode="updates"):
+        for node, value in update.items():
+            message = value["messages"][-1]
+            for tool_call in getattr(message, "tool_calls", None) or []:
+                yield "stage", tool_call["name"]
+            if node == "agent" and not getattr(message, "tool_calls", None):
+                result = message.content
+    yield "result", result
+
+def research(topic, mode=RESEARCH_MODE):
+    if mode == "pipeline":
+        return get_research_graph().invoke({"topic": topic})["report"]
+    result = get_supervisor_agent().invoke({"messages": [
+        ("system", SUPERVISOR_PROMPT),
+        ("human", topic)
+    ]})
+    return result["messages"][-1].content
+
+def cached_research(topic, mode=RESEARCH_MODE):
+    answer_cache = get_answer_cache()
+    report = answer_cache.get("research", mode, topic, ttl=RESEARCH_CACHE_TTL)
+    if report is None:
+        report = research(topic, mode)
+        answer_cache.put("research", mode, topic, report)
+    return report
+
+def research_job(ctx, topic, mode=RESEARCH_MODE):
+    '''Background job version of the Search button: reports each finished step as progress and honours cancellation.'''
+    answer_cache = get_answer_cache()
+    cached = answer_cache.get("research", mode, topic, ttl=RESEARCH_CACHE_TTL)
+    if cached is not None:
+        return cached
+
+    # The supervisor calls one tool per step, the pipeline runs every node in STAGE_LABELS
+    total_stages = len(STAGE_LABELS) if mode == "pipeline" else 5
+    finished_stages = 0
+    result = None
+    ctx.progress(0, "Starting research")
+    for kind, payload in stream_research(topic, mode):
+        if kind == "stage":
+            finished_stages += 1
+            ctx.progress(finished_stages / total_stages, STAGE_LABELS.get(payload, payload))
+        elif kind == "token":
+            ctx.check()
+        else:
+            result = payload
+    answer_cache.put("research", mode, topic, result)
+    return result
+
+# UI + Functionality
+
+import streamlit as st
+from jobs import JobLimitReached, current_user, get_job_manager, jobs_panel
+from outbox import get_outbox
+from outbox_ui import email_status
+
+def send_by_email(text:str, email:str):
+    '''Queues the research in the outbox and returns the message ID; delivery happens in the background.'''
+    return get_outbox().send(email, "Research", text)
 
 
 def run(col2):
@@ -188,43 +357,63 @@ def run(col2):
             st.session_state.research_topic = ""
             
         topic = st.text_input("What Would You Like To Research")
+        mode = st.radio(
+            "Research mode",
+            list(RESEARCH_MODES),
+            index=list(RESEARCH_MODES).index(RESEARCH_MODE),
+            format_func=RESEARCH_MODES.get,
+            horizontal=True,
+        )
+        background = st.checkbox("Run in background", help="Keep working while the research runs; results appear below when done.")
         search = st.button("Search")
         
-        if search and topic:
-            with st.spinner("Researching..."):
+        if search and topic and background:
+            try:
+                get_job_manager().submit(current_user(), "research", research_job, label=topic, topic=topic, mode=mode)
+                st.toast("Research queued")
+            except JobLimitReached as e:
+                st.error(str(e))
+        elif search and topic:
+            with st.status("Researching...", expanded=True) as status:
                 try:
-                    result = supervisor_agent.invoke(
-                        {"messages": [
-                            ("system", 
-                             "You are a world-class web research assistant. Your task is to perform thorough, unbiased, and up-to-date research on any topic provided by the user."
-                             "Your workflow consists of **five steps**, and you must execute each one **in order**, using the corresponding tool:"
-
-                             "1) **Search**: Use `search_tool` to find relevant and credible sources. Return only factual search results."
-                             "2) **Synthesize**: Use `synthesizer_tool` to generate a clear, structured, and comprehensive summary of the search results."
-                             "3) **Citations**: Use `citation_tool` to format and validate references for the summarized content."
-                             "4) **Fact-Check**: Use `fact_checker_tool` to verify key claims and indicate confidence levels."
-                             "5) **Bias Analysis**: Use `bias_analyzer_tool` to highlight potential bias or conflicting information."
-
-                             "**Rules:**"
-                             "- Do **not skip any step**."
-                             "- Use the tool explicitly assigned for each step; do not invent steps or tools."
-                             "- Cite all sources and indicate confidence levels."
-                             "- Clearly state limitations if information is unavailable or uncertain."
-                             "- Use concise, professional language and organize output for easy understanding."
-
-                             "When a step is completed, return only the information required for the next tool or the final output. Do not generate unrelated content."
-                            ),
-                            ("human", topic)
-                        ]})
-                    
-                    st.session_state.research_result = result["messages"][-1].content
-                    st.session_state.research_topic = topic
-                    
-                    st.success("Research completed!")
+                    answer_cache = get_answer_cache()
+                    cached = answer_cache.get("research", mode, topic, ttl=RESEARCH_CACHE_TTL)
+                    if cached is not None:
+                        st.session_state.research_result = cached
+                        st.session_state.research_topic = topic
+                        status.update(label="Research loaded from cache!", state="complete", expanded=False)
+                    else:
+                        synthesis = st.empty()
+                        synthesis_text = ""
+                        result = None
+                        for kind, payload in stream_research(topic, mode):
+                            if kind == "stage":
+                                label = STAGE_LABELS.get(payload, payload)
+                                st.write(f"✔ {label}")
+                                status.update(label=f"{label}...")
+                            elif kind == "token":
+                                synthesis_text += payload
+                                synthesis.markdown(synthesis_text)
+                            else:
+                                result = payload
+                        synthesis.empty()
+                        answer_cache.put("research", mode, topic, result)
+
+                        st.session_state.research_result = result
+                        st.session_state.research_topic = topic
+
+                        status.update(label="Research completed!", state="complete", expanded=False)
                     
                 except Exception as e:
+                    status.update(label="Research failed", state="error")
                     st.error(f"Research failed: {str(e)}")
         
+        def open_job(job):
+            st.session_state.research_result = job["result"]
+            st.session_state.research_topic = job["params"]["topic"]
+
+        jobs_panel("research", open_job)
+
         if st.session_state.research_result is not None:
             st.subheader(f"Research Results for: {st.session_state.research_topic}")
             st.write(st.session_state.research_result)
@@ -234,11 +423,9 @@ def run(col2):
                 email = st.text_input("Enter Your Email")
                 send = st.button("Send")
                 if send and email:
-                    try:
-                        send_by_email(st.session_state.research_result, email)
-                        st.success("Email sent successfully!")
-                    except Exception as e:
-                        st.error(f"Failed to send email: {str(e)}")
+                    st.session_state.research_email_id = send_by_email(st.session_state.research_result, email)
+                if st.session_state.get("research_email_id"):
+                    email_status(st.session_state.research_email_id)
 
             if st.button("Clear Results"):
                 st.session_state.research_result = None
@@ -0,0 +1,391 @@
+'''
+Central scheduler for OpenAI requests. Every chat and embedding call goes through one shared httpx
+transport (see clients.py), which waits for a slot in request- and token-per-minute buckets (one
+pair per endpoint and model), serves interactive callers before bulk jobs, and retries 429/5xx
+responses after Retry-After with jittered exponential backoff, pausing the whole bucket meanwhile.
+Connection errors and timeouts are retried with the same backoff, without pausing anyone else.
+'''
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from tracing import start_span
+
+CHAT_RPM = float(os.getenv("OPENAI_RPM", "500"))
+CHAT_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+EMBEDDING_RPM = float(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = float(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Connection resets, DNS failures, timeouts; not e.g. an unsupported URL scheme
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+# Output tokens are unknown up front; requests without max_tokens are charged this much
+DEFAULT_COMPLETION_TOKENS = 512
+CHARS_PER_TOKEN = 4
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+_priority = ContextVar("llm_priority", default=INTERACTIVE)
+
+@contextmanager
+def priority(level):
+    '''LLM and embedding calls made inside the block (and in threads/tasks started from it) use this priority.'''
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def limit(self, remaining):
+        '''Trusts the server's own count when it has less left than we think.'''
+        self.level = min(self.level, remaining)
+
+class RateLimit:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.waiters = []
+
+class Scheduler:
+    def __init__(self, limits=None):
+        self.limits = limits or {"chat": (CHAT_RPM, CHAT_TPM), "embeddings": (EMBEDDING_RPM, EMBEDDING_TPM)}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._rate_limits = {}
+        self._sequence = itertools.count()
+        self._wait_seconds = {}
+        self._granted = {}
+        self._rate_limited = 0
+        self._retries = 0
+
+    def _rate_limit(self, key):
+        rate_limit = self._rate_limits.get(key)
+        if rate_limit is None:
+            rate_limit = self._rate_limits[key] = RateLimit(*self.limits[key[0]])
+        return rate_limit
+
+    def _register(self, key, cost, level):
+        with self._lock:
+            waiter = (level, next(self._sequence), cost)
+            heapq.heappush(self._rate_limit(key).waiters, waiter)
+            return waiter
+
+    def _poll(self, key, waiter):
+        '''Grants the slot and returns 0 if waiter is first in line and the buckets allow it; else seconds to wait.'''
+        rate_limit = self._rate_limits[key]
+        if rate_limit.waiters[0] is not waiter:
+            return None
+        now = time.monotonic()
+        wait = max(
+            rate_limit.paused_until - now,
+            rate_limit.requests.wait_time(1, now),
+            rate_limit.tokens.wait_time(waiter[2], now),
+        )
+        if wait > 0:
+            return wait
+        rate_limit.requests.take(1)
+        rate_limit.tokens.take(waiter[2])
+        heapq.heappop(rate_limit.waiters)
+        self._condition.notify_all()
+        return 0.0
+
+    def _granted_after(self, level, started, wait_span):
+        waited = time.monotonic() - started
+        name = PRIORITY_NAMES.get(level, str(level))
+        self._wait_seconds[name] = self._wait_seconds.get(name, 0.0) + waited
+        self._granted[name] = self._granted.get(name, 0) + 1
+        # Only waits long enough to matter show up in traces
+        if waited > 0.01:
+            wait_span.set(seconds=waited)
+            wait_span.finish()
+
+    def acquire(self, key, cost):
+        level = _priority.get()
+        started = time.monotonic()
+        wait_span = start_span("rate_limit_wait", endpoint=key[0], model=key[1], priority=PRIORITY_NAMES.get(level))
+        waiter = self._register(key, cost, level)
+        with self._condition:
+            while True:
+                wait = self._poll(key, waiter)
+                if wait == 0:
+                    break
+                self._condition.wait(timeout=wait)
+            self._granted_after(level, started, wait_span)
+
+    async def aacquire(self, key, cost):
+        level = _priority.get()
+        started = time.monotonic()
+        wait_span = start_span("rate_limit_wait", endpoint=key[0], model=key[1], priority=PRIORITY_NAMES.get(level))
+        waiter = self._register(key, cost, level)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._poll(key, waiter)
+                    if wait == 0:
+                        self._granted_after(level, started, wait_span)
+                        return
+                # Not first in line: check again shortly; the event loop thread must not block on the condition
+                await asyncio.sleep(0.05 if wait is None else min(wait, 0.25))
+        except asyncio.CancelledError:
+            self._withdraw(key, waiter)
+            raise
+
+    def _withdraw(self, key, waiter):
+        with self._lock:
+            waiters = self._rate_limits[key].waiters
+            if waiter in waiters:
+                waiters.remove(waiter)
+                heapq.heapify(waiters)
+                self._condition.notify_all()
+
+    def pause(self, key, seconds):
+        '''After a 429 nobody may use the bucket until the server said it is safe again.'''
+        with self._lock:
+            rate_limit = self._rate_limit(key)
+            rate_limit.paused_until = max(rate_limit.paused_until, time.monotonic() + seconds)
+            self._retries += 1
+
+    def count_retry(self):
+        with self._lock:
+            self._retries += 1
+
+    def observe(self, key, response):
+        with self._lock:
+            rate_limit = self._rate_limit(key)
+            if response.status_code == 429:
+                self._rate_limited += 1
+            for header, bucket in (
+                ("x-ratelimit-remaining-requests", rate_limit.requests),
+                ("x-ratelimit-remaining-tokens", rate_limit.tokens),
+            ):
+                remaining = response.headers.get(header)
+                if remaining is not None:
+                    try:
+                        bucket.limit(float(remaining))
+                    except ValueError:
+                        pass
+
+    def render_prometheus(self):
+        with self._lock:
+            depth = {}
+            for (endpoint, model), rate_limit in self._rate_limits.items():
+                for level, _, _ in rate_limit.waiters:
+                    label = (endpoint, model, PRIORITY_NAMES.get(level, str(level)))
+                    depth[label] = depth.get(label, 0) + 1
+            lines = [
+                "# HELP ai_helper_llm_queue_depth Requests waiting for a rate limit slot.",
+                "# TYPE ai_helper_llm_queue_depth gauge",
+            ]
+            for (endpoint, model), rate_limit in sorted(self._rate_limits.items()):
+                for name in PRIORITY_NAMES.values():
+                    count = depth.get((endpoint, model, name), 0)
+                    lines.append(f'ai_helper_llm_queue_depth{{endpoint="{endpoint}",model="{model}",priority="{name}"}} {count}')
+            lines += ["# HELP ai_helper_llm_wait_seconds Time spent waiting for a rate limit slot.", "# TYPE ai_helper_llm_wait_seconds summary"]
+            for name in sorted(self._granted):
+                lines.append(f'ai_helper_llm_wait_seconds_sum{{priority="{name}"}} {self._wait_seconds[name]:.6f}')
+                lines.append(f'ai_helper_llm_wait_seconds_count{{priority="{name}"}} {self._granted[name]}')
+            lines += [
+                "# HELP ai_helper_llm_rate_limited_total Responses with status 429.",
+                "# TYPE ai_helper_llm_rate_limited_total counter",
+                f"ai_helper_llm_rate_limited_total {self._rate_limited}",
+                "# HELP ai_helper_llm_retries_total Requests retried after a 429, 5xx, connection error or timeout.",
+                "# TYPE ai_helper_llm_retries_total counter",
+                f"ai_helper_llm_retries_total {self._retries}",
+            ]
+        return "\n".join(lines) + "\n"
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler()
+        return _default_scheduler
+
+# HTTP TRANSPORT
+
+def classify(request):
+    '''(("chat" | "embeddings", model), estimated tokens) for OpenAI API calls, (None, 0) for anything else.'''
+    path = request.url.path
+    if path.endswith("/chat/completions"):
+        endpoint = "chat"
+    elif path.endswith("/embeddings"):
+        endpoint = "embeddings"
+    else:
+        return None, 0
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        body = {}
+    if endpoint == "chat":
+        prompt_chars = sum(len(json.dumps(message.get("content", ""))) for message in body.get("messages", []))
+        completion = body.get("max_completion_tokens") or body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+        cost = prompt_chars // CHARS_PER_TOKEN + completion
+    else:
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        # Token ids (lists of ints) count one per id
+        cost = sum(len(text) if isinstance(text, list) else len(text) // CHARS_PER_TOKEN for text in texts)
+    return (endpoint, body.get("model", "")), max(cost, 1)
+
+def backoff_delay(attempt):
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+    return delay + random.uniform(0, delay * 0.25)
+
+def retry_delay(response, attempt):
+    '''Retry-After (seconds or HTTP date) or retry-after-ms if the server sent one, else exponential backoff; plus jitter.'''
+    delay = None
+    if response.headers.get("retry-after-ms"):
+        try:
+            delay = float(response.headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if delay is None and response.headers.get("retry-after"):
+        value = response.headers["retry-after"]
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    if delay is None or delay < 0:
+        return backoff_delay(attempt)
+    return delay + random.uniform(0, delay * 0.25)
+
+class ScheduledTransport(httpx.BaseTransport):
+    def __init__(self, transport, scheduler=None, max_retries=MAX_RETRIES):
+        self.transport = transport
+        self.scheduler = scheduler or get_scheduler()
+        self.max_retries = max_retries
+
+    def handle_request(self, request):
+        key, cost = classify(request)
+        if key is None:
+            return self.transport.handle_request(request)
+        for attempt in range(self.max_retries + 1):
+            self.scheduler.acquire(key, cost)
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"OpenAI request failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                self.scheduler.count_retry()
+                time.sleep(delay)
+                continue
+            self.scheduler.observe(key, response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = retry_delay(response, attempt)
+            print(f"OpenAI returned {response.status_code}, retrying in {delay:.1f}s")
+            response.close()
+            self.scheduler.pause(key, delay)
+
+    def close(self):
+        self.transport.close()
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, scheduler=None, max_retries=MAX_RETRIES):
+        self.transport = transport
+        self.scheduler = scheduler or get_scheduler()
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request):
+        key, cost = classify(request)
+        if key is None:
+            return await self.transport.handle_async_request(request)
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.aacquire(key, cost)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"OpenAI request failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                self.scheduler.count_retry()
+                await asyncio.sleep(delay)
+                continue
+            self.scheduler.observe(key, response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = retry_delay(response, attempt)
+            print(f"OpenAI returned {response.status_code}, retrying in {delay:.1f}s")
+            await response.aclose()
+            self.scheduler.pause(key, delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    '''
+    One connection pool per event loop. Pooled connections belong to the loop that opened them, and the
+    sync wrappers (web_scraper.parse_with_ai, the crawler) run every call in a new loop with asyncio.run(),
+    so a single shared pool fails with "Event loop is closed" on the second call.
+    '''
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._transports = {}
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Pools of finished loops cannot be closed any more (their loop is gone), only dropped
+            for key, (other, _) in list(self._transports.items()):
+                if other.is_closed():
+                    del self._transports[key]
+            entry = self._transports.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                entry = self._transports[id(loop)] = (loop, self.factory())
+            return entry[1]
+
+    async def handle_async_request(self, request):
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._transports.pop(id(loop), None)
+        if entry is not None:
+            await entry[1].aclose()
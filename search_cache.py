@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from tracing import span
+
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search.sqlite3")
+CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def _covers(max_results, results, requested):
+    # A cached response answers any request for fewer results, and also larger ones
+    # when the search already returned fewer hits than it was allowed to
+    return max_results >= requested or len(results) < max_results
+
+def _sliced(response, max_results):
+    return dict(response, results=response.get("results", [])[:max_results])
+
+class CachedSearchClient:
+    '''
+    Drop-in wrapper around TavilyClient.search with an LRU + TTL cache persisted in SQLite.
+    Concurrent identical requests share a single in-flight call, and a cached or in-flight
+    search with a larger max_results answers later requests for fewer results.
+    '''
+
+    def __init__(self, client, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "query TEXT PRIMARY KEY, max_results INTEGER NOT NULL, response TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _lookup(self, key, now):
+        entry = self._memory.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT max_results, response, created FROM searches WHERE query = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = (row[0], json.loads(row[1]), row[2])
+                self._memory[key] = entry
+        if entry is None:
+            return None
+        if now - entry[2] > self.ttl:
+            self._memory.pop(key, None)
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _store(self, key, max_results, response, now):
+        previous = self._lookup(key, now)
+        if previous is not None and _covers(previous[0], previous[1].get("results", []), max_results):
+            # Never replace a larger cached response with a smaller one
+            return
+        self._memory[key] = (max_results, response, now)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO searches (query, max_results, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, max_results, json.dumps(response), now, now),
+            )
+            self._db.execute("DELETE FROM searches WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM searches WHERE query NOT IN (SELECT query FROM searches ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def search(self, query, max_results=5, **kwargs):
+        if kwargs:
+            # Other search options are not part of the cache key
+            with span("web_search", query=query, max_results=max_results):
+                return self.client.search(query=query, max_results=max_results, **kwargs)
+
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None and _covers(entry[0], entry[1].get("results", []), max_results):
+                if self._db is not None:
+                    self._db.execute("UPDATE searches SET last_used = ? WHERE query = ?", (now, key))
+                    self._db.commit()
+                return _sliced(entry[1], max_results)
+
+            flight = self._in_flight.get(key)
+            if flight is not None and flight[0] >= max_results:
+                future, owner = flight[1], False
+            else:
+                future, owner = Future(), True
+                self._in_flight[key] = (max_results, future)
+
+        if not owner:
+            return _sliced(future.result(), max_results)
+
+        try:
+            with span("web_search", query=query, max_results=max_results):
+                response = self.client.search(query=query, max_results=max_results)
+        except BaseException as e:
+            with self._lock:
+                self._finish_flight(key, future)
+            future.set_exception(e)
+            raise
+
+        # Stored before the flight ends, so a request arriving in between finds the cached response
+        with self._lock:
+            self._store(key, max_results, response, time.time())
+            self._finish_flight(key, future)
+        future.set_result(response)
+        return _sliced(response, max_results)
+
+    def _finish_flight(self, key, future):
+        if self._in_flight.get(key, (None, None))[1] is future:
+            del self._in_flight[key]
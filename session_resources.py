@@ -0,0 +1,283 @@
+'''
+Keeps the heavy per-session objects (scraped page text, RAG chains) out of st.session_state so their
+memory can be accounted for and reclaimed. Every resource has an approximate size; when a session goes
+over SESSION_MEMORY_LIMIT_MB, all sessions together go over SESSIONS_MEMORY_LIMIT_MB, or a session has
+been idle for SESSION_IDLE_SECONDS, the least recently used resources are evicted. Evicted text is
+spilled to disk and objects with a rebuild function (e.g. a QA chain over a persisted vector store) are
+dropped; both come back transparently on the next get(). Sessions idle for SESSION_TTL_SECONDS whose
+tab Streamlit reports as closed are purged together with their spill files; an idle tab that is still
+open keeps its spilled text on disk for as long as it stays open.
+'''
+
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+SESSIONS_MEMORY_LIMIT_MB = float(os.getenv("SESSIONS_MEMORY_LIMIT_MB", "512"))
+SESSION_MEMORY_LIMIT_MB = float(os.getenv("SESSION_MEMORY_LIMIT_MB", "128"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", ".cache/sessions")
+# Spill directories left behind by earlier processes are deleted after this long
+SESSION_SPILL_TTL = float(os.getenv("SESSION_SPILL_TTL", str(24 * 3600)))
+
+def approximate_size(value):
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approximate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def session_connected(session_id):
+    '''False once Streamlit reports the session's tab closed, None outside a running Streamlit server.'''
+    if "streamlit" not in sys.modules:
+        return None
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():
+        return None
+    return Runtime.instance().is_active_session(session_id)
+
+def resident_memory():
+    '''Resident set size of the whole process in bytes (Linux), or None.'''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class Resource:
+    def __init__(self, value, size, rebuild):
+        self.value = value
+        self.size = size
+        self.rebuild = rebuild
+        self.spill_path = None
+        self.last_used = time.monotonic()
+
+    @property
+    def resident(self):
+        return self.value is not None
+
+class SessionResources:
+    def __init__(self, memory_limit_mb=SESSIONS_MEMORY_LIMIT_MB, session_limit_mb=SESSION_MEMORY_LIMIT_MB,
+                 idle_seconds=SESSION_IDLE_SECONDS, ttl_seconds=SESSION_TTL_SECONDS, spill_dir=SESSION_SPILL_DIR,
+                 is_connected=session_connected):
+        self.memory_limit = int(memory_limit_mb * 1024 * 1024)
+        self.session_limit = int(session_limit_mb * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self.ttl_seconds = ttl_seconds
+        self.is_connected = is_connected
+        # Spill files are per process, so a restart never picks up another run's files
+        self.spill_dir = os.path.join(spill_dir, uuid.uuid4().hex)
+        self._resources = {}
+        self._last_active = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+        self.purged_sessions = 0
+        self._remove_stale_spills(spill_dir)
+
+    def _remove_stale_spills(self, spill_dir):
+        if not os.path.isdir(spill_dir):
+            return
+        cutoff = time.time() - SESSION_SPILL_TTL
+        for name in os.listdir(spill_dir):
+            path = os.path.join(spill_dir, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def put(self, session_id, name, value, size=None, rebuild=None):
+        '''
+        Stores a resource for the session. `rebuild()` recreates the value after eviction; without it,
+        the value must be text and is spilled to disk instead.
+        '''
+        if rebuild is None and not isinstance(value, str):
+            raise TypeError(f"{name}: only text can be spilled to disk, pass rebuild= for other objects")
+        with self._lock:
+            self.discard(session_id, name)
+            resource = Resource(value, size if size is not None else approximate_size(value), rebuild)
+            self._resources[(session_id, name)] = resource
+            self._last_active[session_id] = resource.last_used
+            self._enforce(keep=(session_id, name))
+
+    def has(self, session_id, name):
+        '''True if the resource exists, resident or evicted.'''
+        with self._lock:
+            return (session_id, name) in self._resources
+
+    def get(self, session_id, name, default=None):
+        with self._lock:
+            resource = self._resources.get((session_id, name))
+            if resource is None:
+                return default
+            resource.last_used = self._last_active[session_id] = time.monotonic()
+            if not resource.resident:
+                self._reload(resource)
+                self._enforce(keep=(session_id, name))
+            return resource.value
+
+    def discard(self, session_id, name):
+        with self._lock:
+            resource = self._resources.pop((session_id, name), None)
+            if resource is not None and resource.spill_path:
+                self._remove_spill(resource)
+
+    def touch(self, session_id):
+        '''Marks the session as active without using any resource, e.g. on every rerun.'''
+        with self._lock:
+            self._last_active[session_id] = time.monotonic()
+            self._enforce()
+
+    # EVICTION
+
+    def _reload(self, resource):
+        if resource.rebuild is not None:
+            resource.value = resource.rebuild()
+        else:
+            with open(resource.spill_path, encoding="utf-8") as f:
+                resource.value = f.read()
+            self._remove_spill(resource)
+        self.reloads += 1
+
+    def _remove_spill(self, resource):
+        try:
+            os.remove(resource.spill_path)
+        except OSError:
+            pass
+        resource.spill_path = None
+
+    def _evict(self, key):
+        resource = self._resources[key]
+        if resource.rebuild is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            resource.spill_path = os.path.join(self.spill_dir, f"{uuid.uuid4().hex}.txt")
+            with open(resource.spill_path, "w", encoding="utf-8") as f:
+                f.write(resource.value)
+        resource.value = None
+        self.evictions += 1
+
+    def _resident(self, session_id=None):
+        return [
+            (key, resource) for key, resource in self._resources.items()
+            if resource.resident and (session_id is None or key[0] == session_id)
+        ]
+
+    def _evict_lru(self, candidates, limit, keep):
+        '''Evicts the least recently used candidates until their total is within limit.'''
+        total = sum(resource.size for _, resource in candidates)
+        for key, resource in sorted(candidates, key=lambda item: item[1].last_used):
+            if total <= limit:
+                break
+            if key == keep:
+                continue
+            self._evict(key)
+            total -= resource.size
+
+    def _purge_expired(self, now, keep):
+        '''
+        Forgets closed sessions idle for longer than ttl_seconds, resources and spill files included.
+        Sessions that may still be open are left alone: idle eviction has already moved them to disk.
+        '''
+        expired = {
+            session_id for session_id, last_active in self._last_active.items()
+            if now - last_active > self.ttl_seconds and (keep is None or session_id != keep[0])
+            and self.is_connected(session_id) is False
+        }
+        if not expired:
+            return
+        for key in [key for key in self._resources if key[0] in expired]:
+            self.discard(*key)
+        for session_id in expired:
+            del self._last_active[session_id]
+        self.purged_sessions += len(expired)
+        print(f"Purged {len(expired)} idle sessions")
+
+    def _enforce(self, keep=None):
+        now = time.monotonic()
+        self._purge_expired(now, keep)
+        for key, resource in self._resident():
+            if key != keep and now - self._last_active.get(key[0], 0) > self.idle_seconds:
+                self._evict(key)
+        for session_id in {key[0] for key, _ in self._resident()}:
+            self._evict_lru(self._resident(session_id), self.session_limit, keep)
+        self._evict_lru(self._resident(), self.memory_limit, keep)
+
+    # METRICS
+
+    def stats(self):
+        with self._lock:
+            resident = self._resident()
+            return {
+                "sessions": len({key[0] for key in self._resources}),
+                "resident_bytes": sum(resource.size for _, resource in resident),
+                "evicted_resources": len(self._resources) - len(resident),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "purged_sessions": self.purged_sessions,
+                "process_resident_bytes": resident_memory(),
+            }
+
+    def render_prometheus(self):
+        stats = self.stats()
+        lines = [
+            "# HELP ai_helper_session_resident_bytes Approximate memory held by session resources.",
+            "# TYPE ai_helper_session_resident_bytes gauge",
+            f"ai_helper_session_resident_bytes {stats['resident_bytes']}",
+            "# HELP ai_helper_sessions Sessions holding resources.",
+            "# TYPE ai_helper_sessions gauge",
+            f"ai_helper_sessions {stats['sessions']}",
+            "# HELP ai_helper_session_evictions_total Session resources evicted from memory.",
+            "# TYPE ai_helper_session_evictions_total counter",
+            f"ai_helper_session_evictions_total {stats['evictions']}",
+            "# HELP ai_helper_session_reloads_total Evicted session resources loaded again.",
+            "# TYPE ai_helper_session_reloads_total counter",
+            f"ai_helper_session_reloads_total {stats['reloads']}",
+            "# HELP ai_helper_sessions_purged_total Idle sessions whose resources were deleted.",
+            "# TYPE ai_helper_sessions_purged_total counter",
+            f"ai_helper_sessions_purged_total {stats['purged_sessions']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+def render_process_prometheus():
+    rss = resident_memory()
+    if rss is None:
+        return ""
+    return (
+        "# HELP ai_helper_process_resident_bytes Resident set size of the process.\n"
+        "# TYPE ai_helper_process_resident_bytes gauge\n"
+        f"ai_helper_process_resident_bytes {rss}\n"
+    )
+
+_default_resources = None
+_default_resources_lock = threading.Lock()
+
+def get_session_resources():
+    global _default_resources
+    with _default_resources_lock:
+        if _default_resources is None:
+            _default_resources = SessionResources()
+        return _default_resources
+
+# UI
+
+def current_session_id():
+    '''The Streamlit session running this script (one per browser tab).'''
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+def memory_panel():
+    import streamlit as st
+
+    stats = get_session_resources().stats()
+    with st.sidebar:
+        caption = f"Session memory: {stats['resident_bytes'] / 1024 / 1024:.1f} MB in {stats['sessions']} sessions"
+        if stats["evicted_resources"]:
+            caption += f", {stats['evicted_resources']} evicted"
+        if stats["process_resident_bytes"] is not None:
+            caption += f" · process RSS {stats['process_resident_bytes'] / 1024 / 1024:.0f} MB"
+        st.caption(caption)
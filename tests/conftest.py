@@ -0,0 +1,23 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+# The API clients check for keys at construction; tests never reach the real services
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+
+import pytest
+
+import clients
+
+
+@pytest.fixture
+def fake_llm():
+    from fakes import FakeChatModel
+
+    llm = FakeChatModel(latency=0, response_words=20)
+    clients.set_override("llm", llm)
+    yield llm
+    clients.set_override("llm", None)
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import research
+from answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(path=str(tmp_path / "answers.sqlite3"))
+
+
+def test_hit_for_normalized_query(cache):
+    cache.put("rag", "scope", "What is the revenue?", "42")
+    assert cache.get("rag", "scope", "  what is   the REVENUE ") == "42"
+
+
+def test_scope_and_namespace_are_part_of_the_key(cache):
+    cache.put("rag", "documents-a", "question", "a")
+    assert cache.get("rag", "documents-b", "question") is None
+    assert cache.get("research", "documents-a", "question") is None
+
+
+def test_entries_expire(cache):
+    cache.put("research", "graph", "topic", "report")
+    assert cache.get("research", "graph", "topic", ttl=60) == "report"
+    time.sleep(0.05)
+    assert cache.get("research", "graph", "topic", ttl=0.01) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnswerCache(path=str(tmp_path / "answers.sqlite3"), max_entries=2)
+    cache.put("rag", "s", "one", "1")
+    time.sleep(0.01)
+    cache.put("rag", "s", "two", "2")
+    time.sleep(0.01)
+    cache.get("rag", "s", "one")
+    time.sleep(0.01)
+    cache.put("rag", "s", "three", "3")
+    assert cache.get("rag", "s", "two") is None
+    assert cache.get("rag", "s", "one") == "1"
+    assert cache.get("rag", "s", "three") == "3"
+
+
+class KeywordEmbeddings(Embeddings):
+    '''Embeds a text by the keywords it contains, so rephrasings with the same keywords are identical.'''
+
+    keywords = ["revenue", "growth", "staff"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(keyword in text) for keyword in self.keywords]
+
+
+def test_semantic_hit_for_similar_query(tmp_path):
+    cache = AnswerCache(path=str(tmp_path / "answers.sqlite3"), embeddings=KeywordEmbeddings(), similarity_threshold=0.95)
+    cache.put("rag", "s", "How did revenue growth develop?", "up 5%")
+    assert cache.get("rag", "s", "revenue growth last year") == "up 5%"
+    assert cache.get("rag", "s", "staff numbers") is None
+
+
+def test_cached_research_runs_each_topic_once(cache, monkeypatch):
+    calls = []
+
+    def fake_research(topic, mode):
+        calls.append(topic)
+        return f"report on {topic}"
+
+    monkeypatch.setattr(research, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(research, "research", fake_research)
+    assert research.cached_research("Solar storage", mode="pipeline") == "report on Solar storage"
+    assert research.cached_research("solar  storage?", mode="pipeline") == "report on Solar storage"
+    assert calls == ["Solar storage"]
+    # The supervisor and the pipeline write different reports
+    research.cached_research("Solar storage", mode="supervisor")
+    assert len(calls) == 2
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import RAG
+import web_scraper
+from answer_cache import AnswerCache
+from doc_index import DocumentIndex
+from fakes import FakeEmbeddings, FixtureServer
+
+
+async def gaps_while(coroutine):
+    '''Runs coroutine and returns its result and the longest time the event loop was unavailable meanwhile.'''
+    longest = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal longest
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            longest = max(longest, now - last)
+            last = now
+            if done:
+                return
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)
+    try:
+        result = await coroutine
+    finally:
+        done = True
+        await task
+    return result, longest
+
+
+class SlowAnswerCache(AnswerCache):
+    def get(self, *args, **kwargs):
+        time.sleep(0.3)
+        return super().get(*args, **kwargs)
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = DocumentIndex(FakeEmbeddings(latency=0), persist_directory=str(tmp_path / "index"), backend="mmap")
+    index.upsert("notes.txt (abc)", "abc", [Document(page_content="Revenue grew by five percent.", metadata={"source": "notes.txt"})])
+    monkeypatch.setattr(RAG, "get_document_index", lambda: index)
+    monkeypatch.setattr(RAG, "get_answer_cache", lambda: SlowAnswerCache(path=str(tmp_path / "answers.sqlite3")))
+    return index
+
+
+def test_answer_questions_keeps_the_event_loop_free(index, fake_llm):
+    answers, gap = asyncio.run(gaps_while(RAG.aanswer_questions(["notes.txt (abc)"], ["How did revenue grow?"])))
+    assert answers[0]
+    assert gap < 0.2
+
+
+def test_scrape_cleans_pages_off_the_event_loop(monkeypatch):
+    import api
+
+    clean_html = web_scraper.clean_html
+
+    def slow_clean_html(html):
+        time.sleep(0.3)
+        return clean_html(html)
+
+    monkeypatch.setattr(web_scraper, "clean_html", slow_clean_html)
+    with FixtureServer({"/": "<html><body><p>" + "Server rendered text. " * 20 + "</p></body></html>"}) as server:
+        result, gap = asyncio.run(gaps_while(api.scrape_one(server.url("/"), None, "http")))
+    assert result.error is None and "Server rendered text." in result.content
+    assert gap < 0.2
+
+
+def test_one_failing_essay_does_not_fail_the_batch(monkeypatch):
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+
+    import api
+    import essays
+
+    def llm(prompt):
+        if "broken topic" in prompt.to_string():
+            raise RuntimeError("model unavailable")
+        return AIMessage(content="An essay.")
+
+    monkeypatch.setattr(essays, "get_essay_pipeline", lambda: essays.build_essay_pipeline(RunnableLambda(llm)))
+    results = asyncio.run(api.essays(api.EssayRequest(topics=["rivers", "broken topic"])))
+
+    assert results[0].essay and results[0].error is None
+    assert results[1].essay is None and results[1].error == "RuntimeError: model unavailable"
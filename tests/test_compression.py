@@ -0,0 +1,71 @@
+from compression import NearDuplicateFilter, compress_context, parse_sources
+from tokens import count_tokens
+
+
+def source_block(title, url, *sentences):
+    return f"Title: {title}\nURL: {url}\nContent: {' '.join(sentences)}\n---"
+
+
+def test_exact_and_near_duplicate_passages_are_recognized():
+    duplicates = NearDuplicateFilter()
+    passage = (
+        "The river flooded the lower town twice during the spring of that year after weeks of heavy rain, "
+        "and the council later built a stone wall along the bank to protect the market."
+    )
+    assert not duplicates.seen(passage)
+    assert duplicates.seen(passage.upper())
+    assert duplicates.seen(passage.replace("the market.", "the old market square."))
+    assert not duplicates.seen("Grain prices rose sharply across the northern provinces after the harvest failed.")
+
+
+def test_repeated_passages_are_dropped_with_sources_left_empty():
+    shared = "Solar panels convert sunlight into electricity using photovoltaic cells made of silicon."
+    text = "\n".join([
+        source_block("First", "https://a.example/solar", shared, "Panel efficiency has doubled over the past two decades of research."),
+        source_block("Copy", "https://b.example/copy", shared),
+        source_block("Third", "https://c.example/cost", "The cost of installing solar panels fell by seventy percent since 2010."),
+    ])
+    compressed = compress_context(text, "solar panels", budget=1000)
+
+    assert compressed.count(shared) == 1
+    assert "https://a.example/solar" in compressed and "https://c.example/cost" in compressed
+    assert "https://b.example/copy" not in compressed
+    assert "Content: \n" not in compressed
+
+
+def test_each_source_keeps_its_passages_most_relevant_to_the_query():
+    filler = [f"Unrelated sentence number {i} talks about the weather in another country." for i in range(8)]
+    text = source_block(
+        "Batteries", "https://a.example/batteries",
+        *filler[:3], "Lithium batteries store energy for electric cars.", *filler[3:],
+        "Battery recycling recovers lithium from old cells.",
+    )
+    compressed = compress_context(text, "lithium battery", budget=1000)
+
+    content = parse_sources(compressed)[0].passages
+    assert content == ["Lithium batteries store energy for electric cars.", "Battery recycling recovers lithium from old cells."]
+
+
+def test_output_stays_within_the_token_budget_and_keeps_urls():
+    text = "\n".join(
+        source_block(f"Source {s}", f"https://example.com/{s}", *[
+            f"Fact {s}-{p} about ocean currents and the temperature of deep water layers in region {s * 10 + p}."
+            for p in range(6)
+        ])
+        for s in range(10)
+    )
+    compressed = compress_context(text, "ocean currents deep water", budget=300)
+
+    assert count_tokens(compressed) <= 300
+    sources = parse_sources(compressed)
+    assert sources and all(source.passages for source in sources)
+    assert [source.url for source in sources] == [f"https://example.com/{s}" for s in range(len(sources))]
+
+
+def test_free_text_keeps_passages_with_urls_first():
+    text = " ".join(f"Plain sentence {i} without any link at all in it." for i in range(40))
+    text += " The full report is at https://example.com/report for reference."
+    compressed = compress_context(text, budget=60)
+
+    assert "https://example.com/report" in compressed
+    assert count_tokens(compressed) <= 60
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from crawler import HostLimiter, crawl, load_results
+from fakes import FixtureServer
+
+
+def page(text, links=()):
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><body><p>{text}</p>{anchors}</body></html>"
+
+
+SITE = {
+    "/": page("Home page", ["/a", "/b", "/b#reviews", "https://elsewhere.example/"]),
+    "/a": page("Product A costs 10 USD", ["/a/deeper"]),
+    "/b": page("Product B costs 20 USD"),
+    "/copy-of-b": page("Product  B costs 20 USD"),
+    "/a/deeper": page("Too deep"),
+    "/private": page("Secret"),
+    "/robots.txt": "User-agent: *\nDisallow: /private\n",
+    "/sitemap.xml": (
+        '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        "<url><loc>{base}/a</loc></url><url><loc>{base}/b</loc></url><url><loc>{base}/copy-of-b</loc></url>"
+        "</urlset>"
+    ),
+}
+
+
+@pytest.fixture
+def server():
+    with FixtureServer(SITE) as server:
+        yield server
+
+
+@pytest.fixture
+def limiter():
+    return HostLimiter(per_host=2, delay=0)
+
+
+def by_path(records, server):
+    return {record["url"][len(server.url("")):]: record for record in records}
+
+
+def test_seed_crawl_stays_on_host_and_within_depth(server, limiter, tmp_path):
+    records = list(crawl(str(tmp_path / "out.jsonl"), seed=server.url("/"), depth=1, mode="http", limiter=limiter))
+    pages = by_path(records, server)
+
+    assert set(pages) == {"/", "/a", "/b"}
+    assert all(record["status"] == "ok" for record in records)
+    assert "Product A costs 10 USD" in pages["/a"]["content"]
+
+
+def test_robots_txt_is_respected(server, limiter, tmp_path):
+    records = list(crawl(str(tmp_path / "out.jsonl"), urls=[server.url("/a"), server.url("/private")], mode="http", limiter=limiter))
+    assert by_path(records, server)["/private"]["status"] == "disallowed"
+
+
+def test_sitemap_pages_are_deduplicated_by_content(server, limiter, tmp_path):
+    # The copy only differs in whitespace
+    sitemap = SITE["/sitemap.xml"].format(base=server.url("").rstrip("/"))
+    with FixtureServer({"/sitemap.xml": sitemap}) as sitemap_server:
+        records = list(crawl(str(tmp_path / "out.jsonl"), sitemap=sitemap_server.url("/sitemap.xml"), mode="http", limiter=limiter))
+    statuses = sorted(record["status"] for record in records)
+    assert statuses == ["duplicate", "ok", "ok"]
+
+
+def test_resume_skips_finished_pages(server, limiter, tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    list(crawl(output, urls=[server.url("/a")], mode="http", limiter=limiter))
+    # An interrupted run leaves half a line behind
+    with open(output, "a", encoding="utf-8") as file:
+        file.write('{"url": "trunc')
+
+    records = list(crawl(output, urls=[server.url("/a"), server.url("/b")], mode="http", limiter=limiter))
+    assert [record["url"] for record in records] == [server.url("/b")]
+    assert [record["url"] for record in load_results(output)] == [server.url("/a"), server.url("/b")]
+
+
+def test_failed_pages_are_retried_on_resume(server, limiter, tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    first = list(crawl(output, urls=[server.url("/missing")], mode="http", limiter=limiter))
+    assert first[0]["status"] == "error"
+    assert len(list(crawl(output, urls=[server.url("/missing")], mode="http", limiter=limiter))) == 1
+
+
+def test_host_limiter_bounds_concurrency_and_spaces_requests():
+    limiter = HostLimiter(per_host=2, delay=0.05, respect_robots=False)
+    active, peak, starts = 0, 0, []
+    lock = threading.Lock()
+
+    def fetch(url):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+            starts.append(time.monotonic())
+        time.sleep(0.1)
+        with lock:
+            active -= 1
+
+    threads = [threading.Thread(target=limiter.fetch, args=("http://example.org/page", fetch)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    starts.sort()
+    assert peak <= 2
+    assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
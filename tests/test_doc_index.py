@@ -0,0 +1,45 @@
+import gc
+import weakref
+
+import pytest
+from langchain_core.documents import Document
+
+from doc_index import DocumentIndex
+from fakes import FakeEmbeddings
+
+
+def add_document(index, doc_id, words):
+    chunks = [Document(page_content=f"{doc_id} chunk {i} " + " ".join(words), metadata={"source": doc_id}) for i in range(50)]
+    index.upsert(doc_id, doc_id, chunks)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DocumentIndex(FakeEmbeddings(latency=0), persist_directory=str(tmp_path), backend="mmap", lexical_cache_mb=1)
+    for name in ("a", "b", "c"):
+        add_document(index, name, ["revenue", "growth"] * 20)
+    return index
+
+
+def test_lexical_indexes_are_reused(index):
+    assert index.lexical_index(["a", "b"]) is index.lexical_index(["b", "a"])
+
+
+def test_lexical_cache_stays_within_its_limit(index):
+    index.lexical_cache_limit = index.lexical_index(["a"]).approximate_size() * 2
+    for selection in (["a"], ["b"], ["c"], ["a", "b"]):
+        index.lexical_index(selection)
+    assert sum(size for _, size in index._lexical_indexes.values()) <= index.lexical_cache_limit
+    # The least recently used selections went first
+    assert list(index._lexical_indexes)[-1] == tuple(sorted((doc_id, doc_id) for doc_id in ("a", "b")))
+
+
+def test_retriever_does_not_keep_its_bm25_index_alive(index):
+    retriever = index.as_retriever(["a"], k=2, fetch_k=5)
+    bm25 = weakref.ref(index.lexical_index(["a"]))
+    index.lexical_cache_limit = 0
+    index.lexical_index(["b"])
+    gc.collect()
+    assert bm25() is None
+    # The next query builds it again
+    assert retriever.invoke("a chunk 3 revenue")
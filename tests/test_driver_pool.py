@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+import web_scraper
+from fakes import FixtureServer
+from web_scraper import DriverPool, scrape_website
+
+
+class FakeDriver:
+    def __init__(self):
+        self.healthy = True
+        self.crash_on_next_page = False
+        self.quit_called = False
+        self.loaded = []
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise RuntimeError("browser crashed")
+        return 1
+
+    def get(self, url):
+        if self.crash_on_next_page:
+            self.healthy = False
+        if not self.healthy:
+            raise RuntimeError("browser crashed")
+        self.loaded.append(url)
+
+    @property
+    def page_source(self):
+        return f"<html><body>{self.loaded[-1]}</body></html>"
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def drivers():
+    created = []
+
+    def factory():
+        created.append(FakeDriver())
+        return created[-1]
+
+    return created, factory
+
+
+def test_drivers_are_reused(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=2, max_pages=50, driver_factory=factory)
+    for i in range(5):
+        pool.fetch(f"http://example.org/{i}")
+    assert len(created) == 1
+    assert len(created[0].loaded) == 5
+
+
+def test_drivers_are_recycled_after_max_pages(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=1, max_pages=3, driver_factory=factory)
+    for i in range(7):
+        pool.fetch(f"http://example.org/{i}")
+    assert len(created) == 3
+    assert [driver.quit_called for driver in created] == [True, True, False]
+
+
+def test_driver_that_crashes_is_replaced(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=1, driver_factory=factory)
+    pool.fetch("http://example.org/")
+    created[0].crash_on_next_page = True
+    with pytest.raises(RuntimeError):
+        pool.fetch("http://example.org/")
+    assert created[0].quit_called
+    assert "example.org/next" in pool.fetch("http://example.org/next")
+    assert len(created) == 2
+
+
+def test_idle_driver_that_died_is_replaced(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=1, driver_factory=factory)
+    pool.fetch("http://example.org/")
+    created[0].healthy = False
+    pool.fetch("http://example.org/")
+    assert created[0].quit_called
+    assert len(created) == 2
+
+
+def test_pool_size_bounds_concurrent_drivers(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=2, driver_factory=factory)
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(held[0])
+    waiter.join()
+    assert acquired == [held[0]]
+    assert len(created) == 2
+
+
+def test_close_quits_idle_drivers(drivers):
+    created, factory = drivers
+    pool = DriverPool(size=2, driver_factory=factory)
+    driver = pool.acquire()
+    pool.release(driver)
+    pool.close()
+    assert driver.quit_called
+
+
+def test_static_pages_skip_the_browser(monkeypatch):
+    def no_browser():
+        raise AssertionError("static page should not need a browser")
+
+    monkeypatch.setattr(web_scraper, "get_driver_pool", no_browser)
+    text = "Plain server-rendered content. " * 20
+    with FixtureServer({"/": f"<html><body><p>{text}</p></body></html>"}) as server:
+        assert text in scrape_website(server.url("/"))
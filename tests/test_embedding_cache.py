@@ -0,0 +1,62 @@
+import itertools
+
+import pytest
+
+import embedding_cache
+from embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+from fakes import FakeEmbeddings
+
+VECTOR_BYTES = 16 * 4
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''Every call to time.time() in the cache is one second later, so LRU order never ties.'''
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(ticks))
+
+
+def test_only_missing_texts_reach_the_model(tmp_path):
+    model = FakeEmbeddings(size=16, latency=0)
+    embeddings = CachedEmbeddings(model, "small", cache=EmbeddingCache(path=str(tmp_path / "cache.sqlite3")))
+
+    first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+    assert model.calls == 1
+    second = embeddings.embed_documents(["beta", "alpha"])
+    assert model.calls == 1
+    # Stored as float32
+    assert second[0] == pytest.approx(first[1], abs=1e-6)
+    assert second[1] == pytest.approx(first[0], abs=1e-6)
+
+    embeddings.embed_query("alpha")
+    assert model.calls == 1
+    embeddings.embed_query("gamma")
+    embeddings.embed_query("gamma")
+    assert model.calls == 2
+
+
+def test_vectors_are_kept_apart_per_model(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    small = CachedEmbeddings(FakeEmbeddings(size=16, latency=0), "small", cache=cache)
+    large_model = FakeEmbeddings(size=32, latency=0)
+    large = CachedEmbeddings(large_model, "large", cache=cache)
+
+    small.embed_documents(["alpha"])
+    assert len(large.embed_documents(["alpha"])[0]) == 32
+    assert large_model.calls == 1
+    assert cache_key("small", "alpha") != cache_key("large", "alpha")
+
+
+def test_least_recently_used_vectors_are_evicted_at_the_cap(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path=path, max_bytes=4 * VECTOR_BYTES)
+    vector = [0.5] * 16
+    for name in "abcd":
+        cache.put_many([(name, vector)])
+    assert cache.get_many(["a"]) == {"a": vector}
+
+    cache.put_many([("e", vector)])
+    # Down to 90% of the cap: the two least recently used ("b", "c") are gone, "a" was just read
+    assert set(cache.get_many(list("abcde"))) == {"a", "d", "e"}
+    assert cache.total_bytes == 3 * VECTOR_BYTES
+    assert EmbeddingCache(path=path).total_bytes == 3 * VECTOR_BYTES
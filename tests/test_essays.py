@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+import clients
+import essays
+from fakes import FakeChatModel
+
+
+class Context:
+    '''Records what a background job reports.'''
+
+    def __init__(self):
+        self.updates = []
+
+    def progress(self, fraction, message):
+        self.updates.append((fraction, message))
+
+    def check(self):
+        pass
+
+
+@pytest.fixture
+def llm():
+    # The pipeline keeps the model it was built with
+    essays.get_essay_pipeline.cache_clear()
+    llm = FakeChatModel(latency=0.05, response_words=20)
+    clients.set_override("llm", llm)
+    yield llm
+    clients.set_override("llm", None)
+    essays.get_essay_pipeline.cache_clear()
+
+
+def test_pipeline_returns_the_improved_essay_with_its_keywords(llm):
+    essay = essays.generate_essay("tidal power")
+    draft_pipeline, keywords_chain, _ = essays.get_essay_pipeline()
+    state = draft_pipeline.invoke({"topic": "tidal power"})
+
+    assert set(state) == {"topic", "essay", "review"}
+    assert essay == essays.combine_text(state["essay"], keywords_chain.invoke(state))
+    assert "".join(essays.stream_essay("tidal power")) == essay
+
+
+def test_batch_keeps_topic_order_and_runs_concurrently(llm):
+    topics = ["tidal power", "wind farms", "solar roofs", "heat pumps"]
+    expected = [essays.generate_essay(topic) for topic in topics]
+
+    start = time.perf_counter()
+    assert essays.generate_essays(topics, max_concurrency=4) == expected
+    # Five model calls per essay: one after another the batch would take at least a second
+    assert time.perf_counter() - start < 0.7
+
+
+def test_job_reports_progress_per_essay(llm):
+    ctx = Context()
+    result = essays.essay_job(ctx, ["tidal power", "wind farms"])
+
+    assert result == "\n\n".join(f"## {topic}\n\n{essays.generate_essay(topic)}" for topic in ["tidal power", "wind farms"])
+    assert [fraction for fraction, _ in ctx.updates] == [0, 0.5, 1.0]
+    assert essays.essay_job(Context(), ["tidal power"]) == essays.generate_essay("tidal power")
@@ -0,0 +1,96 @@
+import sys
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from hybrid_search import BM25Index, CrossEncoderReranker, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    "Replace the pump seal PN-4471A every two years.",
+    "The pump moves coolant through the engine block.",
+    "Clause 7.3.1 limits the warranty to parts and labour.",
+    "Coolant temperature rises when the radiator is blocked.",
+]
+
+
+def doc(text):
+    return Document(page_content=text, metadata={"doc_id": "manual.txt"})
+
+
+class FixedRetriever(BaseRetriever):
+    '''Stands in for the vector store: returns the same ranking for every query and counts the calls.'''
+
+    documents: List[Document]
+    calls: int = 0
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.calls += 1
+        return self.documents
+
+
+@pytest.fixture
+def lexical():
+    return BM25Index([doc(text) for text in CHUNKS])
+
+
+def test_identifiers_are_kept_whole_and_split_into_parts():
+    assert tokenize("Seal PN-4471A, clause 7.3.1") == ["seal", "pn-4471a", "pn", "4471a", "clause", "7.3.1", "7", "3", "1"]
+
+
+def test_exact_term_ranks_first(lexical):
+    results = lexical.search("PN-4471A")
+    assert results[0][0].page_content == CHUNKS[0]
+    assert [document.page_content for document, _ in lexical.search("warranty")] == [CHUNKS[2]]
+    assert lexical.search("nonexistent") == []
+
+
+def test_rare_terms_outweigh_common_ones(lexical):
+    # "pump" is in two chunks, "radiator" in one
+    ranked = [document.page_content for document, _ in lexical.search("pump radiator")]
+    assert ranked[0] == CHUNKS[3]
+
+
+def test_fusion_ranks_documents_found_by_both_lists_first():
+    a, b, c, d = (doc(text) for text in CHUNKS)
+    fused = reciprocal_rank_fusion([[a, b, c], [d, c, a]])
+    assert fused[:2] == [a, c]
+    assert {document.page_content for document in fused} == set(CHUNKS)
+
+
+def test_identifier_query_is_answered_by_bm25_alone(lexical):
+    dense = FixedRetriever(documents=[doc(CHUNKS[1])])
+    retriever = HybridRetriever(vector_retriever=dense, lexical_index=lexical, k=2)
+
+    results = retriever.invoke("PN-4471A")
+    assert results[0].page_content == CHUNKS[0]
+    assert dense.calls == 0
+
+
+def test_hybrid_query_fuses_vector_and_lexical_hits(lexical):
+    # The vector store finds the semantically related chunk that shares no term with the query
+    dense = FixedRetriever(documents=[doc(CHUNKS[3]), doc(CHUNKS[1])])
+    retriever = HybridRetriever(vector_retriever=dense, lexical_index=lexical, k=3)
+
+    results = [document.page_content for document in retriever.invoke("how does the pump work")]
+    assert dense.calls == 1
+    assert results[0] == CHUNKS[1]
+    assert CHUNKS[3] in results and CHUNKS[0] in results
+
+
+def test_reranker_reorders_the_fused_candidates(lexical):
+    dense = FixedRetriever(documents=[doc(CHUNKS[1])])
+
+    def by_length(query, documents):
+        return sorted(documents, key=lambda document: len(document.page_content))
+
+    retriever = HybridRetriever(vector_retriever=dense, lexical_index=lexical, k=2, reranker=by_length)
+    results = retriever.invoke("the pump seal")
+    assert [len(document.page_content) for document in results] == sorted(len(document.page_content) for document in results)
+
+
+def test_cross_encoder_explains_the_missing_dependency(monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    with pytest.raises(ImportError, match="pip install sentence-transformers"):
+        CrossEncoderReranker()
@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from doc_index import DocumentIndex
+from fakes import FakeEmbeddings
+from ingest import ingest_files
+
+
+class Upload(io.BytesIO):
+    '''A file as the Streamlit uploader hands it over.'''
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.type = "text/plain"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DocumentIndex(FakeEmbeddings(latency=0), persist_directory=str(tmp_path), backend="mmap")
+
+
+def chunk_texts(index, doc_id):
+    return [document.page_content for document in index.lexical_index([doc_id]).documents]
+
+
+def test_edited_upload_reuses_unchanged_chunks_and_removes_stale_ones(index):
+    paragraphs = [f"Section {i}: " + f"clause {i} of the contract covers payment terms. " * 12 for i in range(6)]
+    first, _ = ingest_files(index, [Upload("contract.txt", "\n\n".join(paragraphs).encode("utf-8"))])
+    old_ids = set(index.manifest["contract.txt"]["chunk_ids"])
+
+    paragraphs[-1] = "Section 5: the notice period is now ninety days. " * 12
+    second, _ = ingest_files(index, [Upload("contract.txt", "\n\n".join(paragraphs).encode("utf-8"))])
+    new_ids = set(index.manifest["contract.txt"]["chunk_ids"])
+
+    assert first == second == {"contract.txt": "contract.txt"}
+    assert index.documents() == ["contract.txt"]
+    assert len(old_ids & new_ids) >= 4
+    stale = old_ids - new_ids
+    assert stale
+    assert index.vectorstore.get(ids=list(stale))["ids"] == []
+    assert len(index.vectorstore.get(where={"doc_id": "contract.txt"})["ids"]) == len(new_ids)
+    text = " ".join(chunk_texts(index, "contract.txt"))
+    assert "ninety days" in text and "clause 5 " not in text
+
+
+def test_owners_keep_files_with_the_same_name_apart(index):
+    first, _ = ingest_files(index, [Upload("report.txt", b"Quarterly revenue grew in the north region.")], owner="alice")
+    second, _ = ingest_files(index, [Upload("report.txt", b"Staff turnover fell after the new hiring plan.")], owner="bob")
+
+    assert index.documents() == ["alice/report.txt", "bob/report.txt"]
+    assert "revenue" in " ".join(chunk_texts(index, first["report.txt"]))
+    assert "turnover" in " ".join(chunk_texts(index, second["report.txt"]))
+
+
+def test_identical_upload_reuses_the_indexed_document(index):
+    first, _ = ingest_files(index, [Upload("notes.txt", b"Same content every time.")])
+    second, _ = ingest_files(index, [Upload("notes.txt", b"Same content every time.")])
+    assert first == second
+    assert len(index.documents()) == 1
+
+
+def test_chunks_keep_the_file_name_as_source(index):
+    loaded, failed = ingest_files(index, [Upload("notes.txt", b"Some text to index.")])
+    assert not failed
+    stored = index.lexical_index([loaded["notes.txt"]]).documents
+    assert {document.metadata["source"] for document in stored} == {"notes.txt"}
+
+
+def test_large_file_streams_through_bounded_queues(index, monkeypatch):
+    import ingest
+
+    monkeypatch.setattr(ingest, "QUEUE_BATCHES", 1)
+    monkeypatch.setattr(ingest, "MAX_PENDING_EMBEDS", 1)
+    text = "\n\n".join(f"Paragraph {i} about the quarterly numbers and the outlook." * 5 for i in range(300))
+    loaded, failed = ingest_files(index, [Upload("big.txt", text.encode("utf-8"))], batch_size=4)
+
+    assert not failed
+    chunks = chunk_texts(index, loaded["big.txt"])
+    assert len(chunks) > 8
+    assert any("Paragraph 299" in chunk for chunk in chunks)
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from jobs import JobLimitReached, JobManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(path=str(tmp_path / "jobs.sqlite3"), max_workers=1, max_per_user=2)
+
+
+def test_job_runs_to_done_with_progress(manager):
+    def job(ctx, n):
+        ctx.progress(0.5, "halfway")
+        return str(n * 2)
+
+    job_id = manager.submit("alice", "essay", job, label="double", n=21)
+    job = manager.wait(job_id, timeout=5)
+    assert job["state"] == "done"
+    assert job["result"] == "42"
+    assert job["progress"] == 1
+    assert job["message"] == "halfway"
+    assert job["params"] == {"n": 21}
+
+
+def test_failure_is_recorded(manager):
+    def job(ctx):
+        raise ValueError("no sources found")
+
+    job = manager.wait(manager.submit("alice", "research", job), timeout=5)
+    assert job["state"] == "failed"
+    assert job["error"] == "no sources found"
+
+
+def test_running_job_stops_at_next_check_when_cancelled(manager):
+    started, release = threading.Event(), threading.Event()
+
+    def job(ctx):
+        started.set()
+        release.wait(5)
+        ctx.progress(0.9)
+        return "finished anyway"
+
+    job_id = manager.submit("alice", "research", job)
+    started.wait(5)
+    assert manager.get(job_id)["state"] == "running"
+    assert manager.cancel(job_id)
+    assert manager.get(job_id)["cancelling"]
+    release.set()
+    assert manager.wait(job_id, timeout=5)["state"] == "cancelled"
+    assert not manager.cancel(job_id)
+
+
+def test_queued_job_is_cancelled_without_running(manager):
+    release = threading.Event()
+    ran = []
+    blocker = manager.submit("alice", "research", lambda ctx: release.wait(5) and "")
+    queued = manager.submit("bob", "research", lambda ctx: ran.append(True))
+
+    assert manager.get(queued)["state"] == "queued"
+    assert manager.cancel(queued)
+    assert manager.get(queued)["state"] == "cancelled"
+    release.set()
+    manager.wait(blocker, timeout=5)
+    assert ran == []
+
+
+def test_per_user_limit(manager):
+    release = threading.Event()
+    for _ in range(2):
+        manager.submit("alice", "research", lambda ctx: release.wait(5) and "")
+    with pytest.raises(JobLimitReached):
+        manager.submit("alice", "research", lambda ctx: "")
+    # Other users are not affected
+    manager.submit("bob", "research", lambda ctx: "")
+    release.set()
+
+
+def test_unfinished_jobs_fail_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    release = threading.Event()
+    first = JobManager(path=path, max_workers=1)
+    job_id = first.submit("alice", "research", lambda ctx: release.wait(5) and "")
+
+    job = JobManager(path=path).get(job_id)
+    release.set()
+    assert job["state"] == "failed"
+    assert "restart" in job["error"]
+
+
+def test_list_and_delete(manager):
+    first = manager.submit("alice", "essay", lambda ctx: "a", label="first")
+    manager.wait(first, timeout=5)
+    second = manager.submit("alice", "research", lambda ctx: "b", label="second")
+    manager.wait(second, timeout=5)
+
+    assert [job["label"] for job in manager.list("alice")] == ["second", "first"]
+    assert [job["label"] for job in manager.list("alice", kind="essay")] == ["first"]
+    manager.delete(first)
+    assert manager.get(first) is None
@@ -0,0 +1,111 @@
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import clients
+from web_scraper import parse_with_ai
+
+
+class FakeOpenAI:
+    '''Answers /v1/chat/completions like the OpenAI API; optionally fails the first requests with a status or a dropped connection.'''
+
+    def __init__(self, failures=()):
+        self.requests = []
+        self.failures = list(failures)
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.requests.append(body)
+                failure = fake.failures.pop(0) if fake.failures else None
+                if failure == "drop":
+                    self.close_connection = True
+                    self.wfile.close()
+                    return
+                if failure is not None:
+                    self._send(failure, {"error": {"message": "try again", "type": "server_error"}})
+                    return
+                self._send(200, {
+                    "id": "chatcmpl-test", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": f"answer {len(fake.requests)}"}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+                })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def openai_server(monkeypatch):
+    with FakeOpenAI() as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setenv("OPENAI_API_BASE", server.base_url)
+        # Fresh clients that point at the fake server
+        monkeypatch.setattr(clients, "_clients", {})
+        yield server
+
+
+def test_parse_with_ai_twice_in_a_row(openai_server):
+    chunks = ["first part of the page", "second part of the page"]
+    assert parse_with_ai(chunks, "anything")
+    assert parse_with_ai(chunks, "anything")
+    assert len(openai_server.requests) == 6
+
+
+def test_parse_with_ai_from_several_threads(openai_server):
+    results, errors = [], []
+
+    def parse():
+        try:
+            results.append(parse_with_ai(["one page", "another page"], "anything"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=parse) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and len(results) == 4
+
+
+def test_crawler_parses_every_page(openai_server, tmp_path):
+    from crawler import HostLimiter, crawl
+    from fakes import FixtureServer
+
+    pages = {f"/{i}": f"<html><body><p>Product {i} costs {i} USD</p></body></html>" for i in range(4)}
+    with FixtureServer(pages) as site:
+        records = list(crawl(
+            str(tmp_path / "out.jsonl"), urls=[site.url(path) for path in pages], parse_description="prices",
+            mode="http", limiter=HostLimiter(delay=0, respect_robots=False), max_workers=2,
+        ))
+    assert [record["status"] for record in records] == ["ok"] * 4
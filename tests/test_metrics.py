@@ -0,0 +1,59 @@
+import requests
+
+import metrics_server
+from tracing import span
+
+
+def test_exporter_serves_this_process_spans(monkeypatch):
+    monkeypatch.setattr(metrics_server, "_server", None)
+    monkeypatch.setattr(metrics_server, "_server_started", False)
+    with span("exporter_test_span"):
+        pass
+
+    server = metrics_server.http.server.ThreadingHTTPServer(("127.0.0.1", 0), metrics_server.MetricsHandler)
+    monkeypatch.setattr(metrics_server.http.server, "ThreadingHTTPServer", lambda address, handler: server)
+    assert metrics_server.start_metrics_server(port=server.server_address[1]) is server
+    # Reruns reuse the running exporter
+    assert metrics_server.start_metrics_server(port=server.server_address[1]) is server
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        response = requests.get(f"{base}/metrics", timeout=5)
+        assert response.status_code == 200
+        assert 'ai_helper_span_seconds_count{span="exporter_test_span"} 1' in response.text
+        assert "ai_helper_llm_queue_depth" in response.text
+        assert "ai_helper_session_resident_bytes" in response.text
+        assert requests.get(f"{base}/other", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_port_zero_turns_the_exporter_off(monkeypatch):
+    monkeypatch.setattr(metrics_server, "_server", None)
+    monkeypatch.setattr(metrics_server, "_server_started", False)
+    assert metrics_server.start_metrics_server(port=0) is None
+
+
+def test_port_in_use_is_reported_not_raised(monkeypatch):
+    import socket
+
+    monkeypatch.setattr(metrics_server, "_server", None)
+    monkeypatch.setattr(metrics_server, "_server_started", False)
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        assert metrics_server.start_metrics_server(port=taken.getsockname()[1]) is None
+
+
+def test_session_memory_is_reported_by_the_process_that_holds_it(monkeypatch):
+    from session_resources import SessionResources
+    import session_resources
+
+    resources = SessionResources(spill_dir="unused")
+    resources.put("tab", "page", "x" * 1000, size=1000)
+    monkeypatch.setattr(session_resources, "_default_resources", resources)
+
+    assert "ai_helper_session_resident_bytes 1000" in metrics_server.render_metrics()
+    api_metrics = metrics_server.render_metrics(sessions=False)
+    assert "ai_helper_session_resident_bytes" not in api_metrics
+    assert "ai_helper_process_resident_bytes" in api_metrics
@@ -0,0 +1,124 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import mmap_store
+from fakes import FakeEmbeddings
+from mmap_store import MmapVectorStore
+
+
+def clustered(count, dim=16, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + rng.normal(scale=0.3, size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def open_store(directory, **options):
+    return MmapVectorStore(FakeEmbeddings(latency=0), persist_directory=str(directory), **options)
+
+
+def add(store, vectors, start=0):
+    ids = [f"v{i}" for i in range(start, start + len(vectors))]
+    store.add_vectors(vectors, [f"text {id_}" for id_ in ids], [{"i": int(id_[1:])} for id_ in ids], ids=ids)
+    return ids
+
+
+def nearest(store, vector, k=1, filter=None):
+    return [store.ids[row] for row, _ in store.search_vectors(vector, k=k, filter=filter)]
+
+
+def test_delete_moves_the_last_row_into_the_gap(tmp_path):
+    vectors = clustered(10)
+    store = open_store(tmp_path)
+    add(store, vectors)
+
+    store.delete(ids=["v2", "v5", "missing"])
+
+    assert len(store) == 8 and "v2" not in store.ids and "v5" not in store.ids
+    for i in [0, 1, 3, 9]:
+        assert nearest(store, vectors[i]) == [f"v{i}"]
+        assert store.get(ids=[f"v{i}"])["documents"] == [f"text v{i}"]
+    assert store.get(where={"i": {"$in": [2, 5]}})["ids"] == []
+
+
+def test_int8_rows_rank_like_float32(tmp_path):
+    vectors = clustered(200)
+    exact = open_store(tmp_path / "float32", quantization="float32")
+    quantized = open_store(tmp_path / "int8", quantization="int8")
+    add(exact, vectors)
+    add(quantized, vectors)
+
+    for vector in vectors[:20]:
+        assert nearest(quantized, vector) == nearest(exact, vector)
+        (_, exact_score), = exact.search_vectors(vector, k=1)
+        (_, quantized_score), = quantized.search_vectors(vector, k=1)
+        assert quantized_score == pytest.approx(exact_score, abs=0.02)
+    assert os.path.getsize(quantized._path("vectors")) * 4 == os.path.getsize(exact._path("vectors"))
+
+
+def test_ivf_search_finds_neighbours_and_respects_filters(tmp_path):
+    vectors = clustered(400)
+    store = open_store(tmp_path, ivf_lists=4, ivf_probes=2)
+    add(store, vectors)
+
+    found = [nearest(store, vector) == [f"v{i}"] for i, vector in enumerate(vectors[:50])]
+    assert store._centroids is not None
+    assert sum(found) >= 48
+    # A filter narrower than the probed lists falls back to scanning every matching row
+    assert nearest(store, vectors[0], k=3, filter={"i": {"$in": [7, 300]}}) in (["v7", "v300"], ["v300", "v7"])
+
+
+def test_reopen_replays_the_change_log(tmp_path):
+    vectors = clustered(30)
+    store = open_store(tmp_path, quantization="int8")
+    add(store, vectors[:20])
+    add(store, vectors[20:], start=20)
+    store.add_vectors(vectors[:1], ["edited"], [{"i": 0}], ids=["v0"])
+    store.delete(ids=["v3"])
+
+    reopened = open_store(tmp_path)
+    assert reopened.quantization == "int8"
+    assert reopened.ids == store.ids and reopened.documents == store.documents
+    assert reopened.get(ids=["v0"])["documents"] == ["edited"]
+    assert nearest(reopened, vectors[25]) == ["v25"]
+
+    reopened.close()
+    assert glob.glob(os.path.join(reopened.directory, "changes-*.jsonl")) == []
+    assert open_store(tmp_path).ids == store.ids
+
+
+def test_writes_append_to_the_log_instead_of_rewriting_the_sidecar(tmp_path, monkeypatch):
+    monkeypatch.setattr(mmap_store, "COMPACT_MIN_RECORDS", 50)
+    vectors = clustered(60)
+    store = open_store(tmp_path)
+    add(store, vectors[:10])
+    sidecar = os.path.join(store.directory, "index.json")
+    sidecar_size = os.path.getsize(sidecar)
+
+    for i in range(10, 49):
+        add(store, vectors[i:i + 1], start=i)
+    assert os.path.getsize(sidecar) == sidecar_size
+    assert store._log_records == 39
+
+    for i in range(49, 60):
+        add(store, vectors[i:i + 1], start=i)
+    assert os.path.getsize(sidecar) > sidecar_size
+    assert store._log_records == 0
+    assert open_store(tmp_path).ids == store.ids
+
+
+def test_a_torn_log_write_is_dropped_on_open(tmp_path):
+    vectors = clustered(5)
+    store = open_store(tmp_path)
+    add(store, vectors[:4])
+    add(store, vectors[4:], start=4)
+    with open(store._log_path(), "a", encoding="utf-8") as f:
+        f.write('{"id": "v9", "te')
+
+    reopened = open_store(tmp_path)
+    assert reopened.ids == ["v0", "v1", "v2", "v3", "v4"]
+    add(reopened, clustered(1, seed=1), start=5)
+    assert open_store(tmp_path).ids == ["v0", "v1", "v2", "v3", "v4", "v5"]
@@ -0,0 +1,214 @@
+import os
+import smtplib
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import outbox
+from outbox import Outbox
+
+
+class SMTPStub:
+    '''
+    Minimal SMTP server. The first `fail_data` messages get "451 try again later" after DATA,
+    recipients starting with "bad@" get "550 no such user".
+    '''
+
+    def __init__(self, fail_data=0):
+        self.received = []
+        self.connections = 0
+        self.fail_data = fail_data
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + "\r\n").encode("ascii"))
+
+            def handle(self):
+                stub.connections += 1
+                self.reply("220 stub ready")
+                data, lines = False, []
+                for raw in self.rfile:
+                    line = raw.decode("utf-8").rstrip("\r\n")
+                    if data:
+                        if line != ".":
+                            lines.append(line)
+                            continue
+                        data = False
+                        if stub.fail_data > 0:
+                            stub.fail_data -= 1
+                            self.reply("451 try again later")
+                        else:
+                            stub.received.append("\n".join(lines))
+                            self.reply("250 queued")
+                        lines = []
+                        continue
+                    command = line[:4].upper()
+                    if command == "DATA":
+                        data = True
+                        self.reply("354 go ahead")
+                    elif command == "RCPT" and "bad@" in line:
+                        self.reply("550 no such user")
+                    elif command == "QUIT":
+                        self.reply("221 bye")
+                        return
+                    else:
+                        self.reply("250 ok")
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def smtp():
+    stub = SMTPStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(outbox, "RETRY_BASE", 0.05)
+    monkeypatch.setattr(outbox, "ERROR_PAUSE", 0.05)
+
+
+def make_outbox(tmp_path, smtp, **options):
+    return Outbox(
+        path=str(tmp_path / "outbox.sqlite3"), host="127.0.0.1", port=smtp.port, security="plain",
+        username="", password="", sender="me@example.org", **options,
+    )
+
+
+def test_send_returns_at_once_and_delivers_in_the_background(tmp_path, smtp):
+    box = make_outbox(tmp_path, smtp)
+    try:
+        started = time.perf_counter()
+        ids = [box.send(f"user{i}@example.org", "Essay", f"body {i}") for i in range(5)]
+        assert time.perf_counter() - started < 0.5
+        assert [box.wait(message_id, timeout=10)["state"] for message_id in ids] == ["sent"] * 5
+        assert len(smtp.received) == 5
+        # One connection carries the whole batch
+        assert smtp.connections == 1
+    finally:
+        box.close()
+
+
+def test_temporary_failures_are_retried_with_backoff(tmp_path, smtp):
+    smtp.fail_data = 2
+    box = make_outbox(tmp_path, smtp)
+    try:
+        message_id = box.send("user@example.org", "Research", "body")
+        status = box.wait(message_id, timeout=10)
+        assert status["state"] == "sent"
+        assert status["attempts"] == 3
+        # A 4xx reply leaves the session usable
+        assert smtp.connections == 1
+    finally:
+        box.close()
+
+
+def test_gives_up_after_max_attempts(tmp_path, smtp):
+    smtp.fail_data = 10
+    box = make_outbox(tmp_path, smtp, max_attempts=3)
+    try:
+        status = box.wait(box.send("user@example.org", "Research", "body"), timeout=10)
+        assert status["state"] == "failed"
+        assert status["attempts"] == 3
+        assert "451" in status["error"]
+    finally:
+        box.close()
+
+
+def test_permanent_failure_is_not_retried(tmp_path, smtp):
+    box = make_outbox(tmp_path, smtp)
+    try:
+        bad = box.send("bad@example.org", "Essay", "body")
+        good = box.send("good@example.org", "Essay", "body")
+        assert box.wait(bad, timeout=10)["state"] == "failed"
+        assert box.wait(bad)["attempts"] == 1
+        assert box.wait(good, timeout=10)["state"] == "sent"
+    finally:
+        box.close()
+
+
+def test_backoff_grows_exponentially(tmp_path, smtp, monkeypatch):
+    monkeypatch.setattr(outbox.random, "uniform", lambda low, high: 0.0)
+    box = make_outbox(tmp_path, smtp)
+    box.close()
+    row = {"id": "x", "attempts": 2}
+    marked = {}
+    monkeypatch.setattr(box, "_mark", lambda message_id, **fields: marked.update(fields))
+    before = time.time()
+    box._failed(row, outbox.smtplib.SMTPResponseException(451, "later"))
+    assert marked["attempts"] == 3
+    assert marked["next_attempt"] - before == pytest.approx(outbox.RETRY_BASE * 4, abs=0.05)
+
+
+def test_mail_queued_before_a_restart_is_sent_on_startup(tmp_path, smtp):
+    unreachable = SMTPStub()
+    unreachable.close()
+    box = make_outbox(tmp_path, unreachable, max_attempts=100)
+    message_id = box.send("user@example.org", "Essay", "body")
+    box.close()
+    assert box.status(message_id)["state"] == "queued"
+
+    restarted = make_outbox(tmp_path, smtp)
+    try:
+        assert restarted.wait(message_id, timeout=10)["state"] == "sent"
+    finally:
+        restarted.close()
+
+
+def test_sender_survives_unexpected_errors(tmp_path, smtp, monkeypatch):
+    box = make_outbox(tmp_path, smtp)
+    try:
+        due = box._due
+        failures = [RuntimeError("database is locked")]
+
+        def flaky_due():
+            if failures:
+                raise failures.pop()
+            return due()
+
+        monkeypatch.setattr(box, "_due", flaky_due)
+        box._wake.set()
+        message_id = box.send("user@example.org", "Essay", "body")
+        assert box.wait(message_id, timeout=10)["state"] == "sent"
+        assert box._thread.is_alive()
+    finally:
+        box.close()
+
+
+@pytest.mark.parametrize("error, transient", [
+    (smtplib.SMTPServerDisconnected("connection lost"), True),
+    (ConnectionRefusedError(), True),
+    (socket.timeout(), True),
+    (smtplib.SMTPResponseException(421, b"busy"), True),
+    (smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server."), False),
+    (smtplib.SMTPException("No suitable authentication method found."), False),
+    (smtplib.SMTPResponseException(554, b"rejected"), False),
+])
+def test_only_network_errors_and_4xx_replies_are_transient(error, transient):
+    assert outbox.is_transient(error) is transient
+
+
+def test_outbox_does_not_import_streamlit():
+    code = "import sys, outbox; assert 'streamlit' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(outbox.__file__), check=True)
@@ -0,0 +1,34 @@
+import asyncio
+
+from tokens import count_tokens
+from web_scraper import areduce_extractions, group_extractions, parse_with_ai
+
+
+def test_group_extractions_fits_budget():
+    extractions = [f"item {i:02} " * 20 for i in range(12)]
+    budget = 3 * count_tokens(extractions[0])
+    groups = group_extractions(extractions, max_tokens=budget)
+
+    assert [e for group in groups for e in group] == extractions
+    assert all(len(group) >= 2 for group in groups)
+    assert all(sum(count_tokens(e) for e in group) <= budget for group in groups)
+
+
+def test_group_extractions_never_leaves_a_single_item_group():
+    big = "word " * 500
+    groups = group_extractions([big, big, big], max_tokens=10)
+    assert len(groups) == 1 and len(groups[0]) == 3
+
+
+def test_reduce_merges_in_rounds(fake_llm):
+    extractions = [f"extraction {i} " * 30 for i in range(20)]
+    budget = 3 * count_tokens(extractions[0])
+    group = asyncio.run(areduce_extractions(extractions, "anything", max_tokens=budget))
+
+    assert len(group) < len(extractions)
+    assert sum(count_tokens(e) for e in group) <= budget
+
+
+def test_parse_with_ai_merges_many_chunks(fake_llm):
+    chunks = [f"chunk {i} " * 50 for i in range(10)]
+    assert parse_with_ai(chunks, "anything").strip()
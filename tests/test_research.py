@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import clients
+import research
+from fakes import FakeChatModel, StubTavilyClient
+
+AGENT_BUILDERS = [
+    research.get_research_graph, research.get_search_agent, research.get_synthesizer_agent,
+    research.get_citation_agent, research.get_fact_checker_agent, research.get_bias_detection_agent,
+]
+
+
+@pytest.fixture
+def services():
+    '''Agents keep the client they were built with, so they are rebuilt around the fakes.'''
+    for builder in AGENT_BUILDERS:
+        builder.cache_clear()
+    clients.set_override("llm", FakeChatModel(latency=0, response_words=30))
+    clients.set_override("search", StubTavilyClient(latency=0))
+    yield
+    clients.set_override("llm", None)
+    clients.set_override("search", None)
+    for builder in AGENT_BUILDERS:
+        builder.cache_clear()
+
+
+def test_pipeline_report_has_every_section(services):
+    state = research.get_research_graph().invoke({"topic": "grid storage"})
+
+    assert state["search_results"] and state["synthesis"]
+    assert state["report"].startswith(state["synthesis"])
+    for heading, key in [("## Sources", "citations"), ("## Fact Check", "fact_check"), ("## Bias Analysis", "bias")]:
+        assert f"{heading}\n\n{state[key]}" in state["report"]
+
+
+def test_stream_reports_every_stage_and_the_synthesis_tokens(services):
+    events = list(research.stream_research("grid storage", mode="pipeline"))
+    stages = [payload for kind, payload in events if kind == "stage"]
+    tokens = "".join(payload for kind, payload in events if kind == "token")
+
+    assert stages[:2] == ["search", "synthesize"]
+    assert set(stages[2:5]) == {"citation_agent", "fact_checker_agent", "bias_detection_agent"}
+    assert stages[5:] == ["merge"]
+    assert events[-1] == ("result", research.research("grid storage", mode="pipeline"))
+    assert tokens and tokens in events[-1][1]
+
+
+def test_analysis_steps_run_concurrently(monkeypatch):
+    running = []
+    overlap = threading.Event()
+
+    def slow(name):
+        def step(*args):
+            running.append(name)
+            if len(running) == 3:
+                overlap.set()
+            # Each step waits for the other two; run one after another they would time out
+            overlap.wait(timeout=1)
+            return name
+        return step
+
+    monkeypatch.setattr(research, "run_search_agent", lambda topic: "results")
+    monkeypatch.setattr(research, "run_synthesizer_agent", lambda results, topic: "synthesis")
+    monkeypatch.setattr(research, "run_citation_agent", slow("citations"))
+    monkeypatch.setattr(research, "run_fact_checker_agent", slow("fact check"))
+    monkeypatch.setattr(research, "run_bias_detection_agent", slow("bias"))
+    research.get_research_graph.cache_clear()
+
+    start = time.perf_counter()
+    report = research.get_research_graph().invoke({"topic": "grid storage"})["report"]
+    assert time.perf_counter() - start < 0.9
+    assert overlap.is_set()
+    assert report == "synthesis\n\n## Sources\n\ncitations\n\n## Fact Check\n\nfact check\n\n## Bias Analysis\n\nbias"
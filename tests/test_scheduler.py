@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import scheduler
+from scheduler import (
+    BULK, INTERACTIVE, AsyncScheduledTransport, ScheduledTransport, Scheduler, TokenBucket, priority,
+)
+
+CHAT_URL = "https://api.openai.com/v1/chat/completions"
+CHAT_BODY = b'{"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}'
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE", 0.001)
+
+
+class ScriptedTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    '''Plays back a list of outcomes: a status code or (status, headers) to answer with, or an exception to raise.'''
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def _next(self, request):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        return httpx.Response(status, headers=headers, json={}, request=request)
+
+    def handle_request(self, request):
+        return self._next(request)
+
+    async def handle_async_request(self, request):
+        return self._next(request)
+
+
+def chat_request():
+    return httpx.Request("POST", CHAT_URL, content=CHAT_BODY)
+
+
+OUTCOMES = [
+    httpx.ConnectError("connection reset"),
+    httpx.ReadTimeout("timed out"),
+    httpx.RemoteProtocolError("server disconnected"),
+    503,
+    200,
+]
+
+
+def test_retries_transport_errors_and_5xx():
+    inner = ScriptedTransport(OUTCOMES)
+    transport = ScheduledTransport(inner, scheduler=Scheduler(), max_retries=5)
+    assert transport.handle_request(chat_request()).status_code == 200
+    assert inner.calls == 5
+    assert "ai_helper_llm_retries_total 4" in transport.scheduler.render_prometheus()
+
+
+def test_async_retries_transport_errors_and_5xx():
+    inner = ScriptedTransport(OUTCOMES)
+    transport = AsyncScheduledTransport(inner, scheduler=Scheduler(), max_retries=5)
+    assert asyncio.run(transport.handle_async_request(chat_request())).status_code == 200
+    assert inner.calls == 5
+
+
+def test_gives_up_after_max_retries():
+    inner = ScriptedTransport([httpx.ConnectError("down")] * 3)
+    transport = ScheduledTransport(inner, scheduler=Scheduler(), max_retries=2)
+    with pytest.raises(httpx.ConnectError):
+        transport.handle_request(chat_request())
+    assert inner.calls == 3
+
+
+def test_other_errors_are_not_retried():
+    inner = ScriptedTransport([httpx.UnsupportedProtocol("ftp"), 400])
+    transport = ScheduledTransport(inner, scheduler=Scheduler(), max_retries=5)
+    with pytest.raises(httpx.UnsupportedProtocol):
+        transport.handle_request(chat_request())
+    assert transport.handle_request(chat_request()).status_code == 400
+    assert inner.calls == 2
+
+
+def test_429_pauses_the_bucket_for_retry_after():
+    inner = ScriptedTransport([(429, {"retry-after-ms": "200"})])
+    requests_scheduler = Scheduler()
+    transport = ScheduledTransport(inner, scheduler=requests_scheduler)
+    started = time.monotonic()
+    transport.handle_request(chat_request())
+    assert time.monotonic() - started >= 0.2
+    assert "ai_helper_llm_rate_limited_total 1" in requests_scheduler.render_prometheus()
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 1) == 0
+    # Never more than the capacity, however long it was idle
+    bucket.wait_time(1, now + 3600)
+    assert bucket.level == 60
+
+
+def test_server_remaining_count_lowers_the_bucket():
+    bucket = TokenBucket(per_minute=100)
+    bucket.limit(10)
+    assert bucket.level == 10
+    bucket.limit(50)
+    assert bucket.level == 10
+
+
+def test_interactive_requests_go_before_bulk():
+    requests_scheduler = Scheduler(limits={"chat": (120, 1_000_000)})
+    key = ("chat", "gpt-4o-mini")
+    # Use up the request bucket so everyone has to queue; one slot frees up every half second
+    requests_scheduler._rate_limit(key).requests.level = 0
+
+    order = []
+
+    def call(name, level):
+        with priority(level):
+            requests_scheduler.acquire(key, 1)
+        order.append(name)
+
+    bulk = [threading.Thread(target=call, args=(f"bulk {i}", BULK)) for i in range(2)]
+    for thread in bulk:
+        thread.start()
+        time.sleep(0.05)
+    interactive = threading.Thread(target=call, args=("interactive", INTERACTIVE))
+    interactive.start()
+    for thread in bulk + [interactive]:
+        thread.join(10)
+
+    # The interactive request arrived last but is served first; bulk ones keep their order
+    assert order == ["interactive", "bulk 0", "bulk 1"]
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from search_cache import CachedSearchClient
+
+
+class CountingClient:
+    def __init__(self, latency=0.0, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = []
+
+    def search(self, query, max_results=5, **kwargs):
+        self.calls.append((query, max_results))
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("search failed")
+        return {"query": query, "results": [{"url": f"https://example.org/{i}"} for i in range(max_results)]}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "search.sqlite3")
+
+
+def test_repeated_query_is_served_from_cache(path):
+    client = CountingClient()
+    cache = CachedSearchClient(client, path=path)
+    first = cache.search("Solar Storage", max_results=5)
+    assert cache.search("  solar   storage ", max_results=5) == first
+    assert len(client.calls) == 1
+
+
+def test_larger_cached_response_answers_smaller_requests(path):
+    client = CountingClient()
+    cache = CachedSearchClient(client, path=path)
+    cache.search("topic", max_results=5)
+    assert len(cache.search("topic", max_results=2)["results"]) == 2
+    cache.search("topic", max_results=8)
+    assert client.calls == [("topic", 5), ("topic", 8)]
+
+
+def test_cache_survives_a_restart(path):
+    CachedSearchClient(CountingClient(), path=path).search("topic")
+    client = CountingClient()
+    CachedSearchClient(client, path=path).search("topic")
+    assert client.calls == []
+
+
+def test_entries_expire(path):
+    client = CountingClient()
+    cache = CachedSearchClient(client, path=path, ttl=0.01)
+    cache.search("topic")
+    time.sleep(0.05)
+    cache.search("topic")
+    assert len(client.calls) == 2
+
+
+def test_concurrent_identical_requests_share_one_call(path):
+    client = CountingClient(latency=0.2)
+    cache = CachedSearchClient(client, path=path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.search("topic", max_results=3))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(client.calls) == 1
+    assert len(results) == 8 and all(result == results[0] for result in results)
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached(path):
+    client = CountingClient(latency=0.2, fail=True)
+    cache = CachedSearchClient(client, path=path)
+    errors = []
+
+    def search():
+        try:
+            cache.search("topic")
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 4 and len(client.calls) == 1
+
+    client.fail = False
+    assert cache.search("topic")["results"]
+    assert len(client.calls) == 2
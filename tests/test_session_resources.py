@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+from session_resources import SessionResources
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def resources(tmp_path):
+    return SessionResources(memory_limit_mb=10, session_limit_mb=4, idle_seconds=60, ttl_seconds=3600,
+                            spill_dir=str(tmp_path / "spill"), is_connected=lambda session_id: session_id != "closed")
+
+
+def spill_files(resources):
+    if not os.path.isdir(resources.spill_dir):
+        return []
+    return os.listdir(resources.spill_dir)
+
+
+def text(megabytes, fill="x"):
+    return fill * int(megabytes * MB)
+
+
+def test_per_session_cap_spills_least_recently_used_text(resources):
+    resources.put("tab", "first", text(3, "a"))
+    resources.put("tab", "second", text(3, "b"))
+
+    stats = resources.stats()
+    assert stats["evicted_resources"] == 1
+    assert stats["resident_bytes"] < 4 * MB
+    assert len(spill_files(resources)) == 1
+    # Evicted text comes back from disk, and the spill file is gone
+    assert resources.get("tab", "first") == text(3, "a")
+    assert resources.reloads == 1
+    assert len(spill_files(resources)) == 1  # now "second" was spilled to make room
+
+
+def test_total_cap_spans_sessions(resources):
+    for i in range(4):
+        resources.put(f"tab{i}", "page", text(3))
+    assert resources.stats()["resident_bytes"] <= 10 * MB
+    assert resources.get("tab0", "page") == text(3)
+
+
+def test_idle_sessions_are_evicted(resources):
+    resources.put("idle", "page", text(1))
+    resources.put("idle", "chain", object(), size=MB, rebuild=lambda: "rebuilt")
+    resources._last_active["idle"] -= 120
+    resources.touch("active")
+
+    assert resources.stats()["evicted_resources"] == 2
+    assert resources.get("idle", "page") == text(1)
+    assert resources.get("idle", "chain") == "rebuilt"
+
+
+def test_expired_sessions_are_purged_with_their_spill_files(resources):
+    resources.put("closed", "page", text(1))
+    resources._last_active["closed"] -= 120
+    resources.touch("active")
+    assert len(spill_files(resources)) == 1
+
+    resources._last_active["closed"] -= 3600
+    resources.touch("active")
+    assert not resources.has("closed", "page")
+    assert spill_files(resources) == []
+    assert "closed" not in resources._last_active
+    stats = resources.stats()
+    assert stats["purged_sessions"] == 1 and stats["sessions"] == 0
+
+
+def test_idle_open_session_gets_its_page_back_after_the_ttl(resources):
+    resources.put("open", "page", text(1))
+    resources._last_active["open"] -= 7200
+    resources.touch("active")
+
+    assert resources.stats()["purged_sessions"] == 0
+    assert len(spill_files(resources)) == 1
+    assert resources.has("open", "page")
+    assert resources.get("open", "page") == text(1)
+
+
+def test_sessions_are_kept_when_the_runtime_cannot_tell(tmp_path):
+    resources = SessionResources(ttl_seconds=1, spill_dir=str(tmp_path), is_connected=lambda session_id: None)
+    resources.put("tab", "page", "text")
+    resources._last_active["tab"] -= 60
+    resources.touch("other")
+    assert resources.get("tab", "page") == "text"
+
+
+def test_active_session_is_never_purged(resources):
+    resources.put("tab", "page", "text")
+    resources._last_active["tab"] -= 7200
+    assert resources.get("tab", "page") == "text"
+
+
+def test_only_text_can_be_spilled(resources):
+    with pytest.raises(TypeError):
+        resources.put("tab", "chain", object())
+
+
+def test_discard_removes_spill_file(resources):
+    resources.put("tab", "page", text(1))
+    resources._last_active["tab"] = time.monotonic() - 120
+    resources.touch("other")
+    resources.discard("tab", "page")
+    assert spill_files(resources) == []
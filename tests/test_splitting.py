@@ -0,0 +1,31 @@
+from tokens import count_tokens
+from web_scraper import clean_html, split_dom_content
+
+
+def page(rows):
+    nav = "<nav><a>Home</a><a>Products</a><a>About</a><a>Contact</a></nav>"
+    items = "".join(f"<div><h2>Product {i}</h2><p>Price {i}.99 USD, ships in {i % 5 + 1} days</p></div>" for i in range(rows))
+    return f"<html><body>{nav}<main>{items}</main>{nav}</body></html>"
+
+
+def test_clean_html_output_is_split_into_several_chunks():
+    text = clean_html(page(400))
+    chunks = split_dom_content(text, max_tokens=500)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 500 for chunk in chunks)
+    # Lines are never cut in the middle
+    lines = set(text.splitlines())
+    assert all(line in lines for chunk in chunks for line in chunk.splitlines())
+
+
+def test_repeated_navigation_is_dropped():
+    text = clean_html(page(3))
+    chunks = split_dom_content(text)
+    assert "\n".join(chunks).count("Contact") == 1
+
+
+def test_overlong_line_is_cut_by_tokens():
+    chunks = split_dom_content("word " * 3000, max_tokens=1000, dedupe=False)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 1000 for chunk in chunks)
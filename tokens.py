@@ -0,0 +1,42 @@
+from functools import lru_cache
+
+import tiktoken
+
+DEFAULT_MODEL = "gpt-4o-mini"
+CHARS_PER_TOKEN = 4
+
+class ApproximateEncoding:
+    '''Stand-in used when the tiktoken vocabulary cannot be loaded (e.g. offline): ~4 characters per token.'''
+
+    name = "approximate"
+
+    def encode_ordinary(self, text):
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+@lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_MODEL):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Falling back to approximate token counts: {e}")
+        return ApproximateEncoding()
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    return len(get_encoding(model).encode_ordinary(text))
+
+def count_tokens_batch(texts, model=DEFAULT_MODEL):
+    return [len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(list(texts))]
+
+def split_by_tokens(text, max_tokens, model=DEFAULT_MODEL):
+    encoding = get_encoding(model)
+    tokens = encoding.encode_ordinary(text)
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
@@ -0,0 +1,211 @@
+'''
+Lightweight tracing: spans with durations, token counts and costs for LLM calls, embedding batches,
+vector searches, web searches, page fetches and HTML parsing.
+
+Spans opened inside `with trace(...)` belong to that trace (one Streamlit run, one background job)
+and can be shown in the sidebar. Every span also feeds process-wide totals that are exported in the
+Prometheus text format, and is appended to TRACE_JSONL_PATH when that is set.
+'''
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+
+# USD per million tokens: (input, output)
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+def estimate_cost(model, prompt_tokens=0, completion_tokens=0):
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            input_price, output_price = PRICES[name]
+            return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    return 0.0
+
+class Span:
+    def __init__(self, name, attributes):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.trace = _current_trace.get()
+        parent = _current_span.get()
+        self.parent_id = parent.id if parent is not None else None
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        model = self.attributes.get("model")
+        if "cost" not in self.attributes and ("prompt_tokens" in self.attributes or "completion_tokens" in self.attributes):
+            self.attributes["cost"] = estimate_cost(
+                model, self.attributes.get("prompt_tokens", 0), self.attributes.get("completion_tokens", 0)
+            )
+        if self.trace is not None:
+            self.trace.add(self)
+        _record(self)
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace.id if self.trace is not None else None,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            **self.attributes,
+        }
+
+class Trace:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.start = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self):
+        '''{span name: {"count", "seconds", "prompt_tokens", "completion_tokens", "cost", "errors"}}'''
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            _accumulate(totals, span)
+        return totals
+
+    def to_jsonl(self):
+        with self._lock:
+            return "".join(json.dumps(span.as_dict(), default=str) + "\n" for span in self.spans)
+
+def start_span(name, **attributes):
+    '''A span that is finished explicitly; for work that starts and ends in different callbacks.'''
+    return Span(name, attributes)
+
+@contextmanager
+def span(name, **attributes):
+    current = Span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+@contextmanager
+def trace(name):
+    current = Trace(name)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(None)
+    try:
+        yield current
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+# METRICS & EXPORT
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+def _accumulate(totals, span):
+    entry = totals.setdefault(span.name, {
+        "count": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "errors": 0,
+    })
+    entry["count"] += 1
+    entry["seconds"] += span.duration
+    entry["prompt_tokens"] += span.attributes.get("prompt_tokens", 0) or 0
+    entry["completion_tokens"] += span.attributes.get("completion_tokens", 0) or 0
+    entry["cost"] += span.attributes.get("cost", 0.0) or 0.0
+    entry["errors"] += span.error is not None
+
+def _record(span):
+    with _metrics_lock:
+        _accumulate(_metrics, span)
+    if TRACE_JSONL_PATH:
+        line = json.dumps(span.as_dict(), default=str) + "\n"
+        with _export_lock:
+            directory = os.path.dirname(TRACE_JSONL_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(TRACE_JSONL_PATH, "a", encoding="utf-8") as file:
+                file.write(line)
+
+def render_prometheus():
+    '''Process-wide span totals in the Prometheus text exposition format.'''
+    with _metrics_lock:
+        metrics = {name: dict(entry) for name, entry in _metrics.items()}
+    lines = [
+        "# HELP ai_helper_span_seconds Time spent in traced operations.",
+        "# TYPE ai_helper_span_seconds summary",
+    ]
+    for name, entry in sorted(metrics.items()):
+        lines.append(f'ai_helper_span_seconds_sum{{span="{name}"}} {entry["seconds"]:.6f}')
+        lines.append(f'ai_helper_span_seconds_count{{span="{name}"}} {entry["count"]}')
+    lines += ["# HELP ai_helper_span_errors_total Traced operations that raised.", "# TYPE ai_helper_span_errors_total counter"]
+    for name, entry in sorted(metrics.items()):
+        lines.append(f'ai_helper_span_errors_total{{span="{name}"}} {entry["errors"]}')
+    lines += ["# HELP ai_helper_tokens_total Tokens sent to and received from models.", "# TYPE ai_helper_tokens_total counter"]
+    for name, entry in sorted(metrics.items()):
+        if entry["prompt_tokens"] or entry["completion_tokens"]:
+            lines.append(f'ai_helper_tokens_total{{span="{name}",kind="prompt"}} {entry["prompt_tokens"]}')
+            lines.append(f'ai_helper_tokens_total{{span="{name}",kind="completion"}} {entry["completion_tokens"]}')
+    lines += ["# HELP ai_helper_cost_usd_total Estimated model cost in US dollars.", "# TYPE ai_helper_cost_usd_total counter"]
+    for name, entry in sorted(metrics.items()):
+        if entry["cost"]:
+            lines.append(f'ai_helper_cost_usd_total{{span="{name}"}} {entry["cost"]:.8f}')
+    return "\n".join(lines) + "\n"
+
+# UI
+
+def trace_panel(run):
+    '''Sidebar summary of a trace: time, tokens and cost per kind of operation, plus a JSONL download.'''
+    import streamlit as st
+
+    totals = run.totals()
+    if not totals:
+        return
+    with st.sidebar:
+        st.subheader("Last run")
+        tokens = sum(entry["prompt_tokens"] + entry["completion_tokens"] for entry in totals.values())
+        cost = sum(entry["cost"] for entry in totals.values())
+        st.caption(f"{run.name} · {tokens} tokens · ${cost:.4f}")
+        rows = ["| Operation | Calls | Seconds | Tokens | Cost |", "|---|---:|---:|---:|---:|"]
+        for name, entry in sorted(totals.items(), key=lambda item: -item[1]["seconds"]):
+            rows.append(
+                f"| {name} | {entry['count']} | {entry['seconds']:.2f} | "
+                f"{entry['prompt_tokens'] + entry['completion_tokens']} | ${entry['cost']:.4f} |"
+            )
+        st.markdown("\n".join(rows))
+        st.download_button("Download trace (JSONL)", run.to_jsonl(), file_name=f"trace-{run.id}.jsonl", mime="application/jsonl")
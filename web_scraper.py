@@ -1,11 +1,16 @@
 # PARSING
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+import asyncio
+import os
 from dotenv import load_dotenv
+from clients import get_llm
+from tokens import count_tokens
 
 load_dotenv()
 
+# The extractions given to one merge call; more than that are merged in rounds
+MERGE_INPUT_TOKENS = int(os.getenv("MERGE_INPUT_TOKENS", "16000"))
+
 template = (
     "You are tasked with extracting specific information from the following text content: {dom_content}. "
     "Please follow these instructions carefully: \n\n"
@@ -16,46 +21,321 @@ template = (
 )
 
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+merge_template = (
+    "You are given several partial extractions taken from different parts of the same web page: {extractions}. "
+    "Please follow these instructions carefully: \n\n"
+    "1. **Merge:** Combine them into a single result that matches the description: {parse_description}. "
+    "2. **Deduplicate:** Keep every distinct item once and drop exact or obvious duplicates. "
+    "3. **No Extra Content:** Do not include any additional text, comments, or explanations in your response. "
+    "4. **Direct Data Only:** Your output should contain only the data that is explicitly requested, with no other text."
+)
 
-def parse_with_ai(dom_chunks, parse_description):
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm
+def _is_empty_result(text):
+    return text.strip().strip("'\"`").strip() == ""
 
-    parsed_results = []
+async def aextract_chunks(dom_chunks, parse_description, max_concurrency=4):
+    '''Map step: extracts from every chunk concurrently and returns the non-empty extractions in page order.'''
+    from langchain_core.prompts import ChatPromptTemplate
 
-    for i, chunk in enumerate(dom_chunks, start=1):
-        response = chain.invoke(
-            {"dom_content": chunk, "parse_description": parse_description}
-        )
+    chain = ChatPromptTemplate.from_template(template) | get_llm()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def parse_chunk(i, chunk):
+        async with semaphore:
+            response = await chain.ainvoke(
+                {"dom_content": chunk, "parse_description": parse_description}
+            )
         print(f"Parsed batch: {i} of {len(dom_chunks)}")
-        parsed_results.append(response)
-        result = parsed_results[0].content
+        return response.content
+
+    parsed_results = await asyncio.gather(
+        *(parse_chunk(i, chunk) for i, chunk in enumerate(dom_chunks, start=1))
+    )
+    return [result.strip() for result in parsed_results if not _is_empty_result(result)]
+
+def _merge_inputs(extractions, parse_description):
+    return {"extractions": "\n\n---\n\n".join(extractions), "parse_description": parse_description}
+
+def group_extractions(extractions, max_tokens=MERGE_INPUT_TOKENS):
+    '''Consecutive runs of extractions that fit max_tokens together; every run has at least two, so each round shrinks the list.'''
+    groups, current, current_tokens = [], [], 0
+    for extraction, n in zip(extractions, [count_tokens(e) for e in extractions]):
+        if len(current) >= 2 and current_tokens + n > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(extraction)
+        current_tokens += n
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
+
+async def areduce_extractions(extractions, parse_description, max_concurrency=4, max_tokens=MERGE_INPUT_TOKENS):
+    '''
+    Merges groups of extractions that fit max_tokens, in rounds, until one group is left, and returns it.
+    The final merge is left to the caller so it can be streamed.
+    '''
+    from langchain_core.prompts import ChatPromptTemplate
+
+    merge_chain = ChatPromptTemplate.from_template(merge_template) | get_llm()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def merge(group):
+        async with semaphore:
+            response = await merge_chain.ainvoke(_merge_inputs(group, parse_description))
+        return response.content.strip()
+
+    groups = group_extractions(extractions, max_tokens)
+    while len(groups) > 1:
+        merged = await asyncio.gather(*(merge(group) for group in groups))
+        print(f"Merged {len(extractions)} extractions into {len(merged)}")
+        extractions = [result for result in merged if not _is_empty_result(result)] or [""]
+        groups = group_extractions(extractions, max_tokens)
+    return groups[0]
+
+async def aparse_with_ai(dom_chunks, parse_description, max_concurrency=4):
+    extractions = await aextract_chunks(dom_chunks, parse_description, max_concurrency)
+
+    if not extractions:
+        return ""
+    if len(extractions) == 1:
+        return extractions[0]
+
+    # Reduce: merge calls combine the per-chunk extractions, in rounds when they do not fit one prompt
+    from langchain_core.prompts import ChatPromptTemplate
+
+    group = await areduce_extractions(extractions, parse_description, max_concurrency)
+    if len(group) == 1:
+        return group[0]
+    merge_chain = ChatPromptTemplate.from_template(merge_template) | get_llm()
+    response = await merge_chain.ainvoke(_merge_inputs(group, parse_description))
+    return response.content
+
+def parse_with_ai(dom_chunks, parse_description, max_concurrency=4):
+    return asyncio.run(aparse_with_ai(dom_chunks, parse_description, max_concurrency))
 
-    return result
+def stream_parse_with_ai(dom_chunks, parse_description, max_concurrency=4):
+    '''Same result as parse_with_ai, but yields the reduce step's tokens as they arrive.'''
+    extractions = asyncio.run(aextract_chunks(dom_chunks, parse_description, max_concurrency))
+
+    if not extractions:
+        return
+    if len(extractions) == 1:
+        yield extractions[0]
+        return
+
+    from langchain_core.prompts import ChatPromptTemplate
+
+    group = asyncio.run(areduce_extractions(extractions, parse_description, max_concurrency))
+    if len(group) == 1:
+        yield group[0]
+        return
+    merge_chain = ChatPromptTemplate.from_template(merge_template) | get_llm()
+    for chunk in merge_chain.stream(_merge_inputs(group, parse_description)):
+        yield chunk.content
 
 # SCRAPING
 
-import selenium.webdriver as webdriver
-from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+import atexit
+import queue
+import re
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from html.parser import HTMLParser
+from tokens import count_tokens_batch, split_by_tokens
+from tracing import span
 
-def scrape_website(website):
-    print("Lauinching chrome browser...")
+CHROME_DRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "./chromedriver.exe")
+DRIVER_POOL_SIZE = int(os.getenv("WEBDRIVER_POOL_SIZE", "2"))
+DRIVER_MAX_PAGES = int(os.getenv("WEBDRIVER_MAX_PAGES", "50"))
+HTTP_TIMEOUT = 15
+
+def create_driver():
+    # Selenium is only imported once a page actually needs a browser
+    import selenium.webdriver as webdriver
+    from selenium.webdriver.chrome.service import Service
 
-    chrome_driver_path = "./chromedriver.exe"
     options = webdriver.ChromeOptions()
-    driver = webdriver.Chrome(service=Service(chrome_driver_path), options=options)
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    if os.path.exists(CHROME_DRIVER_PATH):
+        service = Service(CHROME_DRIVER_PATH)
+    else:
+        # Let Selenium Manager resolve a matching driver
+        service = Service()
+    return webdriver.Chrome(service=service, options=options)
+
+class DriverPool:
+    '''Keeps warm headless Chrome drivers and recycles each one after max_pages page loads.'''
+
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES, driver_factory=create_driver):
+        self.size = size
+        self.max_pages = max_pages
+        self.driver_factory = driver_factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No WebDriver became available in time")
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    print("Launching chrome browser...")
+                    driver = self.driver_factory()
+                    with self._lock:
+                        self._pages[id(driver)] = 0
+                    return driver
+                if self._is_healthy(driver):
+                    return driver
+                self._discard(driver)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, driver, broken=False):
+        try:
+            with self._lock:
+                pages = self._pages.get(id(driver), 0) + 1
+                self._pages[id(driver)] = pages
+            if broken or self._closed or pages >= self.max_pages:
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def fetch(self, url, timeout=None):
+        driver = self.acquire(timeout=timeout)
+        broken = False
+        try:
+            with span("webdriver_fetch", url=url) as fetch_span:
+                driver.get(url)
+                print("Page loaded...")
+                html = driver.page_source
+                fetch_span.set(bytes=len(html))
+            return html
+        except Exception:
+            broken = not self._is_healthy(driver)
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+def get_driver_pool():
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool()
+            atexit.register(_driver_pool.close)
+        return _driver_pool
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = (
+                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                "Chrome/128.0 Safari/537.36"
+            )
+            _http_session = session
+        return _http_session
+
+JS_REQUIRED_MARKERS = re.compile(
+    r"enable javascript|javascript is (?:disabled|required)|requires javascript"
+    r"|<div[^>]+id=[\"'](?:root|app|__next|__nuxt)[\"'][^>]*>\s*</div>",
+    re.IGNORECASE,
+)
 
-    try:
-        driver.get(website)
-        print("Page loaded...")
-        html = driver.page_source
-        return html
-    finally:
-        driver.quit()
+def needs_javascript(html, min_text_length=200):
+    '''Guesses whether a statically fetched page only renders its content with JavaScript.'''
+    if JS_REQUIRED_MARKERS.search(html):
+        return True
+    body = re.search(r"<body[^>]*>(.*)</body>", html, re.IGNORECASE | re.DOTALL)
+    if body is None:
+        return True
+    text = re.sub(r"<script.*?</script>|<style.*?</style>|<[^>]+>", " ", body.group(1), flags=re.IGNORECASE | re.DOTALL)
+    return len(" ".join(text.split())) < min_text_length
+
+def fetch_static(url):
+    '''Fetches a page over the pooled HTTP session. Returns None when the response is not usable HTML.'''
+    with span("http_fetch", url=url) as fetch_span:
+        response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+        fetch_span.set(status=response.status_code, bytes=len(response.content))
+    content_type = response.headers.get("Content-Type", "")
+    if response.status_code != 200 or "html" not in content_type.lower():
+        return None
+    return response.text
+
+def scrape_website(website, mode="auto"):
+    '''
+    Returns the page HTML.
+    mode="http" only uses the pooled HTTP session, mode="browser" only uses the WebDriver pool
+    and mode="auto" tries HTTP first and falls back to the browser when the page needs JavaScript.
+    '''
+    if mode in ("auto", "http"):
+        try:
+            html = fetch_static(website)
+        except requests.RequestException as e:
+            if mode == "http":
+                raise
+            print(f"Static fetch failed: {e}")
+            html = None
+        if mode == "http":
+            if html is None:
+                raise ValueError(f"{website} did not return an HTML page")
+            return html
+        if html is not None and not needs_javascript(html):
+            print("Page loaded over HTTP...")
+            return html
+
+    return get_driver_pool().fetch(website)
 
 def extract_body_content(html_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
     body_content = soup.body
     if body_content:
@@ -63,6 +343,8 @@ def extract_body_content(html_content):
     return ""
 
 def clean_body_content(body_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(body_content, "html.parser")
 
     for script_or_style in soup(["script", "style"]):
@@ -72,38 +354,226 @@ def clean_body_content(body_content):
     cleaned_content = "\n".join(line.strip() for line in cleaned_content.splitlines() if line.strip())
     return cleaned_content
 
-def split_dom_content(dom_content, max_lenght=6000):
-    return[dom_content[i:i+max_lenght] for i in range (0, len(dom_content), max_lenght)]
+SKIPPED_TAGS = {"script", "style", "noscript", "svg"}
+
+class _BodyTextParser(HTMLParser):
+    '''Collects the stripped text lines of <body> in one pass, without building a tree.'''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._in_body = False
+        self._body_seen = False
+        self._skip_depth = 0
+        self._pending = []
+
+    def _flush(self):
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending = []
+            self.lines.extend(line.strip() for line in text.splitlines() if line.strip())
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag == "body":
+            # Like soup.body, only the first <body> counts
+            self._in_body = not self._body_seen
+            self._body_seen = True
+        elif tag in SKIPPED_TAGS and self._in_body:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag == "body":
+            self._in_body = False
+        elif tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag != "body":
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if self._in_body and not self._skip_depth:
+            self._pending.append(data)
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+            self._flush()
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+
+def iter_clean_lines(html_content):
+    '''
+    Yields the non-empty, stripped text lines of the page body, skipping script, style, noscript and svg.
+    Accepts the whole page as a string or an iterable of string chunks (e.g. a streamed response).
+    '''
+    chunks = [html_content] if isinstance(html_content, str) else html_content
+    parser = _BodyTextParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.lines
+        parser.lines.clear()
+    parser.close()
+    yield from parser.lines
+
+def clean_html(html_content):
+    '''Single-pass replacement for clean_body_content(extract_body_content(html)).'''
+    with span("html_parse", bytes=len(html_content)):
+        return "\n".join(iter_clean_lines(html_content))
+
+def _repeated_block_mask(lines, block_lines):
+    keep = [True] * len(lines)
+    seen = set()
+    for i in range(len(lines) - block_lines + 1):
+        window = "\n".join(lines[i:i + block_lines])
+        if window in seen:
+            for j in range(i, i + block_lines):
+                keep[j] = False
+        else:
+            seen.add(window)
+    return keep
+
+def remove_repeated_blocks(lines, block_lines=3):
+    '''
+    Drops runs of block_lines or more consecutive lines that already appeared earlier on the page,
+    e.g. navigation menus and footers repeated in the header, sidebar and footer. Single repeated
+    lines (prices, "In stock") are kept because they usually belong to different records.
+    '''
+    keep = _repeated_block_mask(lines, block_lines)
+    return [line for line, kept in zip(lines, keep) if kept]
+
+def split_dom_content(dom_content, max_tokens=4000, dedupe=True, block_lines=3):
+    '''
+    Packs the page text into chunks of at most max_tokens tokens, cutting only between lines (clean_html
+    puts every text node on its own line); a single line over budget is cut by tokens.
+    With dedupe, repeated boilerplate is removed first (see remove_repeated_blocks).
+    '''
+    lines = [line for line in dom_content.splitlines() if line.strip()]
+    if dedupe:
+        lines = remove_repeated_blocks(lines, block_lines)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        current_tokens = 0
+
+    for line, n in zip(lines, count_tokens_batch(lines)):
+        n += 1
+        if n > max_tokens:
+            flush()
+            chunks.extend(split_by_tokens(line, max_tokens))
+            continue
+        if current_tokens + n > max_tokens:
+            flush()
+        current.append(line)
+        current_tokens += n
+
+    flush()
+    return chunks
 
 # UI + FUNCTIONALITY
 
 import streamlit as st
+from session_resources import current_session_id, get_session_resources
 
 def scraper(col2):
     with col2:
         st.title("AI Web Scraper")
         url = st.text_input("Enter Website URL")
+        fetch_mode = st.selectbox(
+            "Fetch mode",
+            ["auto", "http", "browser"],
+            help="auto fetches static pages over HTTP and only starts Chrome for pages that need JavaScript",
+        )
 
         if st.button("Scrape Website"):
             if url:
                 st.write("Scraping the website...")
 
-                dom_content = scrape_website(url)
-                body_content = extract_body_content(dom_content)
-                cleaned_content = clean_body_content(body_content)
+                dom_content = scrape_website(url, mode=fetch_mode)
+                cleaned_content = clean_html(dom_content)
 
-                st.session_state.dom_content = cleaned_content
+                # Large pages are spilled to disk if the session goes idle or over its memory cap
+                get_session_resources().put(current_session_id(), "dom_content", cleaned_content)
 
                 with st.expander("View DOM Content"):
                     st.text_area("DOM Content", cleaned_content, height=300)
 
-        if "dom_content" in st.session_state:
+        if get_session_resources().has(current_session_id(), "dom_content"):
             parse_description = st.text_area("Describe what you want to parse")
 
             if st.button("Parse Content"):
                 if parse_description:
                     st.write("Parsing the content...")
 
-                    dom_chunks = split_dom_content(st.session_state.dom_content)
-                    parsed_result = parse_with_ai(dom_chunks, parse_description)
-                    st.write(parsed_result)
\ No newline at end of file
+                    dom_chunks = split_dom_content(get_session_resources().get(current_session_id(), "dom_content"))
+                    st.write_stream(stream_parse_with_ai(dom_chunks, parse_description))
+
+        with st.expander("Batch / crawl mode"):
+            batch_scraper()
+
+def batch_scraper():
+    '''Applies one parse description to many pages as a background job that writes a JSONL file.'''
+    from crawler import CRAWL_MAX_PAGES, CRAWL_OUTPUT_DIR, crawl_job, load_results
+    from jobs import JobLimitReached, current_user, get_job_manager, jobs_panel
+    import uuid
+
+    source = st.radio("Pages to process", ["URL list", "Sitemap", "Crawl from a page"], horizontal=True)
+    options = {}
+    if source == "URL list":
+        options["urls"] = [line.strip() for line in st.text_area("One URL per line").splitlines() if line.strip()]
+        label = f"{len(options['urls'])} URLs"
+    elif source == "Sitemap":
+        options["sitemap"] = st.text_input("Sitemap URL")
+        label = options["sitemap"]
+    else:
+        options["seed"] = st.text_input("Start page")
+        options["depth"] = st.number_input("Link depth", min_value=0, max_value=5, value=1)
+        label = f"{options['seed']} (depth {options['depth']})"
+    options["parse_description"] = st.text_area("Describe what you want to parse from every page", key="batch_parse_description")
+    options["mode"] = st.selectbox("Fetch mode", ["auto", "http", "browser"], key="batch_fetch_mode")
+    options["max_pages"] = st.number_input("Max pages", min_value=1, value=CRAWL_MAX_PAGES)
+
+    if st.button("Start batch") and (options.get("urls") or options.get("sitemap") or options.get("seed")):
+        output_path = os.path.join(CRAWL_OUTPUT_DIR, f"{uuid.uuid4().hex}.jsonl")
+        try:
+            get_job_manager().submit(current_user(), "crawl", crawl_job, label=label, output_path=output_path, **options)
+            st.toast("Batch queued")
+        except JobLimitReached as e:
+            st.error(str(e))
+
+    def open_job(job):
+        st.session_state.crawl_output = job["params"]["output_path"]
+
+    jobs_panel("crawl", open_job)
+
+    output_path = st.session_state.get("crawl_output")
+    if output_path and os.path.exists(output_path):
+        records = load_results(output_path)
+        st.dataframe(
+            [{"url": r["url"], "status": r["status"], "result": r.get("parsed") or r.get("error") or ""} for r in records],
+            use_container_width=True,
+        )
+        with open(output_path, "rb") as file:
+            st.download_button("Download JSONL", file, file_name="crawl.jsonl", mime="application/jsonl")
\ No newline at end of file